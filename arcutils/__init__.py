@@ -1,10 +1,61 @@
 # -*- coding: utf-8 -*-
 
+import sys
+import types
+import importlib
+
 __author__ = 'Paul M. Hobson'
 __email__ = 'phobson@geosyntec.com'
 __version__ = '0.1.0'
 
 
-from arcutils import crapy
-from arcutils import mapping
-from arcutils.tests import test
+# submodules are imported on first access (e.g., ``arcutils.mapping``)
+# so that ``import arcutils`` stays cheap
+_SUBMODULES = (
+    'catalog',
+    'crapy',
+    'dbf',
+    'mapping',
+    'overviews',
+    'profiling',
+    'raster',
+    'rasterstats',
+    'shapefile',
+    'spatialindex',
+    'table',
+    'tetris',
+    'tiff',
+    'validate',
+)
+
+
+def test(*args):
+    from arcutils.tests import test as _test
+    return _test(*args)
+
+
+class _LazyPackage(types.ModuleType):
+    """ The ``arcutils`` module, importing its submodules the first time
+    they are looked up. (A module-level ``__getattr__`` would need
+    Python 3.7.)
+    """
+
+    def __getattr__(self, name):
+        if name in _SUBMODULES:
+            return importlib.import_module('arcutils.' + name)
+        raise AttributeError("module 'arcutils' has no attribute '{}'".format(name))
+
+    def __dir__(self):
+        return sorted(list(self.__dict__.keys()) + list(_SUBMODULES))
+
+
+try:
+    sys.modules[__name__].__class__ = _LazyPackage
+except TypeError:
+    # modules can't change class before Python 3.5, so replace this one
+    # with a copy. The original is kept alive, since its functions
+    # still use its globals.
+    _package = _LazyPackage(__name__, __doc__)
+    _package.__dict__.update(globals())
+    _package._original = sys.modules[__name__]
+    sys.modules[__name__] = _package
@@ -0,0 +1,35 @@
+"""
+The few standard library functions that arcutils uses but that ArcMap's
+Python 2.7 doesn't have.
+"""
+
+import os
+import sys
+import time
+
+try:
+    from time import perf_counter
+except ImportError:  # Python 2
+    perf_counter = time.clock if sys.platform == 'win32' else time.time
+
+try:
+    from time import thread_time
+except ImportError:  # Python < 3.7
+    # the CPU time of the whole process, which is the best there is
+    thread_time = getattr(time, 'process_time', None) or time.clock
+
+try:
+    from threading import get_ident
+except ImportError:  # Python 2
+    from thread import get_ident  # noqa: F401
+
+try:
+    from os import replace
+except ImportError:  # Python 2
+    def replace(src, dst):
+        """ ``os.rename`` that overwrites ``dst``, like `os.replace`.
+        Not atomic on Windows, where the target is removed first.
+        """
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
@@ -0,0 +1,269 @@
+"""
+Persistent catalog of dataset schemas (field names, types, and widths),
+stored in a local SQLite file.
+"""
+
+import os
+import json
+import sqlite3
+import multiprocessing
+from collections import namedtuple
+
+from arcutils import dbf
+
+
+FieldInfo = namedtuple('FieldInfo', ('name', 'type', 'width'))
+
+DATASET_EXTENSIONS = ('.shp', '.dbf')
+
+# the arcpy field types of the dBASE field types
+DBASE_TYPES = {
+    'C': u'String',
+    'D': u'Date',
+    'L': u'SmallInteger',
+}
+
+# bumped whenever the stored fields change meaning, so that older
+# catalogs are re-read instead of trusted
+_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    fields TEXT NOT NULL
+)
+"""
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _stat(path):
+    """ The (mtime, size) of the file that holds the schema. """
+    info = os.stat(dbf._dbf_path(path))
+    return info.st_mtime, info.st_size
+
+
+def is_dataset(path):
+    """ True if `path` is a shapefile or a standalone dBASE table whose
+    schema can be read without arcpy.
+    """
+    try:
+        base, ext = os.path.splitext(path)
+    except (TypeError, AttributeError):
+        return False
+
+    return ext.lower() in DATASET_EXTENSIONS and os.path.exists(dbf._dbf_path(path))
+
+
+def iter_datasets(root):
+    """ Yields the paths of every shapefile and standalone dBASE table
+    under `root`. The .dbf files of shapefiles are not yielded on their
+    own.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        bases = set(os.path.splitext(n)[0] for n in filenames
+                    if os.path.splitext(n)[1].lower() == '.shp')
+        for name in sorted(filenames):
+            base, ext = os.path.splitext(name)
+            if ext.lower() == '.shp' or (ext.lower() == '.dbf' and base not in bases):
+                yield os.path.join(dirpath, name)
+
+
+def field_type(field):
+    """ The arcpy type (as `arcpy.ListFields` reports it) of a field of
+    a dBASE table. Whole numbers that fit in 32 bits are 'Integer',
+    other numbers 'Double'.
+    """
+    if field.type in ('N', 'F'):
+        return u'Integer' if field.decimals == 0 and field.length < 10 else u'Double'
+    return DBASE_TYPES.get(field.type, u'String')
+
+
+def read_schema(path):
+    """ Reads the fields of a shapefile or dBASE table from its header.
+
+    The implicit fields that `arcpy.ListFields` reports (FID and Shape
+    for shapefiles, OID for tables) are included, and the types are
+    arcpy's (see `field_type`).
+
+    Parameters
+    ----------
+    path : str
+        Path to the .shp or .dbf file.
+
+    Returns
+    -------
+    fields : list of FieldInfo
+
+    """
+
+    header = dbf.read_header(path)
+    if os.path.splitext(path)[1].lower() == '.shp':
+        fields = [FieldInfo(u'FID', u'OID', 4), FieldInfo(u'Shape', u'Geometry', 0)]
+    else:
+        fields = [FieldInfo(u'OID', u'OID', 4)]
+
+    fields.extend(FieldInfo(f.name, field_type(f), f.length) for f in header.fields)
+    return fields
+
+
+def _catalog_entry(path):
+    """ Worker function for `SchemaCatalog.refresh`. """
+    try:
+        mtime, size = _stat(path)
+        fields = read_schema(path)
+    except (IOError, OSError, ValueError):
+        return path, None, None, None
+    return path, mtime, size, fields
+
+
+class SchemaCatalog(object):
+    """ Persistent catalog of the schemas of many datasets.
+
+    Entries are keyed by path and are only trusted while the
+    modification time and size of the dataset's .dbf are unchanged.
+
+    Parameters
+    ----------
+    dbpath : str
+        Path to the SQLite file. It is created if it does not exist.
+        Use ``':memory:'`` for a throwaway catalog.
+
+    Examples
+    --------
+    >>> from arcutils import catalog, crapy
+    >>> cat = catalog.SchemaCatalog('C:/gis/schemas.sqlite')
+    >>> cat.refresh('C:/gis/data', workers=8)
+    >>> crapy.get_field_names('C:/gis/data/wetlands.shp', catalog=cat)
+
+    """
+
+    def __init__(self, dbpath):
+        self.dbpath = dbpath
+        self._conn = sqlite3.connect(dbpath)
+        self._conn.execute(_SCHEMA)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != _VERSION:
+            self._conn.execute("DELETE FROM datasets")
+            self._conn.execute("PRAGMA user_version = {}".format(_VERSION))
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM datasets").fetchone()[0]
+
+    def lookup(self, path):
+        """ Returns the catalogued fields of a dataset, or None if the
+        dataset is not in the catalog or has changed since.
+
+        Parameters
+        ----------
+        path : str
+            Path to the dataset.
+
+        Returns
+        -------
+        fields : list of FieldInfo or None
+
+        """
+
+        row = self._conn.execute(
+            "SELECT mtime, size, fields FROM datasets WHERE path = ?", (_key(path),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        try:
+            current = _stat(path)
+        except (IOError, OSError):
+            return None
+
+        if (row[0], row[1]) != current:
+            return None
+        return [FieldInfo(*f) for f in json.loads(row[2])]
+
+    def store(self, path, fields, stat=None):
+        """ Adds or replaces the catalog entry of a dataset. """
+        self._store_many([(path,) + tuple(stat or _stat(path)) + (fields,)])
+
+    def _store_many(self, entries):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO datasets (path, mtime, size, fields) VALUES (?, ?, ?, ?)",
+            [(_key(p), m, s, json.dumps([list(f) for f in fields])) for p, m, s, fields in entries]
+        )
+        self._conn.commit()
+
+    def update(self, path):
+        """ Returns the fields of a dataset, re-reading them from disk
+        (and updating the catalog) only if the entry is stale.
+        """
+        fields = self.lookup(path)
+        if fields is None:
+            stat = _stat(path)
+            fields = read_schema(path)
+            self.store(path, fields, stat=stat)
+        return fields
+
+    def refresh(self, root, workers=None, chunksize=64):
+        """ Brings the catalog up to date with a directory tree.
+
+        Only datasets that are new or whose .dbf changed are read, and
+        they are read in parallel across worker processes. Entries
+        under `root` whose datasets no longer exist are removed.
+
+        Parameters
+        ----------
+        root : str
+            The top of the directory tree to scan.
+        workers : int, optional
+            Number of worker processes. Defaults to the number of CPUs.
+            Use 1 to read everything in this process.
+        chunksize : int (default = 64)
+            Number of datasets handed to a worker at a time.
+
+        Returns
+        -------
+        updated : int
+            The number of datasets whose schemas were (re-)read.
+
+        """
+
+        found = set()
+        stale = []
+        for path in iter_datasets(root):
+            found.add(_key(path))
+            if self.lookup(path) is None:
+                stale.append(path)
+
+        if workers == 1 or len(stale) <= 1:
+            entries = [_catalog_entry(p) for p in stale]
+        else:
+            pool = multiprocessing.Pool(workers)
+            try:
+                entries = list(pool.imap_unordered(_catalog_entry, stale, chunksize=chunksize))
+            finally:
+                pool.close()
+                pool.join()
+
+        self._store_many([e for e in entries if e[3] is not None])
+
+        prefix = os.path.join(_key(root), '')
+        known = self._conn.execute(
+            "SELECT path FROM datasets WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchall()
+        gone = [(p,) for (p,) in known if p not in found]
+        self._conn.executemany("DELETE FROM datasets WHERE path = ?", gone)
+        self._conn.commit()
+
+        return len(stale)
@@ -1,13 +1,214 @@
 # -*- coding: utf-8 -*-
+"""
+Command line inventory of the shapefiles, dBASE tables, and GeoTIFFs in
+a directory tree.
+"""
+
+import os
+import sys
+import csv
+import json
+import math
+import multiprocessing
+from collections import OrderedDict
 
 import click
 
+from arcutils import catalog
+from arcutils import dbf
+from arcutils import raster
+from arcutils import shapefile
+
+
+RASTER_EXTENSIONS = ('.tif', '.tiff')
+
+CSV_COLUMNS = ('path', 'kind', 'count', 'xmin', 'ymin', 'xmax', 'ymax',
+               'rows', 'cols', 'dtype', 'cellsize', 'nodata', 'fields', 'error')
+
+
+def find_datasets(root):
+    """ Yields the paths of every shapefile, standalone dBASE table, and
+    GeoTIFF under `root`, directory by directory in sorted order.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        bases = set(os.path.splitext(n)[0] for n in filenames
+                    if os.path.splitext(n)[1].lower() == '.shp')
+        for name in sorted(filenames):
+            base, ext = os.path.splitext(name)
+            ext = ext.lower()
+            if (ext in ('.shp',) + RASTER_EXTENSIONS or
+                    (ext == '.dbf' and base not in bases)):
+                yield os.path.join(dirpath, name)
+
+
+def inspect_dataset(path):
+    """ Describes a single dataset without arcpy.
+
+    Returns
+    -------
+    info : OrderedDict
+        ``path`` and ``kind`` ('shapefile', 'table', or 'raster'), plus
+        ``fields`` (name, type, width), ``count``, and ``extent`` for
+        shapefiles and tables, or ``rows``, ``cols``, ``dtype``,
+        ``cellsize``, ``nodata``, and ``extent`` for rasters. If the
+        dataset can't be read, ``error`` holds the reason.
+
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    info = OrderedDict([('path', path)])
+    try:
+        if ext in RASTER_EXTENSIONS:
+            info['kind'] = 'raster'
+            source = raster.RasterFile(path)
+            nrows, ncols = source.shape
+            info['rows'] = nrows
+            info['cols'] = ncols
+            info['dtype'] = source.dtype.name
+            info['cellsize'] = source.cellsize
+            info['nodata'] = source.nodata
+            if source.cellsize is not None:
+                info['extent'] = [source.xmin, source.ymax - nrows * source.cellsize,
+                                  source.xmin + ncols * source.cellsize, source.ymax]
+        else:
+            info['kind'] = 'shapefile' if ext == '.shp' else 'table'
+            info['fields'] = [list(f) for f in catalog.read_schema(path)]
+            if ext == '.shp':
+                reader = shapefile.ShapefileReader(path)
+                info['count'] = len(reader)
+                info['extent'] = [float(v) for v in reader.bbox]
+            else:
+                info['count'] = dbf.read_header(path).numrecords
+    except Exception as e:
+        info['error'] = '{}: {}'.format(type(e).__name__, e)
+    return info
+
+
+def _json_safe(value):
+    """ Replaces NaN and infinities (which aren't JSON) with None. """
+    if isinstance(value, float):
+        return None if math.isinf(value) or math.isnan(value) else value
+    elif isinstance(value, dict):
+        return OrderedDict((k, _json_safe(v)) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def _normpath(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _csv_row(info):
+    row = dict((key, info.get(key)) for key in CSV_COLUMNS)
+    extent = info.get('extent')
+    if extent is not None:
+        row['xmin'], row['ymin'], row['xmax'], row['ymax'] = extent
+    if info.get('fields') is not None:
+        row['fields'] = ';'.join('{}:{}:{}'.format(*f) for f in info['fields'])
+    return row
+
+
+def _done_paths(output, fmt):
+    """ The paths already reported in an interrupted output file. A
+    partially written last line is cut off.
+    """
+
+    with open(output, 'rb+') as f:
+        content = f.read()
+        end = content.rfind(b'\n') + 1
+        if end < len(content):
+            f.truncate(end)
+        content = content[:end]
+
+    text = content.decode('utf-8')
+    if fmt == 'csv':
+        return set(_normpath(row['path']) for row in csv.DictReader(text.splitlines()))
+
+    done = set()
+    for line in text.splitlines():
+        try:
+            done.add(_normpath(json.loads(line)['path']))
+        except (ValueError, KeyError):
+            continue
+    return done
+
+
+def iter_inventory(paths, workers=None, chunksize=8):
+    """ Inspects datasets across a pool of worker processes, yielding
+    the results as they finish (not necessarily in order).
+    """
+
+    if workers == 1:
+        for path in paths:
+            yield inspect_dataset(path)
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for info in pool.imap_unordered(inspect_dataset, paths, chunksize=chunksize):
+            yield info
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 @click.command()
-def main(args=None):
-    """Console script for arcutils"""
-    click.echo("Replace this message by putting your code into "
-                "arcutils.cli.main")
-    click.echo("See click documentation at http://click.pocoo.org/")
+@click.argument('root', type=click.Path(exists=True, file_okay=False))
+@click.option('-f', '--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default='jsonl',
+              help='JSON lines (default) or CSV.')
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='File to write to instead of stdout.')
+@click.option('-j', '--workers', type=int, default=None,
+              help='Number of worker processes (defaults to the number of CPUs).')
+@click.option('--chunksize', type=int, default=8, show_default=True,
+              help='Number of datasets handed to a worker at a time.')
+@click.option('--resume', is_flag=True,
+              help='Skip the datasets already in OUTPUT and append to it.')
+def main(root, fmt, output, workers, chunksize, resume):
+    """ Inventories the shapefiles, dBASE tables, and GeoTIFFs under
+    ROOT: field schemas, feature counts, extents, and raster
+    dimensions, one record per dataset, written as each one finishes.
+    """
+
+    done = set()
+    appending = False
+    if resume:
+        if output is None:
+            raise click.UsageError('--resume needs --output')
+        if os.path.exists(output):
+            done = _done_paths(output, fmt)
+            appending = os.path.getsize(output) > 0
+    if output is None:
+        stream = sys.stdout
+    else:
+        stream = open(output, 'a' if resume else 'w', newline='' if fmt == 'csv' else None,
+                      encoding='utf-8')
+
+    try:
+        if fmt == 'csv':
+            writer = csv.DictWriter(stream, CSV_COLUMNS, lineterminator='\n')
+            if not appending:
+                writer.writeheader()
+
+            def write(info):
+                writer.writerow(_csv_row(info))
+        else:
+            def write(info):
+                stream.write(json.dumps(_json_safe(info), allow_nan=False) + '\n')
+
+        paths = (p for p in find_datasets(root) if _normpath(p) not in done)
+        count = 0
+        for info in iter_inventory(paths, workers=workers, chunksize=chunksize):
+            write(info)
+            stream.flush()
+            count += 1
+    finally:
+        if output is not None:
+            stream.close()
+
+    click.echo('inspected {:,d} datasets ({:,d} skipped)'.format(count, len(done)), err=True)
 
 
 if __name__ == "__main__":
@@ -2,33 +2,363 @@
 Wrappers around crappy arcpy APIs: crapy
 """
 
+import sys
+import atexit
+import threading
+from collections import deque, namedtuple
 from contextlib import contextmanager
 from functools import wraps
+from inspect import isgeneratorfunction
 
 import numpy
 
+from arcutils import profiling as _profiling
+from arcutils._compat import perf_counter
 
-def check_arcpy(func):  # pragma: no cover
-    """ Decorator that checks for and imports arcpy if its available
+
+# The arcpy module (or a stand-in) that every function decorated with
+# `check_arcpy` uses. It is imported once, on the first decorated call,
+# and bound as ``arcpy`` in the namespace of each decorated function.
+_backend = None
+_resolved = False
+_namespaces = []
+
+# this module's own binding of the backend
+arcpy = None
+
+
+def get_backend():
+    """ Returns the arcpy module used by arcutils, or None if arcpy is
+    not available. arcpy is only imported the first time this is
+    called.
     """
-    @wraps(func)
-    def wrapper(*args, **kwargs):
+
+    if not _resolved:
         try:
-            global arcpy
-            import arcpy
-            return func(*args, **kwargs)
+            import arcpy as module
         except ImportError:
+            module = None
+        set_backend(module)
+    return _backend
+
+
+def set_backend(module):
+    """ Sets the module that arcutils functions use as ``arcpy``.
+
+    Parameters
+    ----------
+    module : module or None
+        arcpy itself, a stand-in with the same API, or None to behave
+        as if arcpy is not available.
+
+    Returns
+    -------
+    previous : module or None
+        The backend that was in use before.
+
+    """
+
+    global _backend, _resolved
+    previous = _backend
+    _backend = module
+    _resolved = True
+    for namespace in _namespaces:
+        namespace['arcpy'] = module
+    return previous
+
+
+@contextmanager
+def ArcpyBackend(module):
+    """ Context manager to temporarily swap the arcpy backend.
+
+    Examples
+    --------
+    >>> from arcutils import crapy
+    >>> with crapy.ArcpyBackend(fake_arcpy):
+    ...     crapy.get_field_names('C:/gis/hydro.gdb/wetlands')
+
+    """
+
+    previous = get_backend()
+    set_backend(module)
+    try:
+        yield module
+    finally:
+        set_backend(previous)
+
+
+def check_arcpy(func):
+    """ Decorator that makes sure the arcpy backend is available before
+    calling the decorated function (or class).
+
+    The backend is resolved once per process (see `get_backend`) and
+    bound as ``arcpy`` in the module that defines ``func``, so the
+    per-call cost is a single global lookup. Calls are also recorded
+    while a `profiling.session` is active.
+
+    """
+
+    namespace = sys.modules[func.__module__].__dict__
+    if not any(ns is namespace for ns in _namespaces):
+        _namespaces.append(namespace)
+        namespace.setdefault('arcpy', None)
+        if _resolved:
+            namespace['arcpy'] = _backend
+
+    if isgeneratorfunction(func):
+        # context managers are timed over the whole ``with`` block
+        generator = _profiling.instrument(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _backend is None and get_backend() is None:
+                raise RuntimeError('`arcpy` is not available on this system')
+            return generator(*args, **kwargs)
+
+        return wrapper
+
+    name = _profiling._qualified_name(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _backend is None and get_backend() is None:
             raise RuntimeError('`arcpy` is not available on this system')
+        profiler = _profiling._session
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.call(name, func, args, kwargs)
 
     return wrapper
 
 
-@check_arcpy
-def update_status():  # pragma: no cover
+class Progress(object):
+    """ Running count of work done, reported by a `StatusSink` as
+    ``"processed 12,000/50,000 rows (3,100/s)"``. Made with
+    `StatusSink.progress`.
+    """
+
+    def __init__(self, sink, total=None, unit='rows', label='processed',
+                 asMessage=False, addTab=False):
+        self.sink = sink
+        self.total = total
+        self.unit = unit
+        self.label = label
+        self.asMessage = asMessage
+        self.addTab = addTab
+        self.count = 0
+        self.started = perf_counter()
+        self._reported = None
+
+    def update(self, n=1):
+        """ Adds ``n`` to the count. Cheap: nothing is written until the
+        sink flushes.
+        """
+        self.count += n
+        self.sink._notify()
+
+    def message(self):
+        elapsed = perf_counter() - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        if self.total is None:
+            done = '{:,d}'.format(self.count)
+        else:
+            done = '{:,d}/{:,d}'.format(self.count, self.total)
+        msg = '{} {} {} ({:,.0f}/s)'.format(self.label, done, self.unit, rate)
+        return '\t' + msg if self.addTab else msg
+
+    def close(self):
+        """ Reports the final count and stops tracking this progress.
+        """
+        self.sink._finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class StatusSink(object):
+    """ Collects status messages and writes them in batches, so that
+    printing or ``arcpy.AddMessage`` doesn't slow down the code that
+    reports its status.
+
+    Printed messages are written, in order, from a background thread at
+    least every ``interval`` seconds or as soon as ``maxcount`` of them
+    are waiting. arcpy can't be called from that thread, so messages
+    for ``arcpy.AddMessage`` are held until the next `put`, `flush`, or
+    `close` from the thread that reports them. Consecutive messages
+    that go to the same place are joined into a single write. Progress
+    counters (see `progress`) only report their latest count at each
+    flush.
+
+    Whatever is still waiting is written when the interpreter exits,
+    unless it is ended with ``os._exit`` (e.g., in a multiprocessing
+    worker), so call `close` at the end of such a process.
+
+    Parameters
+    ----------
+    interval : float (default = 0.5)
+        Maximum number of seconds between flushes.
+    maxcount : int (default = 1000)
+        Number of waiting messages that triggers a flush.
+    stream : file-like, optional
+        Where printed messages go. Defaults to ``sys.stdout`` at the
+        time of each write.
+
+    """
+
+    def __init__(self, interval=0.5, maxcount=1000, stream=None):
+        self.interval = interval
+        self.maxcount = maxcount
+        self.stream = stream
+        self._messages = deque()
+        self._held = []
+        self._progress = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._registered = False
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name='arcutils-status')
+                self._thread.daemon = True
+                self._thread.start()
+                if not self._registered:
+                    atexit.register(self.close)
+                    self._registered = True
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self._flush(background=True)
+
+    def _notify(self):
+        if self._thread is None:
+            self._start()
+
+    def put(self, msg, asMessage=False, addTab=False):
+        """ Queues a message for the next flush.
+        """
+        if addTab:
+            msg = '\t' + msg
+        self._messages.append((asMessage, msg))
+        if self._thread is None:
+            self._start()
+        if self._held:
+            self.flush()
+        elif len(self._messages) >= self.maxcount:
+            self._wakeup.set()
+
+    def progress(self, total=None, unit='rows', label='processed',
+                 asMessage=False, addTab=False):
+        """ Starts a `Progress` counter reported through this sink.
+
+        Examples
+        --------
+        >>> with crapy.status_sink.progress(50000) as progress:
+        ...     for row in rows:
+        ...         do_something(row)
+        ...         progress.update()
+
+        """
+        progress = Progress(self, total=total, unit=unit, label=label,
+                            asMessage=asMessage, addTab=addTab)
+        with self._lock:
+            self._progress.append(progress)
+        self._notify()
+        return progress
+
+    def _finish(self, progress):
+        with self._lock:
+            if progress in self._progress:
+                self._progress.remove(progress)
+        self._messages.append((progress.asMessage, progress.message()))
+        self._wakeup.set()
+
+    def _drain(self):
+        batch = []
+        while self._messages:
+            batch.append(self._messages.popleft())
+
+        with self._lock:
+            progresses = list(self._progress)
+        for progress in progresses:
+            if progress.count != progress._reported:
+                progress._reported = progress.count
+                batch.append((progress.asMessage, progress.message()))
+        return batch
+
+    def _write(self, asMessage, messages):
+        text = '\n'.join(messages)
+        backend = get_backend() if asMessage else None
+        if backend is not None:
+            backend.AddMessage(text)
+        else:
+            stream = self.stream or sys.stdout
+            stream.write(text + '\n')
+            stream.flush()
+
+    def flush(self):
+        """ Writes every waiting message now.
+        """
+        self._flush(background=False)
+
+    def _flush(self, background):
+        with self._write_lock:
+            if background:
+                batch = []
+                for asMessage, msg in self._drain():
+                    if asMessage:
+                        self._held.append((asMessage, msg))
+                    else:
+                        batch.append((asMessage, msg))
+            else:
+                batch = self._held + self._drain()
+                self._held = []
+
+            while batch:
+                asMessage = batch[0][0]
+                run = []
+                while batch and batch[0][0] == asMessage:
+                    run.append(batch.pop(0)[1])
+                self._write(asMessage, run)
+
+    def close(self):
+        """ Flushes the waiting messages and stops the background
+        thread.
+        """
+        self._closed = True
+        self._wakeup.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+
+# the sink used by `update_status`
+status_sink = StatusSink()
+
+
+def update_status(func):
     """ Decorator to allow a function to take a additional keyword
     arguments related to printing status messages to stdin or as arcpy
     messages.
+
+    The decorated function accepts ``msg``, ``verbose`` (the message
+    is only sent when True), ``asMessage`` (send it with
+    ``arcpy.AddMessage`` instead of ``print``), and ``addTab`` (indent
+    it). Messages are queued on `status_sink` and written in batches
+    (see `StatusSink`), so they don't hold up ``func``.
+
     """
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         msg = kwargs.pop("msg", None)
@@ -36,18 +366,124 @@ def update_status():  # pragma: no cover
         asMessage = kwargs.pop("asMessage", False)
         addTab = kwargs.pop("addTab", False)
 
-        if verbose:
-            if addTab:
-                msg = '\t' + msg
-            if asMessage:
-                arcpy.AddMessage(msg)
-            else:
-                print(msg)
+        if verbose and msg is not None:
+            status_sink.put(msg, asMessage=asMessage, addTab=addTab)
 
         return func(*args, **kwargs)
     return wrapper
 
 
+ExtensionStats = namedtuple('ExtensionStats', ('checkouts', 'checkins', 'reused', 'held'))
+
+
+class ExtensionPool(object):
+    """ Reference-counted checkouts of ArcGIS extensions.
+
+    The first user of an extension checks it out; later and nested
+    users share that checkout. The license is checked back in once the
+    last user releases it -- right away, or after ``idle_timeout``
+    seconds without a new user, so that a loop of ``with Extension``
+    blocks doesn't round-trip to the license manager every iteration.
+
+    Since arcpy can't be called from other threads, idle extensions are
+    not checked in by a timer: that happens on the next `acquire` or
+    `release` (of any extension) once the timeout has passed, or at
+    `close`, which runs when the interpreter exits.
+
+    Parameters
+    ----------
+    idle_timeout : float (default = 0)
+        Seconds to keep an unused extension checked out.
+    clock : callable, optional
+        Returns the current time in seconds. Defaults to
+        `time.perf_counter`.
+
+    """
+
+    def __init__(self, idle_timeout=0, clock=perf_counter):
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._users = {}
+        self._status = {}
+        self._idle = {}
+        self._checkouts = 0
+        self._checkins = 0
+        self._reused = 0
+
+    @check_arcpy
+    def acquire(self, name):
+        """ Checks out an extension, or reuses the existing checkout.
+        Returns the checkout status.
+        """
+        with self._lock:
+            self._expire()
+            self._idle.pop(name, None)
+
+            if name in self._users:
+                self._users[name] += 1
+                self._reused += 1
+                return self._status[name]
+
+            if arcpy.CheckExtension(name) != u"Available":
+                raise RuntimeError("%s license isn't available" % name)
+
+            self._status[name] = arcpy.CheckOutExtension(name)
+            self._users[name] = 1
+            self._checkouts += 1
+            return self._status[name]
+
+    def release(self, name):
+        """ Gives up one use of an extension, checking it in if that was
+        the last one (and the idle timeout is zero).
+        """
+        with self._lock:
+            self._users[name] -= 1
+            if self._users[name] == 0:
+                if self.idle_timeout > 0:
+                    self._idle[name] = self._clock()
+                else:
+                    self._checkin(name)
+            self._expire()
+
+    def _expire(self):
+        now = self._clock()
+        for name, since in list(self._idle.items()):
+            if now - since >= self.idle_timeout:
+                del self._idle[name]
+                self._checkin(name)
+
+    def _checkin(self, name):
+        try:
+            arcpy.CheckInExtension(name)
+        finally:
+            del self._users[name]
+            del self._status[name]
+            self._checkins += 1
+
+    def close(self):
+        """ Checks in every extension that is not in use.
+        """
+        with self._lock:
+            for name in [n for n, users in self._users.items() if users == 0]:
+                self._idle.pop(name, None)
+                self._checkin(name)
+
+    def stats(self):
+        """ The number of checkouts, checkins, and checkouts avoided by
+        reuse so far, and the extensions currently held.
+        """
+        with self._lock:
+            return ExtensionStats(self._checkouts, self._checkins,
+                                  self._reused, sorted(self._users))
+
+
+# the pool used by `Extension`. Set ``extension_pool.idle_timeout`` to
+# keep licenses checked out between blocks.
+extension_pool = ExtensionPool()
+atexit.register(extension_pool.close)
+
+
 @contextmanager
 @check_arcpy
 def Extension(name):
@@ -57,6 +493,12 @@ def Extension(name):
     the interpreter leaves the code block by any means (e.g., successful
     execution, raised exception) the extension will be checked back in.
 
+    Checkouts are shared through `extension_pool`: nested and repeated
+    blocks reuse the current checkout, which is only checked back in
+    when the outermost block exits (or, with an ``idle_timeout``, the
+    next time the pool is used after no block has used it for that
+    long; see `ExtensionPool`).
+
     Examples
     --------
     >>> import arcutils, arcpy
@@ -65,13 +507,11 @@ def Extension(name):
 
     """
 
-    if arcpy.CheckExtension(name) == u"Available":
-        status = arcpy.CheckOutExtension(name)
+    status = extension_pool.acquire(name)
+    try:
         yield status
-    else:
-        raise RuntimeError("%s license isn't available" % name)
-
-    arcpy.CheckInExtension(name)
+    finally:
+        extension_pool.release(name)
 
 
 @contextmanager
@@ -135,7 +575,24 @@ def WorkSpace(path):
     arcpy.env.workspace = orig_workspace
 
 
-@check_arcpy
+class _Point(object):
+    """ Stand-in for ``arcpy.Point`` when arcpy is not available. """
+    def __init__(self, X, Y):
+        self.X = X
+        self.Y = Y
+
+
+class _Extent(object):
+    """ Stand-in for ``arcpy.Extent`` when arcpy is not available. """
+    def __init__(self, XMin, YMin, XMax, YMax):
+        self.XMin = XMin
+        self.YMin = YMin
+        self.XMax = XMax
+        self.YMax = YMax
+        self.lowerLeft = _Point(XMin, YMin)
+        self.upperRight = _Point(XMax, YMax)
+
+
 class RasterTemplate(object):
     """ Georeferencing template for Rasters.
 
@@ -157,7 +614,8 @@ class RasterTemplate(object):
         The width of the raster's cells.
     extent : Extent
         Yet another mock-ish class that ``x`` and ``y`` are stored in
-        ``extent.lowerLeft`` as an ``arcpy.Point``.
+        ``extent.lowerLeft`` as an ``arcpy.Point``. Without arcpy, a
+        lightweight stand-in with the same attributes is used.
 
     See also
     --------
@@ -168,7 +626,11 @@ class RasterTemplate(object):
     def __init__(self, cellsize, xmin, ymin):
         self.meanCellWidth = cellsize
         self.meanCellHeight = cellsize
-        self.extent = arcpy.Extent(xmin, ymin, numpy.nan, numpy.nan)
+        backend = get_backend()
+        if backend is None:
+            self.extent = _Extent(xmin, ymin, numpy.nan, numpy.nan)
+        else:
+            self.extent = backend.Extent(xmin, ymin, numpy.nan, numpy.nan)
 
     @classmethod
     def from_arcpy_raster(cls, arcpy_raster):
@@ -194,11 +656,247 @@ class RasterTemplate(object):
         return template
 
 
-@check_arcpy
-def get_field_names(layerpath):
+def _segment_sums(values, offsets):
+    """ Sums of ``values`` between consecutive ``offsets`` (empty
+    segments sum to zero).
+    """
+    if offsets.shape[0] < 2:
+        return numpy.zeros(0, dtype=values.dtype)
+    # the padding keeps trailing empty segments in bounds
+    sums = numpy.add.reduceat(numpy.append(values, 0), offsets[:-1])
+    sums[offsets[1:] == offsets[:-1]] = 0
+    return sums
+
+
+def _concat_ranges(starts, counts):
+    """ ``numpy.concatenate([arange(s, s + c) for s, c in ...])`` """
+    ends = numpy.cumsum(counts)
+    return numpy.arange(ends[-1] if ends.shape[0] else 0) + numpy.repeat(starts - ends + counts, counts)
+
+
+class GeometryBatch(object):
+    """ Many polygons held in a few flat arrays instead of one
+    ``arcpy.Polygon`` (and its ``Point`` and ``Array`` objects) each.
+
+    The layout is that of `shapefile.ShapeArrays`: the vertices of part
+    (ring) ``j`` are ``coords[part_offsets[j]:part_offsets[j + 1]]``
+    and the parts of geometry ``i`` are
+    ``part_offsets[geom_offsets[i]:geom_offsets[i + 1]]``. Offsets are
+    never rebased, so slicing a batch (``batch[1000:2000]``) returns a
+    view of the same buffers without copying anything. arcpy geometries
+    are only built when `to_arcpy` is iterated, e.g., while writing
+    with an insert cursor.
+
+    Parameters
+    ----------
+    coords : array-like
+        Array of shape ``(npoints, 2)`` of the x- and y-coordinates of
+        every vertex.
+    part_offsets : array-like of int
+        Start of each part in ``coords``, plus the end of the last.
+    geom_offsets : array-like of int, optional
+        Start of each geometry in ``part_offsets``, plus the end of the
+        last. Defaults to one part per geometry.
+
+    Examples
+    --------
+    >>> from arcutils import crapy, tetris
+    >>> corners = tetris.box_corners(x, y, 10.0, 4)
+    >>> boxes = crapy.GeometryBatch.from_rings(corners.reshape(-1, 4, 2))
+    >>> boxes.area()[:3]
+    array([100., 100., 100.])
+    >>> with arcpy.da.InsertCursor(fc, ['SHAPE@']) as cursor:
+    ...     for polygon in boxes[:1000].to_arcpy():
+    ...         cursor.insertRow((polygon,))
+
+    """
+
+    def __init__(self, coords, part_offsets, geom_offsets=None):
+        self.coords = numpy.ascontiguousarray(coords, dtype=numpy.float64).reshape(-1, 2)
+        self.part_offsets = numpy.asarray(part_offsets, dtype=numpy.int64)
+        if geom_offsets is None:
+            geom_offsets = numpy.arange(self.part_offsets.shape[0], dtype=numpy.int64)
+        self.geom_offsets = numpy.asarray(geom_offsets, dtype=numpy.int64)
+
+    @classmethod
+    def from_rings(cls, rings):
+        """ Single-part polygons from an array of shape ``(n, nvertices,
+        2)``, e.g. the boxes of `tetris.box_corners`. A contiguous
+        float64 array is used as is.
+        """
+        rings = numpy.asarray(rings, dtype=numpy.float64)
+        n, nvertices = rings.shape[:2]
+        offsets = numpy.arange(0, (n + 1) * nvertices, nvertices, dtype=numpy.int64)
+        return cls(rings.reshape(-1, 2), offsets)
+
+    @classmethod
+    def from_shapes(cls, arrays):
+        """ The geometries read by `shapefile.read_shapefile`. """
+        return cls(numpy.column_stack([arrays.x, arrays.y]),
+                   arrays.part_offsets, arrays.geom_offsets)
+
+    def __len__(self):
+        return self.geom_offsets.shape[0] - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise IndexError('GeometryBatch slices must be contiguous')
+            stop = max(start, stop)
+            return GeometryBatch(self.coords, self.part_offsets, self.geom_offsets[start:stop + 1])
+
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('geometry index out of range')
+        return self[index:index + 1]
+
+    def take(self, indices):
+        """ A new batch of the given geometries, in that order. Unlike
+        slices, this copies their coordinates.
+        """
+
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        first, last = self.geom_offsets[indices], self.geom_offsets[indices + 1]
+        parts = _concat_ranges(first, last - first)
+        starts, stops = self.part_offsets[parts], self.part_offsets[parts + 1]
+        coords = self.coords[_concat_ranges(starts, stops - starts)]
+        return GeometryBatch(coords, numpy.append(0, numpy.cumsum(stops - starts)),
+                             numpy.append(0, numpy.cumsum(last - first)))
+
+    @property
+    def nbytes(self):
+        """ Memory held by the buffers (shared by all slices). """
+        return self.coords.nbytes + self.part_offsets.nbytes + self.geom_offsets.nbytes
+
+    def _parts(self):
+        """ The offsets of this batch's parts and of its geometries
+        relative to them.
+        """
+        first, last = self.geom_offsets[0], self.geom_offsets[-1]
+        return self.part_offsets[first:last + 1], self.geom_offsets - first
+
+    def _shoelace(self):
+        """ Per-part sums of the cross products of consecutive vertices
+        (twice the signed area) and of their first moments, relative to
+        the first vertex of each geometry (to avoid cancellation with
+        large coordinates), and those first vertices.
+        """
+
+        parts, geoms = self._parts()
+        start, stop = parts[0], parts[-1]
+        offsets = parts - start
+        starts = offsets[geoms]
+        xy = self.coords[start:stop]
+        origin = numpy.full((len(self), 2), numpy.nan)
+        nonempty = starts[1:] > starts[:-1]
+        origin[nonempty] = xy[starts[:-1][nonempty]]
+        xy = xy - numpy.repeat(origin, starts[1:] - starts[:-1], axis=0)
+
+        # each vertex's successor, wrapping around at the end of its part
+        following = numpy.arange(1, xy.shape[0] + 1)
+        nonempty = offsets[1:] > offsets[:-1]
+        following[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+        x0, y0 = xy[:, 0], xy[:, 1]
+        x1, y1 = x0[following], y0[following]
+
+        cross = x0 * y1 - x1 * y0
+        return (_segment_sums(cross, offsets),
+                _segment_sums((x0 + x1) * cross, offsets),
+                _segment_sums((y0 + y1) * cross, offsets),
+                geoms, origin)
+
+    def bounds(self):
+        """ Array of shape ``(n, 4)`` of the xmin, ymin, xmax, and ymax
+        of each geometry (NaN for empty ones).
+        """
+
+        parts, geoms = self._parts()
+        starts = parts[geoms]
+        out = numpy.full((len(self), 4), numpy.nan)
+        nonempty = starts[1:] > starts[:-1]
+        if nonempty.any():
+            xy = self.coords[starts[0]:starts[-1]]
+            at = starts[:-1][nonempty] - starts[0]
+            out[nonempty, :2] = numpy.minimum.reduceat(xy, at)
+            out[nonempty, 2:] = numpy.maximum.reduceat(xy, at)
+        return out
+
+    def area(self):
+        """ The area of each polygon. As in ArcGIS, outer rings run
+        clockwise and holes counterclockwise, so holes are subtracted.
+        """
+        cross, _, _, geoms, _ = self._shoelace()
+        return -0.5 * _segment_sums(cross, geoms)
+
+    def centroid(self):
+        """ Array of shape ``(n, 2)`` of the center of mass of each
+        polygon. Polygons without area get the mean of their vertices
+        (NaN for empty ones).
+        """
+
+        cross, xmoment, ymoment, geoms, origin = self._shoelace()
+        cross = _segment_sums(cross, geoms)
+        moments = numpy.column_stack([_segment_sums(xmoment, geoms),
+                                      _segment_sums(ymoment, geoms)])
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            out = origin + moments / (3.0 * cross[:, None])
+
+        flat = cross == 0
+        if flat.any():
+            parts, _ = self._parts()
+            starts = parts[geoms] - parts[0]
+            xy = self.coords[parts[0]:parts[-1]]
+            counts = (starts[1:] - starts[:-1]).astype(float)
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                means = numpy.column_stack([_segment_sums(xy[:, 0], starts),
+                                            _segment_sums(xy[:, 1], starts)]) / counts[:, None]
+            out[flat] = means[flat]
+        return out
+
+    @check_arcpy
+    def to_arcpy(self, chunksize=4096):
+        """ Yields an ``arcpy.Polygon`` for each geometry, building each
+        one only when it is asked for. Coordinates are converted to
+        python floats ``chunksize`` geometries at a time.
+        """
+
+        def points(flat, start, stop):
+            # a flat list of floats creates no objects for the garbage
+            # collector to track, unlike a list of pairs
+            values = iter(flat[2 * start:2 * stop])
+            return arcpy.Array([arcpy.Point(x, y) for x, y in zip(values, values)])
+
+        parts, geoms = self._parts()
+        single = bool((numpy.diff(geoms) == 1).all())
+        parts, geoms = parts.tolist(), geoms.tolist()
+        for chunk in range(0, len(geoms) - 1, chunksize):
+            bounds = geoms[chunk:chunk + chunksize + 1]
+            base = parts[bounds[0]]
+            flat = self.coords[base:parts[bounds[-1]]].ravel().tolist()
+            if single:
+                for start, stop in zip(parts[bounds[0]:bounds[-1]],
+                                       parts[bounds[0] + 1:bounds[-1] + 1]):
+                    yield arcpy.Polygon(points(flat, start - base, stop - base))
+                continue
+
+            for first, last in zip(bounds[:-1], bounds[1:]):
+                rings = [points(flat, parts[k] - base, parts[k + 1] - base)
+                         for k in range(first, last)]
+                if len(rings) == 1:
+                    yield arcpy.Polygon(rings[0])
+                else:
+                    yield arcpy.Polygon(arcpy.Array(rings))
+
+
+@_profiling.instrument
+def get_field_names(layerpath, catalog=None):
     """
     Gets the names of fields/columns in a feature class or table.
-    Relies on `arcpy.ListFields`_.
+    Shapefiles and dBASE tables are read directly from the .dbf header
+    (no arcpy needed); everything else relies on `arcpy.ListFields`_.
 
     .. _arcpy.ListFields: http://goo.gl/Siq5y7
 
@@ -206,6 +904,10 @@ def get_field_names(layerpath):
     ----------
     layerpath : str, arcpy.Layer, or arcpy.table
         The thing that has fields.
+    catalog : arcutils.catalog.SchemaCatalog, optional
+        When provided, shapefiles and dBASE tables are answered from
+        the catalog if its entry is fresh (and the entry is updated if
+        it is not).
 
     Returns
     -------
@@ -213,4 +915,19 @@ def get_field_names(layerpath):
 
     """
 
+    # imported here since the catalog pulls in sqlite3 and multiprocessing
+    from arcutils import catalog as _catalog
+
+    if _catalog.is_dataset(layerpath):
+        if catalog is not None:
+            fields = catalog.update(layerpath)
+        else:
+            fields = _catalog.read_schema(layerpath)
+        return [f.name for f in fields]
+
+    return _list_field_names(layerpath)
+
+
+@check_arcpy
+def _list_field_names(layerpath):
     return [f.name for f in arcpy.ListFields(layerpath)]
@@ -0,0 +1,303 @@
+"""
+Pure-numpy reader for dBASE (.dbf) attribute tables. No arcpy needed.
+"""
+
+import os
+import re
+import codecs
+import struct
+from collections import namedtuple, OrderedDict
+
+import numpy
+
+from arcutils.profiling import record_bytes
+
+
+DBFField = namedtuple('DBFField', ('name', 'type', 'length', 'decimals', 'offset'))
+DBFHeader = namedtuple('DBFHeader', ('numrecords', 'headerlength', 'recordlength', 'fields'))
+
+
+def _dbf_path(path):
+    base, ext = os.path.splitext(path)
+    if ext.lower() == '.dbf':
+        return path
+    for candidate in (base + '.dbf', base + '.DBF'):
+        if os.path.exists(candidate):
+            return candidate
+    return base + '.dbf'
+
+
+# the code page names ArcGIS writes to .cpg files that aren't also
+# Python codec names
+CODEPAGES = {
+    'UTF8': 'utf-8',
+    '65001': 'utf-8',
+    'OEM': 'cp437',
+    'SYSTEM': 'latin-1',
+    'BIG5': 'big5',
+    'GB2312': 'gb2312',
+    'EUC-JP': 'euc_jp',
+    'SJIS': 'shift_jis',
+    'KOI8R': 'koi8_r',
+}
+
+
+def codec_name(codepage):
+    """ The Python codec of a code page as named in a .cpg file (e.g.,
+    'ANSI 1252', '1252', '88591', or 'UTF-8'). Unknown code pages fall
+    back to latin-1, which decodes any byte.
+    """
+
+    name = codepage.strip().upper()
+    name = CODEPAGES.get(name, name)
+    windows = re.match(r'^(?:ANSI\s*|CP)?(\d{3,5})$', name)
+    iso = re.match(r'^(?:ISO-?)?8859-?(\d{1,2})$', name)
+    if iso:
+        name = 'iso8859-{}'.format(iso.group(1))
+    elif windows:
+        name = 'cp{}'.format(windows.group(1))
+
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return 'latin-1'
+
+
+def _encoding(dbfpath):
+    """ Reads the codepage from the .cpg sidecar, if there is one. """
+    base = os.path.splitext(dbfpath)[0]
+    for ext in ('.cpg', '.CPG'):
+        cpg = base + ext
+        if os.path.exists(cpg):
+            with open(cpg, 'r') as f:
+                return codec_name(f.read())
+    return 'latin-1'
+
+
+def read_header(path, encoding=None):
+    """ Parses the header of a dBASE table without reading any records.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .dbf file or to a shapefile (.shp), in which case
+        the .dbf next to it is used.
+    encoding : str, optional
+        Codec of the field names. Defaults to the code page in the .cpg
+        sidecar file, or latin-1. Bytes that aren't valid in it are
+        replaced rather than raising.
+
+    Returns
+    -------
+    header : DBFHeader
+        Named tuple of ``numrecords``, ``headerlength``,
+        ``recordlength``, and ``fields`` (a list of ``DBFField``).
+
+    """
+
+    dbfpath = _dbf_path(path)
+    if encoding is None:
+        encoding = _encoding(dbfpath)
+
+    with open(dbfpath, 'rb') as f:
+        numrecords, headerlength, recordlength = struct.unpack('<IHH', f.read(12)[4:])
+        f.seek(32)
+        descriptors = f.read(headerlength - 32)
+
+    fields = []
+    offset = 1  # the first byte of every record is the deletion flag
+    for start in range(0, len(descriptors) - 31, 32):
+        desc = descriptors[start:start + 32]
+        if desc[0:1] == b'\r':
+            break
+        name = desc[:11].split(b'\x00')[0].decode(encoding, 'replace')
+        ftype = desc[11:12].decode('ascii')
+        length, decimals = struct.unpack('<BB', desc[16:18])
+        fields.append(DBFField(name, ftype, length, decimals, offset))
+        offset += length
+
+    return DBFHeader(numrecords, headerlength, recordlength, fields)
+
+
+def _record_dtype(header):
+    return numpy.dtype({
+        'names': [f.name for f in header.fields],
+        'formats': ['S{}'.format(f.length) for f in header.fields],
+        'offsets': [f.offset for f in header.fields],
+        'itemsize': header.recordlength,
+    })
+
+
+def _records(dbfpath, header, rows):
+    if header.numrecords == 0:
+        records = numpy.zeros(0, dtype=_record_dtype(header))
+    else:
+        records = numpy.memmap(dbfpath, dtype=_record_dtype(header), mode='r',
+                               offset=header.headerlength,
+                               shape=(header.numrecords,))
+    if rows is not None:
+        records = records[rows]
+    return records
+
+
+def _live(records, header):
+    """ Which records aren't flagged as deleted (``*`` in their first
+    byte).
+    """
+    flags = records.view(numpy.dtype({
+        'names': ['flag'],
+        'formats': ['S1'],
+        'offsets': [0],
+        'itemsize': header.recordlength,
+    }))
+    return flags['flag'] != b'*'
+
+
+def record_numbers(path, rows=None):
+    """ The positions, in the file, of the records that aren't flagged
+    as deleted, i.e., of the rows `read_dbf` returns.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .dbf file or to a shapefile.
+    rows : slice, optional
+        Only look at these records.
+
+    Returns
+    -------
+    numbers : numpy.ndarray of int64
+
+    """
+
+    dbfpath = _dbf_path(path)
+    header = read_header(dbfpath)
+    numbers = numpy.arange(*(rows or slice(None)).indices(header.numrecords), dtype=numpy.int64)
+    return numbers[_live(_records(dbfpath, header, rows), header)]
+
+
+def field_dtype(field):
+    """ The numpy dtype that holds the values of a field without loss.
+    Used when the dtype must not depend on the values (e.g., when a
+    table is read in chunks).
+    """
+    if field.type in ('N', 'F'):
+        if field.decimals == 0 and field.length < 19:
+            return numpy.dtype('int64')
+        return numpy.dtype('float64')
+    elif field.type == 'D':
+        return numpy.dtype('datetime64[D]')
+    elif field.type == 'L':
+        return numpy.dtype(bool)
+    return numpy.dtype('U{}'.format(field.length))
+
+
+def _parse_numeric(raw, field):
+    text = numpy.char.strip(raw)
+    blank = (text == b'') | (numpy.char.count(text, b'*') > 0)
+    text = numpy.where(blank, b'nan', text)
+    values = text.astype(float)
+    if field.decimals == 0 and field.length < 19 and not blank.any():
+        values = values.astype(numpy.int64)
+    return values
+
+
+def _iso_date(text):
+    if len(text) != 8 or not text.isdigit() or text == '00000000':
+        return 'NaT'
+    return '{}-{}-{}'.format(text[:4], text[4:6], text[6:8])
+
+
+def _parse_date(raw):
+    """ Blank, all-zero, and invalid (e.g., Feb. 30) dates are NaT. """
+    text = numpy.char.strip(raw).astype('U8')
+    iso = [_iso_date(d) for d in text.tolist()]
+    try:
+        return numpy.array(iso, dtype='datetime64[D]')
+    except ValueError:
+        dates = numpy.empty(len(iso), dtype='datetime64[D]')
+        for i, d in enumerate(iso):
+            try:
+                dates[i] = numpy.datetime64(d, 'D')
+            except ValueError:
+                dates[i] = numpy.datetime64('NaT')
+        return dates
+
+
+def _parse_logical(raw):
+    first = numpy.char.upper(numpy.char.strip(raw))
+    return numpy.isin(first, [b'T', b'Y'])
+
+
+def _convert(raw, field, encoding):
+    if field.type in ('N', 'F'):
+        return _parse_numeric(raw, field)
+    elif field.type == 'D':
+        return _parse_date(raw)
+    elif field.type == 'L':
+        return _parse_logical(raw)
+    else:
+        return numpy.char.strip(numpy.char.decode(raw, encoding))
+
+
+def read_dbf(path, fields=None, encoding=None, rows=None):
+    """ Reads columns of a dBASE table into typed numpy arrays.
+
+    The file is memory-mapped and the header is parsed once. Only the
+    requested columns are converted; the bytes of the other columns
+    are never copied or parsed.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .dbf file or to a shapefile (.shp), in which case
+        the .dbf next to it is used.
+    fields : list of str, optional
+        The columns to read. If not provided, all of them are read.
+    encoding : str, optional
+        Codec of the text columns. Defaults to the code page in the
+        .cpg sidecar file (see `codec_name`), or latin-1 if there isn't
+        one.
+    rows : slice, optional
+        The records to read (e.g., ``slice(1000, 2000)``). Defaults to
+        all of them. Records flagged as deleted are skipped either way.
+
+    Returns
+    -------
+    columns : OrderedDict of numpy.ndarray
+        Text fields (C) are unicode arrays, numeric fields (N, F) are
+        float arrays (int64 if the field has no decimals and no blank
+        values), dates (D) are ``datetime64[D]``, and logical fields (L)
+        are boolean.
+
+    Examples
+    --------
+    >>> from arcutils import dbf
+    >>> cols = dbf.read_dbf('C:/gis/stations.shp', fields=['Station'])
+    >>> cols['Station'][:3]
+
+    """
+
+    dbfpath = _dbf_path(path)
+    if encoding is None:
+        encoding = _encoding(dbfpath)
+    header = read_header(dbfpath, encoding)
+
+    lookup = OrderedDict((f.name, f) for f in header.fields)
+    if fields is None:
+        fields = list(lookup.keys())
+
+    missing = [name for name in fields if name not in lookup]
+    if missing:
+        raise ValueError("fields {} not in {}".format(missing, dbfpath))
+
+    records = _records(dbfpath, header, rows)
+    record_bytes(records.shape[0] * header.recordlength)
+
+    live = _live(records, header)
+    columns = OrderedDict()
+    for name in fields:
+        raw = records[name] if live.all() else records[name][live]
+        columns[name] = _convert(raw, lookup[name], encoding)
+
+    return columns
@@ -1,12 +1,184 @@
-from arcutils.crapy import check_arcpy
-try:
-    import arcpy
-except ImportError:
-    arcpy = None
+import os
+import threading
+from concurrent import futures
+from collections import OrderedDict, namedtuple
+
+from arcutils.crapy import check_arcpy, get_backend
+from arcutils.profiling import instrument
+from arcutils import shapefile
+
+# bound to the arcpy backend on the first call of a function decorated
+# with `check_arcpy` (see `crapy.set_backend`)
+arcpy = None
+
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+# the files next to a dataset that are part of it, by the extension of
+# the dataset. ``{base}`` is its path without the extension.
+_RASTER_SIDECARS = ('{path}.aux.xml', '{path}.ovr', '{base}.rrd')
+SIDECARS = {
+    '.shp': ('{base}.dbf', '{base}.shx', '{base}.prj', '{base}.cpg'),
+    '.dbf': ('{base}.cpg',),
+    '.tif': ('{base}.tfw', '{base}.tifw') + _RASTER_SIDECARS,
+    '.tiff': ('{base}.tfw', '{base}.tiffw') + _RASTER_SIDECARS,
+    '.img': ('{base}.ige',) + _RASTER_SIDECARS,
+    '.jpg': ('{base}.jgw',) + _RASTER_SIDECARS,
+    '.png': ('{base}.pgw',) + _RASTER_SIDECARS,
+}
+
+
+def _sidecars(path, datatype):
+    """ The paths of the files that belong to the dataset at ``path``
+    besides the dataset itself.
+    """
 
+    base, ext = os.path.splitext(path)
+    names = SIDECARS.get(ext.lower())
+    if names is None:
+        # e.g., ESRI GRIDs (directories) and other rasters
+        names = _RASTER_SIDECARS if datatype == 'raster' else ()
+    return [name.format(path=path, base=base) for name in names]
 
-@check_arcpy
-def load_data(datapath, datatype, greedyRasters=True, **verbosity):
+
+def _stamp(path):
+    """ The modification time and size of a file (None if it doesn't
+    exist). Directories (e.g., ESRI GRIDs) are stamped with every file
+    inside of them.
+    """
+
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+
+    if not os.path.isdir(path):
+        return (info.st_mtime, info.st_size)
+
+    stamps = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            filepath = os.path.join(dirpath, name)
+            stamps.append((os.path.relpath(filepath, path), _stamp(filepath)))
+    return tuple(stamps)
+
+
+class DataCache(object):
+    """ Bounded least-recently-used cache for the results of
+    `load_data`.
+
+    Entries are keyed on the resolved path, the datatype, and the
+    loading options, and remember the modification times and sizes of
+    the dataset's files when it was loaded: the file itself (or every
+    file inside of it, for directories such as ESRI GRIDs) and its
+    sidecars, chosen by extension (see ``SIDECARS``), e.g. the .dbf of
+    a shapefile or the world file and .aux.xml of a GeoTIFF. An entry
+    whose files have since changed is never returned; it is reloaded
+    instead. Only data given as paths is cached.
+
+    A hit returns the very object that was loaded, not a copy, so
+    changes made to it (e.g., a Layer's name or symbology) are seen by
+    everyone loading the same dataset through the cache.
+
+    Parameters
+    ----------
+    maxsize : int (default = 32)
+        The maximum number of loaded datasets to keep.
+
+    Attributes
+    ----------
+    hits, misses : int
+        Counters of cache lookups that were and were not served from
+        the cache.
+
+    Examples
+    --------
+    >>> import arcutils
+    >>> cache = arcutils.mapping.DataCache(maxsize=16)
+    >>> dem = arcutils.mapping.load_data('C:/gis/dem.tif', 'raster', cache=cache)
+    >>> dem = arcutils.mapping.load_data('C:/gis/dem.tif', 'raster', cache=cache)
+    >>> cache.info()
+    CacheInfo(hits=1, misses=1, maxsize=16, currsize=1)
+
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(datapath, *options):
+        try:
+            path = os.path.normcase(os.path.abspath(datapath))
+        except (TypeError, AttributeError):
+            return None, None
+
+        stamp = _stamp(path)
+        if stamp is None:
+            return None, None
+
+        # a dataset is only unchanged if its sidecars are too (missing
+        # ones count, so that adding one is also a change)
+        datatype = options[0] if options else None
+        stamps = [stamp] + [_stamp(sidecar) for sidecar in _sidecars(path, datatype)]
+        return (path,) + options, tuple(stamps)
+
+    def load(self, loader, datapath, *options):
+        """ Returns the cached data for ``datapath`` and ``options`` or
+        calls ``loader()`` and caches its result.
+        """
+
+        key, stamp = self._key(datapath, *options)
+        if key is None:
+            return loader()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries[key] = self._entries.pop(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        data = loader()
+
+        with self._lock:
+            self._entries[key] = (stamp, data)
+            self._entries[key] = self._entries.pop(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return data
+
+    def invalidate(self, datapath=None):
+        """ Drops the cached entries of a path, or every entry if no
+        path is given.
+        """
+
+        with self._lock:
+            if datapath is None:
+                self._entries.clear()
+            else:
+                path = os.path.normcase(os.path.abspath(datapath))
+                for key in [k for k in self._entries if k[0] == path]:
+                    del self._entries[key]
+
+    def info(self):
+        """ Hit and miss statistics, like ``functools.lru_cache``. """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+
+@instrument
+def load_data(datapath, datatype, greedyRasters=True, asarrays=False,
+              cache=None, **verbosity):
     """ Loads vector and raster data from filepaths.
 
     Parameters
@@ -20,17 +192,275 @@ def load_data(datapath, datatype, greedyRasters=True, **verbosity):
         Currently, arcpy lets you load raster data as a "Raster" or as a
         "Layer". When ``greedyRasters`` is True, rasters loaded as type
         "Layer" will be forced to type "Raster".
+    asarrays : bool (default = False)
+        When True, shapefiles are read into flat coordinate arrays
+        (see `arcutils.shapefile.ShapeArrays`) instead of a Layer. This
+        is also what happens to "shape" and "layer" data when arcpy is
+        not available.
+    cache : DataCache, optional
+        When provided, repeat loads of an unchanged file are served
+        from the cache.
 
     Returns
     -------
-    data : `arcpy.Raster`_ or `arcpy.mapping.Layer`_
-        The data loaded as an arcpy object.
+    data : `arcpy.Raster`_, `arcpy.mapping.Layer`_, or ShapeArrays
+        The data loaded as an arcpy object (or as arrays).
 
     .. _arcpy.Raster: http://goo.gl/AQgFXW
     .. _arcpy.mapping.Layer: http://goo.gl/KfrGNa
 
     """
 
+    if cache is not None:
+        def loader():
+            return load_data(datapath, datatype, greedyRasters=greedyRasters,
+                             asarrays=asarrays)
+
+        return cache.load(loader, datapath, datatype.lower(),
+                          bool(greedyRasters), bool(asarrays))
+
+    if datatype.lower() in ('shape', 'layer') and (asarrays or get_backend() is None):
+        try:
+            return shapefile.read_shapefile(datapath)
+        except Exception:
+            raise ValueError("could not load {} as arrays".format(datapath))
+
+    return _load_arcpy_data(datapath, datatype, greedyRasters)
+
+
+# loads that have been started but haven't finished, shared by every
+# Prefetcher so that the same dataset is never loaded twice at once
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _spec(spec):
+    """ Splits a load spec into (datapath, datatype, options). Specs are
+    ``(datapath, datatype)`` or ``(datapath, datatype, {options})``
+    tuples, or dicts of `load_data`'s arguments.
+    """
+    if isinstance(spec, dict):
+        options = dict(spec)
+        return options.pop('datapath'), options.pop('datatype'), options
+
+    datapath, datatype = spec[:2]
+    options = dict(spec[2]) if len(spec) > 2 else {}
+    return datapath, datatype, options
+
+
+def _inflight_key(datapath, datatype, options):
+    try:
+        path = os.path.normcase(os.path.abspath(datapath))
+    except (TypeError, AttributeError):
+        # arcpy objects: the pending future keeps them alive, so their
+        # id can't be reused while the load is in flight
+        path = id(datapath)
+    return (path, datatype.lower(), tuple(sorted(options.items(), key=lambda kv: kv[0])))
+
+
+class Prefetcher(object):
+    """ Starts `load_data` calls in a pool of threads, ahead of when
+    their results are needed.
+
+    Requests for the same path, datatype, and options that arrive while
+    a load is in progress -- from this or any other Prefetcher -- share
+    that load instead of starting another one. Errors are raised when
+    the result is asked for, exactly as `load_data` would raise them.
+
+    Parameters
+    ----------
+    workers : int (default = 4)
+        The number of loads that run at the same time.
+
+    Examples
+    --------
+    >>> from arcutils import mapping
+    >>> with mapping.Prefetcher(workers=8) as prefetcher:
+    ...     dem = prefetcher.submit('//share/gis/dem.tif', 'raster')
+    ...     do_something_else()
+    ...     hillshade(dem.result())
+
+    """
+
+    def __init__(self, workers=4):
+        self._pool = futures.ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def submit(self, datapath, datatype, **options):
+        """ Starts loading a dataset (or joins a load of it that is
+        already in flight).
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Resolves to what ``load_data(datapath, datatype, **options)``
+            returns.
+
+        """
+
+        key = _inflight_key(datapath, datatype, options)
+        with _inflight_lock:
+            future = _inflight.get(key)
+            if future is not None:
+                return future
+            future = self._pool.submit(load_data, datapath, datatype, **options)
+            _inflight[key] = future
+
+        def forget(done, key=key):
+            with _inflight_lock:
+                if _inflight.get(key) is done:
+                    del _inflight[key]
+
+        future.add_done_callback(forget)
+        return future
+
+    def prefetch(self, specs):
+        """ Starts loading every spec (see `load_many`). Returns the
+        futures, in order. Repeated specs get the same future.
+        """
+        pending = []
+        batch = {}
+        for datapath, datatype, options in map(_spec, specs):
+            key = _inflight_key(datapath, datatype, options)
+            if key not in batch:
+                batch[key] = self.submit(datapath, datatype, **options)
+            pending.append(batch[key])
+        return pending
+
+    def load_many(self, specs):
+        """ Starts loading every spec and returns an iterator of the
+        results, in order.
+        """
+        return _results(self.prefetch(specs))
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+def _results(pending):
+    for future in pending:
+        yield future.result()
+
+
+def _shutdown_when_done(prefetcher, pending):
+    """ Shuts down ``prefetcher``'s pool once every future in
+    ``pending`` is done, whether or not the results are ever asked for.
+    """
+
+    pending = set(pending)
+    remaining = [len(pending)]
+    lock = threading.Lock()
+
+    def done(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            prefetcher.shutdown(wait=False)
+
+    if not pending:
+        prefetcher.shutdown(wait=False)
+    for future in pending:
+        future.add_done_callback(done)
+
+
+_default_prefetcher = None
+
+
+def prefetch(specs, workers=4):
+    """ Starts loading datasets in the background, before they are
+    needed.
+
+    The loads run on a pool of threads that is shared by every call.
+    A later `prefetch` or `load_many` of a dataset that is still
+    loading joins that load instead of starting another one. Finished
+    loads are not kept, though: to reuse them, load through a
+    `DataCache` (e.g., with ``{'cache': cache}`` as the options) or
+    hold on to the returned futures.
+
+    Parameters
+    ----------
+    specs : iterable
+        ``(datapath, datatype)`` or ``(datapath, datatype, options)``
+        tuples, or dicts of `load_data` arguments.
+    workers : int (default = 4)
+        The number of threads of the shared pool. Only used when the
+        pool is first created.
+
+    Returns
+    -------
+    futures : list of concurrent.futures.Future
+
+    Examples
+    --------
+    >>> from arcutils import mapping
+    >>> cache = mapping.DataCache()
+    >>> mapping.prefetch([('//share/gis/dem.tif', 'raster', {'cache': cache}),
+    ...                   ('//share/gis/streams.shp', 'layer', {'cache': cache})])
+    >>> # ... later, this joins the load or reads the cache; it doesn't
+    >>> # go back to the network
+    >>> dem, = mapping.load_many([('//share/gis/dem.tif', 'raster', {'cache': cache})])
+
+    """
+
+    global _default_prefetcher
+    with _inflight_lock:
+        if _default_prefetcher is None:
+            _default_prefetcher = Prefetcher(workers=workers)
+    return _default_prefetcher.prefetch(specs)
+
+
+def load_many(specs, workers=4):
+    """ Loads many datasets concurrently.
+
+    Every load is started right away on a pool of ``workers`` threads;
+    the results are then handed out in the order of ``specs``. Loads of
+    the same dataset share one in-flight request, including loads
+    started earlier with `prefetch`.
+
+    The threads are shut down once every load has finished, so the
+    returned iterator doesn't need to be exhausted.
+
+    Parameters
+    ----------
+    specs : iterable
+        ``(datapath, datatype)`` or ``(datapath, datatype, options)``
+        tuples, or dicts of `load_data` arguments.
+    workers : int (default = 4)
+        The number of datasets loaded at the same time.
+
+    Returns
+    -------
+    data : iterator
+        The loaded datasets, in order. A load that failed raises its
+        ``ValueError`` when its turn comes.
+
+    Examples
+    --------
+    >>> from arcutils import mapping
+    >>> specs = [('C:/gis/dem.tif', 'raster'), ('C:/gis/wetlands.shp', 'layer')]
+    >>> for data in mapping.load_many(specs, workers=8):
+    ...     process(data)
+
+    """
+
+    prefetcher = Prefetcher(workers=workers)
+    try:
+        pending = prefetcher.prefetch(specs)
+    except Exception:
+        prefetcher.shutdown(wait=False)
+        raise
+    _shutdown_when_done(prefetcher, pending)
+    return _results(pending)
+
+
+@check_arcpy
+def _load_arcpy_data(datapath, datatype, greedyRasters):
     dtype_lookup = {
         'raster': arcpy.Raster,
         'grid': arcpy.Raster,
@@ -102,6 +532,7 @@ class EasyMapDoc(object):
             self.mapdoc = arcpy.mapping.MapDocument(*args, **kwargs)
         except RuntimeError:
             self.mapdoc = None
+        self._layer_index = None
 
     @property
     def layers(self):
@@ -117,16 +548,108 @@ class EasyMapDoc(object):
         """
         return arcpy.mapping.ListDataFrames(self.mapdoc)
 
+    @instrument
+    def refresh(self):
+        """ Rebuilds the index of layer names used by `findLayerByName`.
+
+        The index is built on the first lookup and kept up to date by
+        `add_layer` and `add_layers`. Call this after changing the
+        map's layers by any other means (e.g., directly through arcpy).
+
+        """
+
+        index = {}
+        for lyr in arcpy.mapping.ListLayers(self.mapdoc):
+            if not lyr.isGroupLayer:
+                for key in self._layer_keys(lyr):
+                    index.setdefault(key, []).append(lyr)
+        self._layer_index = index
+
+    @staticmethod
+    def _layer_keys(lyr):
+        keys = [lyr.name]
+        longName = getattr(lyr, 'longName', None)
+        if longName and longName != lyr.name:
+            keys.append(longName)
+        return keys
+
+    def _index_layer(self, layer, position, df, dataframes):
+        if self._layer_index is None:
+            return
+
+        # the index is in table-of-contents order across every
+        # dataframe, so it can only be updated in place when the layer
+        # lands at one end of the whole map. Anywhere else (and for
+        # group layers, whose children aren't known) it is rebuilt on
+        # the next lookup.
+        if position == 'top' and df is dataframes[0]:
+            first = True
+        elif position == 'bottom' and df is dataframes[-1]:
+            first = False
+        else:
+            self._layer_index = None
+            return
+
+        if layer.isGroupLayer:
+            self._layer_index = None
+            return
+
+        # AddLayer puts a copy of ``layer`` in the map, so index that
+        matches = [
+            lyr for lyr in arcpy.mapping.ListLayers(self.mapdoc, layer.name, df)
+            if lyr.name == layer.name
+        ]
+        if not matches:
+            self._layer_index = None
+            return
+        lyr = matches[0] if first else matches[-1]
+
+        for key in self._layer_keys(lyr):
+            matches = self._layer_index.setdefault(key, [])
+            if first:
+                matches.insert(0, lyr)
+            else:
+                matches.append(lyr)
+
+    @instrument
+    def findLayersByName(self, name):
+        """ Finds all of the `layers`_ in the map whose name (or full
+        group-layer path) is an exact match of ``name``.
+
+        .. _layers: http://goo.gl/KfrGNa
+
+        Parameters
+        ----------
+        name : str
+            The name (e.g., "wetlands") or group path (e.g.,
+            "Hydrology\\wetlands") of the layers you want to find.
+
+        Returns
+        -------
+        lyrs : list of arcpy.mapping.Layer
+            The matching layers in table-of-contents order.
+
+        """
+
+        if self._layer_index is None:
+            self.refresh()
+        return list(self._layer_index.get(name, []))
+
+    @instrument
     def findLayerByName(self, name):
         """ Finds a `layer`_ in the map by searching for an exact match
         of its name.
 
+        Lookups use an index of the map's layers that is built once
+        (see `refresh`), so they do not scan the map.
+
         .. _layer: http://goo.gl/KfrGNa
 
         Parameters
         ----------
         name : str
-            The name of the layer you want to find.
+            The name of the layer you want to find. The full path of a
+            layer inside of group layers (its ``longName``) also works.
 
         Returns
         -------
@@ -145,10 +668,14 @@ class EasyMapDoc(object):
 
         """
 
-        for lyr in self.layers:
-            if not lyr.isGroupLayer and lyr.name == name:
-                return lyr
+        if self._layer_index is None:
+            self.refresh()
+
+        matches = self._layer_index.get(name)
+        if matches:
+            return matches[0]
 
+    @instrument
     def add_layer(self, layer, df=None, position='top'):
         """ Simply adds a `layer`_ to a map.
 
@@ -181,19 +708,83 @@ class EasyMapDoc(object):
         """
 
         # if no dataframe is provided, select the first
+        dataframes = self.dataframes
         if df is None:
-            df = self.dataframes[0]
+            df = dataframes[0]
 
         # check that the position is valid
         valid_positions = ['auto_arrange', 'bottom', 'top']
         if position.lower() not in valid_positions:
-            raise ValueError('Position: %s is not in %s' % (position.lower, valid_positions))
+            raise ValueError('Position: %s is not in %s' % (position.lower(), valid_positions))
 
         # layer can be a path to a file. if so, convert to a Layer object
         layer = load_data(layer, 'layer')
 
         # add the layer to the map
         arcpy.mapping.AddLayer(df, layer, position.upper())
+        self._index_layer(layer, position.lower(), df, dataframes)
 
         # return the layer
         return layer
+
+    @instrument
+    def add_layers(self, layers, df=None, position='top', workers=4):
+        """ Adds many `layers`_ to a map at once.
+
+        The dataframe and position are resolved once, all of the
+        datasets are loaded concurrently (each distinct path only
+        once), and then the layers are added in the order given, just
+        as if `add_layer` had been called on each of them.
+
+        .. _layers: http://goo.gl/KfrGNa
+
+        Parameters
+        ----------
+        layers : iterable of str or arcpy.mapping.Layer
+            The datasets to be added to the map.
+        df : arcpy.mapping.DataFrame, optional
+            The specific dataframe to which the layers will be added. If
+            not provided, the data will be added to the first dataframe
+            in the map.
+        position : str, optional ('TOP')
+            The positional within `df` where the data will be added.
+            Valid options are: 'auto_arrange', 'bottom', and 'top'.
+        workers : int (default = 4)
+            The number of threads loading data at the same time.
+
+        Returns
+        -------
+        layers : list of arcpy.mapping.Layer
+            The successfully added layers, in the order given.
+
+        Examples
+        --------
+        >>> import arcutils
+        >>> ezmd = arcutils.mapping.EasyMapDoc('CURRENT')
+        >>> ezmd.add_layers(["C:/gis/wetlands.shp", "C:/gis/streams.shp"])
+
+        """
+
+        layers = list(layers)
+
+        # if no dataframe is provided, select the first
+        dataframes = self.dataframes
+        if df is None:
+            df = dataframes[0]
+
+        # check that the position is valid
+        valid_positions = ['auto_arrange', 'bottom', 'top']
+        if position.lower() not in valid_positions:
+            raise ValueError('Position: %s is not in %s' % (position.lower(), valid_positions))
+
+        # load every distinct dataset once, concurrently
+        with Prefetcher(workers=workers) as prefetcher:
+            pending = prefetcher.prefetch((layer, 'layer') for layer in layers)
+            loaded = [future.result() for future in pending]
+
+        # add the layers to the map in order
+        for layer in loaded:
+            arcpy.mapping.AddLayer(df, layer, position.upper())
+            self._index_layer(layer, position.lower(), df, dataframes)
+
+        return loaded
@@ -0,0 +1,283 @@
+"""
+Reduced-resolution copies (overviews) of GeoTIFFs, stored next to them
+in ``.ovr`` files, for previews that don't read every cell.
+"""
+
+import os
+
+import numpy
+
+from arcutils import tiff
+from arcutils import raster as _raster
+from arcutils.crapy import RasterTemplate
+
+
+RESAMPLING = ('nearest', 'mean', 'mode')
+
+
+def overview_path(path):
+    """ The overview file that goes with a raster. """
+    return path + '.ovr'
+
+
+def _invalid(cells, nodata):
+    invalid = numpy.isnan(cells) if cells.dtype.kind == 'f' else numpy.zeros(cells.shape, bool)
+    if nodata is not None:
+        invalid |= cells == nodata
+    return invalid
+
+
+def _nearest(cells, nodata):
+    # the upper-left cell of each 2x2 group, like ArcGIS
+    return cells[::2, ::2]
+
+
+def _mean(cells, nodata):
+    invalid = _invalid(cells, nodata)
+    values = numpy.where(invalid, 0, cells).astype(numpy.float64)
+    nrows, ncols = cells.shape[0] // 2, cells.shape[1] // 2
+    sums = values.reshape(nrows, 2, ncols, 2).sum(axis=(1, 3))
+    counts = (~invalid).reshape(nrows, 2, ncols, 2).sum(axis=(1, 3))
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    if cells.dtype.kind in 'iu':
+        means = numpy.round(means)
+    fill = numpy.nan if nodata is None else nodata
+    return numpy.where(counts > 0, means, fill).astype(cells.dtype)
+
+
+def _mode(cells, nodata):
+    # the most common valid value of each 2x2 group (the smallest one
+    # in case of a tie)
+    nrows, ncols = cells.shape[0] // 2, cells.shape[1] // 2
+    groups = cells.astype(numpy.float64)
+    groups[_invalid(cells, nodata)] = numpy.nan
+    groups = groups.reshape(nrows, 2, ncols, 2).transpose(0, 2, 1, 3).reshape(-1, 4)
+    groups.sort(axis=1)
+    counts = numpy.stack([(groups == groups[:, [j]]).sum(axis=1) for j in range(4)], axis=1)
+    modes = groups[numpy.arange(groups.shape[0]), counts.argmax(axis=1)]
+    if nodata is not None:
+        modes[numpy.isnan(modes)] = nodata
+    return modes.reshape(nrows, ncols).astype(cells.dtype)
+
+
+_REDUCERS = {'nearest': _nearest, 'mean': _mean, 'mode': _mode}
+
+
+def _level_shapes(shape, levels, minsize):
+    shapes = []
+    nrows, ncols = shape
+    while (levels is None and max(nrows, ncols) > minsize) or \
+            (levels is not None and len(shapes) < levels):
+        nrows, ncols = -(-nrows // 2), -(-ncols // 2)
+        shapes.append((nrows, ncols))
+        if nrows == ncols == 1:
+            break
+    return shapes
+
+
+def build_overviews(path, resampling='nearest', levels=None, tilesize=256, minsize=256,
+                    compress=True):
+    """ Writes the overviews of a GeoTIFF to its ``.ovr`` file.
+
+    Each level halves the resolution of the one before it and is
+    computed from it block by block, so memory use stays at a few tiles
+    however large the raster is. The levels are the images of a
+    multi-page (Big)TIFF, as written by GDAL and ArcGIS.
+
+    Parameters
+    ----------
+    path : str
+        The GeoTIFF.
+    resampling : str (default = 'nearest')
+        How each 2x2 group of cells becomes one: 'nearest' (takes one
+        of the cells, for any kind of data), 'mean' (of the valid
+        cells, for continuous surfaces), or 'mode' (the most common
+        valid value, for classified rasters).
+    levels : int, optional
+        The number of levels. By default, levels are added until the
+        coarsest one is no larger than ``minsize`` cells on either
+        side.
+    tilesize : int (default = 256)
+        The width and height of the tiles of every level.
+    minsize : int (default = 256)
+        See ``levels``.
+    compress : bool (default = True)
+        Deflate-compress the tiles.
+
+    Returns
+    -------
+    ovrpath : str
+
+    Examples
+    --------
+    >>> from arcutils import overviews
+    >>> overviews.build_overviews('C:/gis/dem.tif', resampling='mean')
+    'C:/gis/dem.tif.ovr'
+
+    """
+
+    reduce = _REDUCERS.get(resampling)
+    if reduce is None:
+        raise ValueError("`resampling` must be one of {}".format(RESAMPLING))
+    if tilesize % 16:
+        raise ValueError('tilesize must be a multiple of 16')
+
+    source = _raster.RasterFile(path)
+    nodata = source.nodata
+    fill = nodata if nodata is not None else (numpy.nan if source.dtype.kind == 'f' else 0)
+    dtype = source.dtype.newbyteorder('<')
+    compression = tiff.DEFLATE if compress else tiff.NONE
+    bigtiff = source.shape[0] * source.shape[1] * dtype.itemsize / 3. > tiff.CLASSIC_LIMIT - 2 ** 24
+
+    ovrpath = overview_path(path)
+    with tiff.TiffWriter(ovrpath, bigtiff=bigtiff) as writer:
+        for number, shape in enumerate(_level_shapes(source.shape, levels, minsize)):
+            across, down = -(-shape[1] // tilesize), -(-shape[0] // tilesize)
+            offsets, bytecounts = [0] * (across * down), [0] * (across * down)
+            tile = numpy.empty((tilesize, tilesize), dtype=dtype)
+            for index, window in enumerate(_raster.iter_windows(shape, tilesize)):
+                nrows = min(2 * window.nrows, source.shape[0] - 2 * window.row)
+                ncols = min(2 * window.ncols, source.shape[1] - 2 * window.col)
+                cells = source.read(_raster.Window(2 * window.row, 2 * window.col, nrows, ncols))
+                # odd edges are repeated so that their groups are made
+                # of real cells only
+                cells = numpy.pad(cells, ((0, nrows % 2), (0, ncols % 2)), mode='edge')
+                tile[...] = fill
+                tile[:window.nrows, :window.ncols] = reduce(cells, nodata)
+                raw = tiff.compress_block(tile.tobytes(), compression)
+                offsets[index], bytecounts[index] = writer.write_block(raw)
+
+            entries = _raster._image_entries(shape, dtype, tilesize, compression,
+                                             offsets, bytecounts, nodata, bigtiff)
+            # reduced-resolution version of another image
+            writer.write_ifd(entries + [(tiff.NEW_SUBFILE_TYPE, tiff.LONG, (1,))])
+            writer.flush()
+            cellsize = source.cellsize * 2
+            source = _raster.RasterFile(ovrpath, level=number,
+                                        georeference=(cellsize, source.xmin, source.ymax))
+
+    return ovrpath
+
+
+class Overviews(object):
+    """ A GeoTIFF and the levels of its ``.ovr`` file, from the finest
+    to the coarsest.
+
+    The overview file is ignored if it is older than the raster.
+
+    Parameters
+    ----------
+    path : str
+        The GeoTIFF.
+
+    Attributes
+    ----------
+    levels : list of RasterFile
+        The full-resolution raster followed by its overviews, each one
+        georeferenced from the raster.
+
+    Examples
+    --------
+    >>> from arcutils import overviews
+    >>> pyramid = overviews.Overviews('C:/gis/dem.tif')
+    >>> cells, template = pyramid.thumbnail(256)
+
+    """
+
+    def __init__(self, path):
+        base = _raster.RasterFile(path)
+        self.path = path
+        self.levels = [base]
+
+        ovrpath = overview_path(path)
+        if os.path.exists(ovrpath) and os.path.getmtime(ovrpath) >= os.path.getmtime(path):
+            pages = tiff.TiffFile(ovrpath).pages
+            for number, page in enumerate(pages):
+                factor = max(int(round(base.shape[1] / float(page.shape[1]))), 1)
+                self.levels.append(_raster.RasterFile(
+                    ovrpath, level=number,
+                    georeference=(base.cellsize * factor, base.xmin, base.ymax)
+                ))
+
+    def __len__(self):
+        return len(self.levels)
+
+    def select(self, cellsize=None, template=None):
+        """ The coarsest level whose cells are no larger than
+        ``cellsize`` (or the cell size of ``template``), i.e., the one
+        that is cheapest to read at that resolution without losing
+        detail. The full-resolution raster if every overview is too
+        coarse.
+        """
+
+        if cellsize is None:
+            if template is None:
+                raise ValueError("`cellsize` or `template` is required")
+            cellsize = float(template.meanCellWidth)
+
+        chosen = self.levels[0]
+        for level in self.levels[1:]:
+            # allow for the rounding of the extent of odd-sized levels
+            if level.cellsize <= cellsize * (1 + 1e-9):
+                chosen = level
+        return chosen
+
+    def read(self, template, shape, fill=None):
+        """ Samples the raster on another grid, reading from the coarsest
+        adequate level.
+
+        Parameters
+        ----------
+        template : RasterTemplate
+            The cell size and lower-left corner of the output grid.
+        shape : tuple of int
+            The (nrows, ncols) of the output grid.
+        fill : scalar, optional
+            Value of the cells outside of the raster (see
+            `RasterFile.read`).
+
+        Returns
+        -------
+        cells : numpy.ndarray
+
+        """
+
+        level = self.select(template=template)
+        nrows, ncols = shape
+        cellsize = float(template.meanCellWidth)
+        xmin = float(template.extent.lowerLeft.X)
+        ymax = float(template.extent.lowerLeft.Y) + nrows * cellsize
+
+        # the level's cells under the centers of the output cells
+        x = xmin + (numpy.arange(ncols) + 0.5) * cellsize
+        y = ymax - (numpy.arange(nrows) + 0.5) * cellsize
+        cols = numpy.floor((x - level.xmin) / level.cellsize).astype(numpy.int64)
+        rows = numpy.floor((level.ymax - y) / level.cellsize).astype(numpy.int64)
+
+        window = _raster.Window(int(rows.min()), int(cols.min()),
+                                int(rows.max() - rows.min() + 1), int(cols.max() - cols.min() + 1))
+        cells = level.read(window, fill=fill)
+        return cells[numpy.ix_(rows - window.row, cols - window.col)]
+
+    def thumbnail(self, size=256, fill=None):
+        """ The whole raster at no more than ``size`` cells on its longer
+        side.
+
+        Returns
+        -------
+        cells : numpy.ndarray
+        template : RasterTemplate
+
+        """
+
+        base = self.levels[0]
+        nrows, ncols = base.shape
+        factor = max(nrows, ncols) / float(size)
+        if factor <= 1:
+            return base.read(_raster.Window(0, 0, nrows, ncols), fill=fill), base.template
+
+        shape = (max(int(nrows / factor), 1), max(int(ncols / factor), 1))
+        cellsize = base.cellsize * factor
+        template = RasterTemplate(cellsize, base.xmin, base.ymax - shape[0] * cellsize)
+        return self.read(template, shape, fill=fill), template
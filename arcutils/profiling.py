@@ -0,0 +1,260 @@
+"""
+Opt-in instrumentation of arcutils calls.
+
+Functions decorated with `crapy.check_arcpy` or `instrument` record
+their call counts, wall and CPU time, and the bytes they read while a
+profiling `session` is active. Outside of a session, the cost is one
+global lookup per call.
+"""
+
+import json
+import threading
+from functools import wraps
+from inspect import isgeneratorfunction
+from collections import OrderedDict
+
+from arcutils._compat import perf_counter, thread_time
+
+
+# the active Profiler, if any
+_session = None
+
+
+class _Frame(object):
+    __slots__ = ('path', 'wall', 'cpu', 'nbytes')
+
+    def __init__(self, path):
+        self.path = path
+        self.nbytes = 0
+        self.wall = perf_counter()
+        self.cpu = thread_time()
+
+
+class Profiler(object):
+    """ Collects timings of instrumented calls, keyed by call stack.
+
+    Use `session` to make one active rather than creating it directly.
+
+    """
+
+    def __init__(self):
+        self.stacks = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enter(self, name):
+        stack = self._stack()
+        parent = stack[-1].path if stack else ()
+        frame = _Frame(parent + (name,))
+        stack.append(frame)
+        return frame
+
+    def exit(self, frame):
+        wall = perf_counter() - frame.wall
+        cpu = thread_time() - frame.cpu
+        stack = self._stack()
+        if stack and stack[-1] is frame:
+            stack.pop()
+        elif frame in stack:
+            # a generator that was suspended out of order
+            stack.remove(frame)
+        if stack:
+            stack[-1].nbytes += frame.nbytes
+
+        with self._lock:
+            entry = self.stacks.get(frame.path)
+            if entry is None:
+                entry = self.stacks[frame.path] = [0, 0.0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += wall
+            entry[2] += cpu
+            entry[3] += frame.nbytes
+
+    def call(self, name, func, args, kwargs):
+        frame = self.enter(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.exit(frame)
+
+    def add_bytes(self, nbytes):
+        stack = self._stack()
+        if stack:
+            stack[-1].nbytes += nbytes
+
+    def functions(self):
+        """ Totals per function: ``{name: {'calls', 'wall', 'cpu',
+        'bytes'}}``. Times and bytes include those of nested calls;
+        recursive calls are only counted once.
+        """
+        totals = OrderedDict()
+        with self._lock:
+            stacks = list(self.stacks.items())
+
+        for path, (calls, wall, cpu, nbytes) in stacks:
+            name = path[-1]
+            total = totals.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes': 0})
+            total['calls'] += calls
+            if name in path[:-1]:
+                continue
+            total['wall'] += wall
+            total['cpu'] += cpu
+            total['bytes'] += nbytes
+        return totals
+
+    def to_json(self, path=None):
+        """ Dumps the per-function totals and the per-stack timings as
+        JSON, to ``path`` if given. Returns the JSON text.
+        """
+        with self._lock:
+            stacks = [
+                {'stack': list(key), 'calls': calls, 'wall': wall, 'cpu': cpu, 'bytes': nbytes}
+                for key, (calls, wall, cpu, nbytes) in self.stacks.items()
+            ]
+        text = json.dumps({'functions': self.functions(), 'stacks': stacks}, indent=2)
+        if path is not None:
+            with open(path, 'w') as out:
+                out.write(text)
+        return text
+
+    def collapsed(self, path=None, cpu=False):
+        """ Exports the timings in the "collapsed stack" format read by
+        flamegraph.pl, speedscope, and friends: one ``a;b;c <value>``
+        line per call stack, where the value is the time (microseconds)
+        spent in ``c`` itself, excluding instrumented calls it made.
+
+        Parameters
+        ----------
+        path : str, optional
+            File to write the lines to.
+        cpu : bool (default = False)
+            Use CPU time instead of wall time.
+
+        """
+
+        column = 2 if cpu else 1
+        with self._lock:
+            stacks = dict((key, entry[column]) for key, entry in self.stacks.items())
+
+        own = dict(stacks)
+        for key, value in stacks.items():
+            if len(key) > 1 and key[:-1] in own:
+                own[key[:-1]] -= value
+
+        lines = [
+            '{} {}'.format(';'.join(key), max(int(round(value * 1e6)), 0))
+            for key, value in own.items()
+        ]
+        text = '\n'.join(lines) + '\n' if lines else ''
+        if path is not None:
+            with open(path, 'w') as out:
+                out.write(text)
+        return text
+
+
+class session(object):
+    """ Context manager that makes a `Profiler` active for its block.
+
+    Examples
+    --------
+    >>> from arcutils import mapping, profiling
+    >>> with profiling.session() as prof:
+    ...     mapping.load_data('C:/gis/wetlands.shp', 'shape', asarrays=True)
+    >>> prof.to_json('profile.json')
+    >>> prof.collapsed('profile.folded')
+
+    """
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler or Profiler()
+        self._previous = None
+
+    def __enter__(self):
+        global _session
+        self._previous = _session
+        _session = self.profiler
+        return self.profiler
+
+    def __exit__(self, *args):
+        global _session
+        _session = self._previous
+
+
+def _qualified_name(func):
+    return '{}.{}'.format(func.__module__, getattr(func, '__qualname__', func.__name__))
+
+
+def _timed(generator, name):
+    """ ``yield from generator``, recorded as a call of ``name``
+    (spelled out for Python 2, and without a return value).
+    """
+
+    profiler = _session
+    if profiler is None:
+        frame = None
+    else:
+        frame = profiler.enter(name)
+    try:
+        try:
+            value = next(generator)
+        except StopIteration:
+            return
+        while True:
+            try:
+                sent = yield value
+            except GeneratorExit:
+                generator.close()
+                raise
+            except BaseException as e:
+                try:
+                    value = generator.throw(e)
+                except StopIteration:
+                    return
+            else:
+                try:
+                    value = generator.send(sent)
+                except StopIteration:
+                    return
+    finally:
+        if frame is not None:
+            profiler.exit(frame)
+
+
+def instrument(func):
+    """ Decorator that records calls of ``func`` while a profiling
+    session is active. Generator functions (and so the context managers
+    built from them) are timed from their first to their last step.
+    """
+
+    name = _qualified_name(func)
+
+    if isgeneratorfunction(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _session is None:
+                return func(*args, **kwargs)
+            return _timed(func(*args, **kwargs), name)
+        return wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _session
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.call(name, func, args, kwargs)
+    return wrapper
+
+
+def record_bytes(nbytes):
+    """ Adds to the number of bytes read by the instrumented call in
+    progress, if a session is active.
+    """
+    profiler = _session
+    if profiler is not None:
+        profiler.add_bytes(int(nbytes))
@@ -0,0 +1,634 @@
+"""
+Block-wise reading and writing of rasters that may not fit in memory.
+"""
+
+import os
+import weakref
+import multiprocessing
+from collections import namedtuple, OrderedDict
+from concurrent import futures
+
+import numpy
+
+from arcutils import tiff
+from arcutils.crapy import RasterTemplate, get_backend
+
+
+Window = namedtuple('Window', ('row', 'col', 'nrows', 'ncols'))
+Window.__doc__ = """ A rectangular block of cells of a raster.
+
+``row`` and ``col`` are the offsets of the block's upper-left cell
+from the upper-left cell of the raster.
+
+"""
+
+
+BlockWindow = namedtuple('BlockWindow', Window._fields + ('halo', 'template'))
+BlockWindow.__doc__ = """ The window of a block yielded by `iter_blocks`.
+
+``row``, ``col``, ``nrows``, and ``ncols`` describe the core of the
+block. The array that comes with it has ``halo`` extra cells on every
+side, and ``template`` georeferences that whole array (halo included).
+
+"""
+
+
+def iter_windows(shape, blocksize):
+    """ Yields the windows that tile a grid in row-major order.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        The (nrows, ncols) of the grid.
+    blocksize : int or tuple of int
+        The (nrows, ncols) of the blocks. Blocks along the bottom and
+        right edges may be smaller.
+
+    """
+
+    nrows, ncols = shape
+    brows, bcols = numpy.broadcast_to(blocksize, (2,))
+    for row in range(0, nrows, brows):
+        for col in range(0, ncols, bcols):
+            yield Window(row, col, min(brows, nrows - row), min(bcols, ncols - col))
+
+
+def _array_blocks(array, blocksize):
+    for window in iter_windows(array.shape, blocksize):
+        yield window, array[window.row:window.row + window.nrows,
+                            window.col:window.col + window.ncols]
+
+
+def _geokeys(template, nrows):
+    cellsize = float(template.meanCellWidth)
+    xmin = float(template.extent.lowerLeft.X)
+    ymin = float(template.extent.lowerLeft.Y)
+    ymax = ymin + nrows * float(template.meanCellHeight)
+    return [
+        (tiff.MODEL_PIXEL_SCALE, tiff.DOUBLE, (cellsize, float(template.meanCellHeight), 0.0)),
+        (tiff.MODEL_TIEPOINT, tiff.DOUBLE, (0.0, 0.0, 0.0, xmin, ymax, 0.0)),
+        # version 1.1.0, one key: GTRasterTypeGeoKey = RasterPixelIsArea
+        (tiff.GEO_KEY_DIRECTORY, tiff.SHORT, (1, 1, 0, 1, 1025, 0, 1, 1)),
+    ]
+
+
+def _image_entries(shape, dtype, tilesize, compression, offsets, bytecounts, nodata, bigtiff):
+    """ The IFD entries of a tiled, single-band image. """
+    nrows, ncols = shape
+    offset_type = tiff.LONG8 if bigtiff else tiff.LONG
+    entries = [
+        (tiff.IMAGE_WIDTH, tiff.LONG, (ncols,)),
+        (tiff.IMAGE_LENGTH, tiff.LONG, (nrows,)),
+        (tiff.BITS_PER_SAMPLE, tiff.SHORT, (dtype.itemsize * 8,)),
+        (tiff.COMPRESSION, tiff.SHORT, (compression,)),
+        (tiff.PHOTOMETRIC, tiff.SHORT, (1,)),
+        (tiff.SAMPLES_PER_PIXEL, tiff.SHORT, (1,)),
+        (tiff.PLANAR_CONFIG, tiff.SHORT, (1,)),
+        (tiff.TILE_WIDTH, tiff.SHORT, (tilesize,)),
+        (tiff.TILE_LENGTH, tiff.SHORT, (tilesize,)),
+        (tiff.TILE_OFFSETS, offset_type, offsets),
+        (tiff.TILE_BYTE_COUNTS, offset_type, bytecounts),
+        (tiff.SAMPLE_FORMAT, tiff.SHORT, (tiff.SAMPLE_FORMATS[dtype.kind],)),
+    ]
+    if nodata is not None:
+        entries.append((tiff.GDAL_NODATA, tiff.ASCII, repr(numpy.asarray(nodata).item())))
+    return entries
+
+
+def write_raster(path, template, data, shape=None, dtype=None, tilesize=256,
+                 nodata=None, compress=True, bigtiff=None):
+    """ Writes a georeferenced, tiled GeoTIFF one tile at a time.
+
+    Peak memory use is about one tile, so grids that are much larger
+    than the available RAM can be written from a memory-mapped array
+    or from a generator of blocks. This is a pure-python writer: it
+    does not need arcpy, and the result can be opened with
+    ``arcpy.Raster``.
+
+    Parameters
+    ----------
+    path : str
+        The GeoTIFF file to create.
+    template : arcutils.crapy.RasterTemplate
+        Provides the cell size and the lower-left corner of the grid.
+    data : array-like, str, or iterable of (Window, array)
+        The cell values. Either a 2D array (e.g., ``numpy.memmap``),
+        the path to a ``.npy`` file (which is memory-mapped), or an
+        iterable of ``(Window, block)`` pairs. Each window must start
+        on a multiple of ``tilesize`` and, unless it touches the
+        bottom or right edge of the grid, span whole tiles.
+    shape : tuple of int, optional
+        The (nrows, ncols) of the grid. Required when ``data`` is an
+        iterable of blocks.
+    dtype : numpy.dtype, optional
+        The data type of the cells. Required when ``data`` is an
+        iterable of blocks. Defaults to the array's dtype.
+    tilesize : int (default = 256)
+        The width and height of the tiles in the file. Must be a
+        multiple of 16.
+    nodata : float, optional
+        The NoData value, recorded in the file and used to fill the
+        parts of edge tiles outside of the grid.
+    compress : bool (default = True)
+        Deflate-compress the tiles.
+    bigtiff : bool, optional
+        Write a BigTIFF. By default this is done only if the
+        uncompressed grid is larger than 4 GiB.
+
+    Returns
+    -------
+    path : str
+
+    Examples
+    --------
+    >>> import numpy
+    >>> from arcutils import crapy, raster
+    >>> template = crapy.RasterTemplate(10, 286300, 830000)
+    >>> grid = numpy.load('model_output.npy', mmap_mode='r')
+    >>> raster.write_raster('model_output.tif', template, grid)
+
+    """
+
+    if tilesize % 16:
+        raise ValueError('tilesize must be a multiple of 16')
+
+    if isinstance(data, str):
+        data = numpy.load(data, mmap_mode='r')
+
+    if hasattr(data, 'shape') and hasattr(data, 'dtype'):
+        if len(data.shape) != 2:
+            raise ValueError('data must be two-dimensional')
+        shape = data.shape
+        dtype = data.dtype if dtype is None else dtype
+        blocks = _array_blocks(data, tilesize)
+    elif shape is None or dtype is None:
+        raise ValueError('shape and dtype are required when writing blocks')
+    else:
+        blocks = data
+
+    nrows, ncols = shape
+    dtype = numpy.dtype(dtype).newbyteorder('<')
+    if dtype.kind not in tiff.SAMPLE_FORMATS:
+        raise ValueError('Cannot write cells of type {}'.format(dtype))
+
+    if bigtiff is None:
+        bigtiff = nrows * ncols * dtype.itemsize > tiff.CLASSIC_LIMIT - 2 ** 24
+
+    compression = tiff.DEFLATE if compress else tiff.NONE
+    fill = 0 if nodata is None else nodata
+    across = -(-ncols // tilesize)
+    down = -(-nrows // tilesize)
+    offsets = [0] * (across * down)
+    bytecounts = [0] * (across * down)
+
+    with tiff.TiffWriter(path, bigtiff=bigtiff) as writer:
+        tile = numpy.empty((tilesize, tilesize), dtype=dtype)
+        for window, block in blocks:
+            block = numpy.asarray(block)
+            if block.shape != (window.nrows, window.ncols):
+                raise ValueError('block shape {} does not match {}'.format(block.shape, window))
+            if window.row % tilesize or window.col % tilesize:
+                raise ValueError('{} is not aligned with the {}-cell tiles'.format(window, tilesize))
+
+            for sub in iter_windows(block.shape, tilesize):
+                row, col = window.row + sub.row, window.col + sub.col
+                full = (min(tilesize, nrows - row), min(tilesize, ncols - col))
+                if (sub.nrows, sub.ncols) != full:
+                    raise ValueError('{} splits a tile that is not on the edge of the grid'.format(window))
+
+                tile[...] = fill
+                tile[:sub.nrows, :sub.ncols] = block[sub.row:sub.row + sub.nrows,
+                                                     sub.col:sub.col + sub.ncols]
+                index = (row // tilesize) * across + col // tilesize
+                raw = tiff.compress_block(tile.tobytes(), compression)
+                offsets[index], bytecounts[index] = writer.write_block(raw)
+
+        entries = _image_entries(shape, dtype, tilesize, compression, offsets, bytecounts,
+                                 nodata, bigtiff)
+        writer.write_ifd(entries + _geokeys(template, nrows))
+
+    return path
+
+
+class RasterFile(object):
+    """ Block-oriented, read-only access to a GeoTIFF without arcpy.
+
+    Only the tiles (or strips) that intersect a requested window are
+    read and decoded. Recently decoded tiles are kept, so reading
+    neighboring or overlapping windows in row-major order decodes each
+    tile about once.
+
+    Parameters
+    ----------
+    path : str
+        Path to the GeoTIFF.
+    level : int (default = 0)
+        Which image of the file to read (0 is full resolution).
+    cachesize : int, optional
+        The number of decoded tiles to keep. Defaults to two rows of
+        tiles.
+    georeference : tuple of float, optional
+        The (cellsize, xmin, ymax) of the image, for files that don't
+        record it themselves (e.g., the levels of an ``.ovr`` file).
+
+    Attributes
+    ----------
+    shape : tuple of int
+        The (nrows, ncols) of the raster.
+    dtype : numpy.dtype
+    nodata : float or None
+    cellsize : float
+    xmin, ymax : float
+        The coordinates of the raster's upper-left corner.
+    blockshape : tuple of int
+        The (nrows, ncols) of the tiles in the file.
+
+    """
+
+    def __init__(self, path, level=0, cachesize=None, georeference=None):
+        self.path = path
+        self._page = tiff.TiffFile(path).pages[level]
+        self.shape = self._page.shape
+        self.dtype = self._page.dtype.newbyteorder('=')
+        self.blockshape = self._page.blockshape
+        self.nodata = self._page.nodata
+        if georeference is None:
+            georeference = _georeference(path, self._page.tags)
+        self.cellsize, self.xmin, self.ymax = georeference
+        self._cache = OrderedDict()
+        self._cachesize = cachesize or 2 * self._page.blocks_across
+
+    @property
+    def template(self):
+        """ RasterTemplate of the whole raster. """
+        return self.window_template(Window(0, 0, self.shape[0], self.shape[1]))
+
+    def window_template(self, window):
+        """ RasterTemplate of a window of the raster. The window may
+        extend beyond the edges of the raster.
+        """
+        xmin = self.xmin + window.col * self.cellsize
+        ymin = self.ymax - (window.row + window.nrows) * self.cellsize
+        return RasterTemplate(self.cellsize, xmin, ymin)
+
+    def _tile(self, index):
+        tile = self._cache.get(index)
+        if tile is None:
+            tile = self._page.read_block(index)
+            self._cache[index] = tile
+            while len(self._cache) > self._cachesize:
+                self._cache.popitem(last=False)
+        else:
+            self._cache[index] = self._cache.pop(index)
+        return tile
+
+    def read(self, window, fill=None):
+        """ Reads the cells of a window.
+
+        Parameters
+        ----------
+        window : Window
+            The cells to read. Parts of the window outside of the
+            raster are set to ``fill``.
+        fill : scalar, optional
+            Defaults to the raster's NoData value, or NaN for floating
+            point rasters without one (zero for integer rasters).
+
+        Returns
+        -------
+        cells : numpy.ndarray
+
+        """
+
+        if fill is None:
+            fill = self.nodata
+        if fill is None:
+            fill = numpy.nan if self.dtype.kind == 'f' else 0
+
+        out = numpy.full((window.nrows, window.ncols), fill, dtype=self.dtype)
+
+        row0, col0 = max(window.row, 0), max(window.col, 0)
+        row1 = min(window.row + window.nrows, self.shape[0])
+        col1 = min(window.col + window.ncols, self.shape[1])
+        if row0 >= row1 or col0 >= col1:
+            return out
+
+        brows, bcols = self.blockshape
+        for trow in range(row0 // brows, (row1 - 1) // brows + 1):
+            for tcol in range(col0 // bcols, (col1 - 1) // bcols + 1):
+                tile = self._tile(trow * self._page.blocks_across + tcol)
+                # intersection of the tile and the window, in raster cells
+                r0, r1 = max(row0, trow * brows), min(row1, (trow + 1) * brows)
+                c0, c1 = max(col0, tcol * bcols), min(col1, (tcol + 1) * bcols)
+                out[r0 - window.row:r1 - window.row, c0 - window.col:c1 - window.col] = \
+                    tile[r0 - trow * brows:r1 - trow * brows, c0 - tcol * bcols:c1 - tcol * bcols]
+
+        return out
+
+
+class _ArcpyRasterSource(object):
+    """ Same interface as `RasterFile`, reading an ``arcpy.Raster``
+    window by window through ``arcpy.RasterToNumPyArray``.
+    """
+
+    def __init__(self, arcpy_raster):
+        self._arcpy = get_backend()
+        self._raster = arcpy_raster
+        self.shape = (arcpy_raster.height, arcpy_raster.width)
+        self.cellsize = arcpy_raster.meanCellWidth
+        self.xmin = arcpy_raster.extent.XMin
+        self.ymax = arcpy_raster.extent.YMax
+        self.nodata = arcpy_raster.noDataValue
+        self.blockshape = (256, 256)
+        self.dtype = None
+
+    window_template = RasterFile.window_template
+
+    def read(self, window, fill=None):
+        row0, col0 = max(window.row, 0), max(window.col, 0)
+        row1 = min(window.row + window.nrows, self.shape[0])
+        col1 = min(window.col + window.ncols, self.shape[1])
+
+        corner = self._arcpy.Point(self.xmin + col0 * self.cellsize,
+                                   self.ymax - row1 * self.cellsize)
+        cells = self._arcpy.RasterToNumPyArray(self._raster, corner, col1 - col0, row1 - row0)
+        if self.dtype is None:
+            self.dtype = cells.dtype
+
+        if fill is None:
+            fill = self.nodata
+        if fill is None:
+            fill = numpy.nan if cells.dtype.kind == 'f' else 0
+
+        out = numpy.full((window.nrows, window.ncols), fill, dtype=cells.dtype)
+        out[row0 - window.row:row1 - window.row, col0 - window.col:col1 - window.col] = cells
+        return out
+
+
+def _georeference(path, tags):
+    """ The (cellsize, xmin, ymax) of a GeoTIFF, from its tags or from
+    its world file.
+    """
+
+    if tiff.MODEL_PIXEL_SCALE in tags and tiff.MODEL_TIEPOINT in tags:
+        scale = tags[tiff.MODEL_PIXEL_SCALE]
+        i, j, _, x, y, _ = tags[tiff.MODEL_TIEPOINT][:6]
+        return scale[0], x - i * scale[0], y + j * scale[1]
+
+    base = os.path.splitext(path)[0]
+    for ext in ('.tfw', '.tifw', '.wld'):
+        if os.path.exists(base + ext):
+            with open(base + ext) as f:
+                a, d, b, e, c, f_ = [float(line) for line in f.read().split()[:6]]
+            # world files reference the center of the upper-left cell
+            return a, c - a / 2., f_ - e / 2.
+
+    raise ValueError('{} is not georeferenced'.format(path))
+
+
+def open_raster(raster):
+    """ Opens a raster for block-wise reading.
+
+    Parameters
+    ----------
+    raster : str, arcpy.Raster, or RasterFile
+        GeoTIFFs given as paths are read without arcpy. Anything else
+        goes through ``arcpy.RasterToNumPyArray``.
+
+    Returns
+    -------
+    source : RasterFile or equivalent
+
+    """
+
+    if isinstance(raster, RasterFile) or hasattr(raster, 'window_template'):
+        return raster
+
+    if isinstance(raster, str):
+        ext = os.path.splitext(raster)[1].lower()
+        if ext in ('.tif', '.tiff', '.ovr') or get_backend() is None:
+            return RasterFile(raster)
+        raster = get_backend().Raster(raster)
+
+    return _ArcpyRasterSource(raster)
+
+
+def iter_blocks(raster, blocksize=None, halo=0, fill=None):
+    """ Yields a raster block by block, so that per-block algorithms
+    run in constant memory.
+
+    Parameters
+    ----------
+    raster : str, arcpy.Raster, or RasterFile
+        The raster to read. GeoTIFFs are read directly (no arcpy).
+    blocksize : int or tuple of int, optional
+        The (nrows, ncols) of the blocks. Defaults to the raster's own
+        tile size so that each block is read from whole tiles. Blocks
+        along the bottom and right edges may be smaller.
+    halo : int (default = 0)
+        The number of extra cells read on every side of each block,
+        for neighborhood operations. Halo cells that fall outside of
+        the raster are set to ``fill``.
+    fill : scalar, optional
+        Value of halo cells outside of the raster. Defaults to the
+        raster's NoData value (NaN for floats without one).
+
+    Yields
+    ------
+    window : BlockWindow
+        The position of the block's core cells in the raster, the halo
+        size, and a RasterTemplate that georeferences the array.
+    cells : numpy.ndarray
+        Array of shape ``(nrows + 2 * halo, ncols + 2 * halo)``.
+
+    Examples
+    --------
+    >>> from arcutils import raster
+    >>> for window, cells in raster.iter_blocks('dem.tif', 512, halo=1):
+    ...     core = cells[1:-1, 1:-1]
+
+    """
+
+    source = open_raster(raster)
+    if blocksize is None:
+        blocksize = source.blockshape
+
+    for window in iter_windows(source.shape, blocksize):
+        outer = Window(window.row - halo, window.col - halo,
+                       window.nrows + 2 * halo, window.ncols + 2 * halo)
+        cells = source.read(outer, fill=fill)
+        yield BlockWindow(*window, halo=halo, template=source.window_template(outer)), cells
+
+
+def _apply(func, cells, window):
+    """ Runs ``func`` on a block and returns the core of its result. """
+    result = numpy.asarray(func(cells))
+    halo = window.halo
+    if result.shape == cells.shape:
+        result = result[halo:cells.shape[0] - halo, halo:cells.shape[1] - halo]
+    if result.shape != (window.nrows, window.ncols):
+        raise ValueError('func returned an array of shape {} for {}'.format(result.shape, window))
+    return result
+
+
+# shared memory blocks attached by each worker process of `map_blocks`
+_worker = {}
+
+
+def _init_worker(func, slot_names, slot_dtype, out_name, out_shape, out_dtype):
+    from multiprocessing import shared_memory
+
+    _worker['func'] = func
+    _worker['slots'] = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    _worker['slot_dtype'] = slot_dtype
+    _worker['out_shm'] = shared_memory.SharedMemory(name=out_name)
+    _worker['out'] = numpy.ndarray(out_shape, dtype=out_dtype, buffer=_worker['out_shm'].buf)
+
+
+def _run_block(slot, window, shape):
+    buf = _worker['slots'][slot].buf
+    cells = numpy.ndarray(shape, dtype=_worker['slot_dtype'], buffer=buf)
+    result = _apply(_worker['func'], cells, window)
+    _worker['out'][window.row:window.row + window.nrows,
+                   window.col:window.col + window.ncols] = result
+    return slot
+
+
+def map_blocks(func, raster, tile=512, halo=0, workers=None, dtype=None, fill=None):
+    """ Applies a function to every block of a raster across a pool of
+    processes and assembles the results into one grid.
+
+    Blocks (with their halos) are handed to the workers through shared
+    memory, and each worker writes its result straight into a shared
+    output grid, so no arrays are pickled. That grid is returned as is
+    (not copied), so the output is never held in memory twice. Every
+    block is computed from exactly the same cells no matter how many
+    workers are used, so the output is identical to a single-process
+    run.
+
+    The pool pays off only when ``func`` is expensive compared to
+    reading a block (e.g., focal statistics, terrain analysis, or
+    model code) and there are several CPUs to run it on. Each block is
+    copied into shared memory and scheduled across processes, so for
+    cheap functions, or on a single CPU, ``workers=1`` is faster.
+    Worker processes need Python 3.8 or later (for
+    `multiprocessing.shared_memory`); on older versions everything
+    runs in this process.
+
+    Parameters
+    ----------
+    func : callable
+        Takes a block of cells (halo included) and returns an array of
+        either the same shape or the shape of the block's core. Must be
+        picklable (i.e., defined at the top level of a module) when
+        ``workers`` is more than 1.
+    raster : str, arcpy.Raster, or RasterFile
+        The input raster (see `iter_blocks`).
+    tile : int or tuple of int (default = 512)
+        The (nrows, ncols) of the blocks, without the halo.
+    halo : int (default = 0)
+        The number of neighboring cells that ``func`` needs on each
+        side of a block.
+    workers : int, optional
+        The number of processes. Defaults to the number of CPUs. With
+        1 (or before Python 3.8), everything runs in this process.
+    dtype : numpy.dtype, optional
+        Data type of the output. Defaults to that of the input.
+    fill : scalar, optional
+        Value of halo cells outside of the raster (see `iter_blocks`).
+
+    Returns
+    -------
+    result : numpy.ndarray
+        The assembled output grid.
+    template : RasterTemplate
+        The georeferencing of the input raster, which also applies to
+        ``result``.
+
+    Examples
+    --------
+    >>> import numpy
+    >>> from arcutils import raster
+    >>> def slope(cells):
+    ...     dy, dx = numpy.gradient(cells, 8)
+    ...     return numpy.hypot(dx, dy)
+    >>> grid, template = raster.map_blocks(slope, 'dem.tif', halo=1, workers=8)
+    >>> raster.write_raster('slope.tif', template, grid)
+
+    """
+
+    source = open_raster(raster)
+    blocks = iter_blocks(source, tile, halo=halo, fill=fill)
+    template = source.window_template(Window(0, 0, source.shape[0], source.shape[1]))
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:  # Python < 3.8
+        workers = 1
+
+    first = next(blocks, None)
+    if first is None:
+        return numpy.zeros(source.shape, dtype=dtype or source.dtype), template
+    in_dtype = first[1].dtype
+    out_dtype = numpy.dtype(dtype or in_dtype)
+
+    if workers <= 1:
+        result = numpy.empty(source.shape, dtype=out_dtype)
+        for window, cells in _chain(first, blocks):
+            result[window.row:window.row + window.nrows,
+                   window.col:window.col + window.ncols] = _apply(func, cells, window)
+        return result, template
+
+    brows, bcols = numpy.broadcast_to(tile, (2,))
+    slot_bytes = int((brows + 2 * halo) * (bcols + 2 * halo) * in_dtype.itemsize)
+    out_bytes = max(int(numpy.prod(source.shape)) * out_dtype.itemsize, 1)
+
+    shms = []
+    try:
+        out_shm = shared_memory.SharedMemory(create=True, size=out_bytes)
+        shms.append(out_shm)
+        slots = []
+        for _ in range(2 * workers):
+            slots.append(shared_memory.SharedMemory(create=True, size=slot_bytes))
+            shms.append(slots[-1])
+
+        initargs = (func, [s.name for s in slots], in_dtype,
+                    out_shm.name, source.shape, out_dtype)
+        with futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                         initargs=initargs) as pool:
+            free = list(range(len(slots)))
+            pending = set()
+            for window, cells in _chain(first, blocks):
+                if not free:
+                    done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    free.extend(f.result() for f in done)
+                slot = free.pop()
+                view = numpy.ndarray(cells.shape, dtype=in_dtype, buffer=slots[slot].buf)
+                view[...] = cells
+                del view
+                pending.add(pool.submit(_run_block, slot, window, cells.shape))
+
+            for f in futures.as_completed(pending):
+                f.result()
+
+        # the shared output is handed back as is rather than copied. Its
+        # name is removed now, and its memory is released along with
+        # the array.
+        result = numpy.ndarray(source.shape, dtype=out_dtype, buffer=out_shm.buf)
+        weakref.finalize(result, out_shm.close)
+        shms.remove(out_shm)
+        out_shm.unlink()
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    return result, template
+
+
+def _chain(first, rest):
+    yield first
+    for item in rest:
+        yield item
@@ -0,0 +1,610 @@
+"""
+Streaming raster statistics and histograms, cached in the raster's
+``.aux.xml`` (PAMDataset) sidecar.
+"""
+
+import os
+import math
+from collections import namedtuple
+from concurrent import futures
+from xml.etree import ElementTree
+
+import numpy
+
+from arcutils import raster as _raster
+from arcutils._compat import get_ident, replace
+
+
+# private metadata domain of the sidecar, used to tell whether cached
+# statistics still describe the raster
+DOMAIN = 'arcutils'
+
+
+Statistics = namedtuple('Statistics', ('count', 'minimum', 'maximum', 'mean', 'std',
+                                       'histogram', 'hist_range'))
+Statistics.__doc__ = """ Summary of the valid cells of a raster band.
+
+``std`` is the sample standard deviation, as ArcGIS records it.
+``histogram`` is an array of bucket counts of equal width over
+``hist_range`` (min, max), or None. Values outside of the range are
+counted in the first or last bucket.
+
+"""
+
+
+def sidecar_path(path):
+    """ The PAMDataset file that goes with a raster. """
+    return path + '.aux.xml'
+
+
+def _bucket_index(values, bins, hist_range):
+    lo, hi = hist_range
+    scale = bins / (hi - lo) if hi > lo else 0.0
+    index = numpy.floor((values - lo) * scale)
+    return numpy.clip(index, 0, bins - 1).astype(numpy.intp)
+
+
+def _bucket_counts(values, bins, hist_range):
+    return numpy.bincount(_bucket_index(values, bins, hist_range), minlength=bins)
+
+
+# the most buckets a `_FineHistogram` spans
+FINE_BUCKETS = 16384
+
+
+def _magnitude_exponent(lo, hi):
+    # buckets much narrower than this would number past what a float
+    # holds exactly
+    return math.frexp(max(abs(lo), abs(hi)))[1] - 40
+
+
+class _FineHistogram(object):
+    """ Counts of values in buckets of width ``2 ** exponent``, aligned
+    on multiples of the width, over at most ``FINE_BUCKETS`` of them.
+
+    The histogram is kept while the range of the values isn't known.
+    The buckets start as narrow as the first values allow and are
+    merged in pairs when later values don't fit, which loses nothing,
+    and `histogram` brings them to a width that only depends on the
+    overall minimum and maximum. So the result is the same however the
+    values were split up and merged.
+    """
+
+    def __init__(self):
+        self.exponent = None
+        self.start = 0
+        self.counts = numpy.zeros(0, dtype=numpy.int64)
+
+    def _double(self):
+        counts = self.counts
+        if self.start % 2:
+            counts = numpy.concatenate([[0], counts])
+            self.start -= 1
+        if len(counts) % 2:
+            counts = numpy.concatenate([counts, [0]])
+        self.counts = counts.reshape(-1, 2).sum(axis=1)
+        self.start //= 2
+        self.exponent += 1
+
+    def _extend(self, first, last):
+        """ Makes room for buckets ``first`` through ``last`` (numbered at
+        the current width). Returns how many times the width doubled.
+        """
+        doublings = 0
+        while True:
+            low = min(first, self.start)
+            high = max(last, self.start + len(self.counts) - 1)
+            if high - low < FINE_BUCKETS:
+                break
+            self._double()
+            first, last = first // 2, last // 2
+            doublings += 1
+
+        before = self.start - low
+        after = high - (self.start + len(self.counts) - 1)
+        self.counts = numpy.concatenate([numpy.zeros(before, dtype=numpy.int64), self.counts,
+                                         numpy.zeros(after, dtype=numpy.int64)])
+        self.start = low
+        return doublings
+
+    def _bucket(self, value):
+        return int(math.floor(math.ldexp(value, -self.exponent)))
+
+    def update(self, values, lo, hi):
+        """ Counts ``values``, whose minimum and maximum are ``lo`` and
+        ``hi``.
+        """
+        if self.exponent is None:
+            span = math.frexp((hi - lo) / FINE_BUCKETS)[1] - 1 if hi > lo else -1074
+            self.exponent = max(span, _magnitude_exponent(lo, hi))
+            self.start = self._bucket(lo)
+            self.counts = numpy.zeros(1, dtype=numpy.int64)
+        while self.exponent < _magnitude_exponent(lo, hi):
+            self._double()
+        self._extend(self._bucket(lo), self._bucket(hi))
+
+        index = numpy.floor(numpy.ldexp(values, -self.exponent)).astype(numpy.int64) - self.start
+        self.counts += numpy.bincount(index, minlength=len(self.counts))
+
+    def merge(self, other):
+        if other.exponent is None:
+            return
+        other = self._copy(other)
+        if self.exponent is None:
+            self.exponent, self.start, self.counts = other.exponent, other.start, other.counts
+            return
+
+        while self.exponent < other.exponent:
+            self._double()
+        while True:
+            while other.exponent < self.exponent:
+                other._double()
+            if not self._extend(other.start, other.start + len(other.counts) - 1):
+                break
+
+        offset = other.start - self.start
+        self.counts[offset:offset + len(other.counts)] += other.counts
+
+    @staticmethod
+    def _copy(fine):
+        copy = _FineHistogram()
+        copy.exponent, copy.start, copy.counts = fine.exponent, fine.start, fine.counts.copy()
+        return copy
+
+    def histogram(self, bins, hist_range, integral):
+        """ Rebins the counts into ``bins`` buckets over ``hist_range``,
+        the minimum and maximum of the values.
+        """
+
+        if self.exponent is None:
+            return numpy.zeros(bins, dtype=numpy.int64)
+
+        lo, hi = hist_range
+        fine = self._copy(self)
+        exponent = max(fine.exponent, _magnitude_exponent(lo, hi))
+        while (math.floor(math.ldexp(hi, -exponent)) -
+               math.floor(math.ldexp(lo, -exponent))) >= FINE_BUCKETS:
+            exponent += 1
+        while fine.exponent < exponent:
+            fine._double()
+
+        edges = numpy.ldexp(numpy.arange(fine.start, fine.start + len(fine.counts),
+                                         dtype=numpy.float64), fine.exponent)
+        if integral and fine.exponent <= 0:
+            # each bucket holds at most one integer, its lower edge
+            values = edges
+        else:
+            values = numpy.clip(edges + math.ldexp(0.5, fine.exponent), lo, hi)
+        index = _bucket_index(values, bins, hist_range)
+        return numpy.bincount(index, weights=fine.counts, minlength=bins).astype(numpy.int64)
+
+
+class RunningStats(object):
+    """ Count, mean, variance, extremes, and (optionally) histogram of a
+    stream of values, updated one block at a time.
+
+    Each block is summarized with numpy and folded into the running
+    totals with the pairwise update of Chan et al., which is exact in
+    the same sense as Welford's algorithm (no sum of squares that loses
+    precision). Two instances built from different parts of a raster
+    can be combined with `merge`, so the blocks may be processed in any
+    order and in separate processes.
+
+    Parameters
+    ----------
+    bins : int, optional
+        The number of histogram buckets. No histogram is kept by
+        default.
+    hist_range : tuple of float, optional
+        The (min, max) of the histogram. Defaults to the minimum and
+        maximum of the values, in which case the values are counted on
+        a much finer grid and only put in the ``bins`` buckets by
+        `result`. That is exact for integers that span fewer than
+        ``FINE_BUCKETS`` values; otherwise a value within about 1/32 of
+        a bucket's width of its edge may be counted in the neighboring
+        bucket.
+
+    Examples
+    --------
+    >>> from arcutils import rasterstats
+    >>> left = rasterstats.RunningStats()
+    >>> left.update([1.0, 2.0, 3.0])
+    >>> right = rasterstats.RunningStats()
+    >>> right.update([4.0, 5.0])
+    >>> left.merge(right).mean
+    3.0
+
+    """
+
+    def __init__(self, bins=None, hist_range=None):
+        self.bins = bins
+        if bins is None or hist_range is None:
+            self.hist_range = None
+        else:
+            self.hist_range = tuple(float(v) for v in hist_range)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = numpy.inf
+        self.maximum = -numpy.inf
+        self.histogram = None if self.hist_range is None else numpy.zeros(bins, dtype=numpy.int64)
+        self._fine = _FineHistogram() if bins is not None and self.hist_range is None else None
+        self._integral = True
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    def update(self, values):
+        """ Adds the values of a block (any shape). Filter out NoData
+        before calling this.
+        """
+
+        values = numpy.asarray(values)
+        if values.dtype.kind not in 'biu':
+            self._integral = False
+        values = values.astype(numpy.float64, copy=False).ravel()
+        if values.size == 0:
+            return
+        mean = values.mean()
+        deviations = values - mean
+        lo, hi = float(values.min()), float(values.max())
+        self._combine(values.size, float(mean), float(numpy.dot(deviations, deviations)), lo, hi)
+        if self.histogram is not None:
+            self.histogram += _bucket_counts(values, self.bins, self.hist_range)
+        elif self._fine is not None:
+            self._fine.update(values, lo, hi)
+
+    def merge(self, other):
+        """ Folds the values summarized by ``other`` into this one and
+        returns it.
+        """
+
+        if (self.bins, self.hist_range) != (other.bins, other.hist_range):
+            raise ValueError("can't merge statistics with different histograms")
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.minimum, other.maximum)
+            if self.histogram is not None:
+                self.histogram += other.histogram
+            elif self._fine is not None:
+                self._fine.merge(other._fine)
+            self._integral = self._integral and other._integral
+        return self
+
+    @property
+    def variance(self):
+        """ Sample variance (NaN with fewer than two values). """
+        return self.m2 / (self.count - 1) if self.count > 1 else numpy.nan
+
+    @property
+    def std(self):
+        return numpy.sqrt(self.variance)
+
+    def result(self):
+        """ The summary as `Statistics`. """
+        histogram, hist_range = self.histogram, self.hist_range
+        if self._fine is not None:
+            hist_range = (self.minimum, self.maximum) if self.count else (0.0, 0.0)
+            histogram = self._fine.histogram(self.bins, hist_range, self._integral)
+
+        if not self.count:
+            return Statistics(0, numpy.nan, numpy.nan, numpy.nan, numpy.nan,
+                              histogram, hist_range)
+        return Statistics(self.count, self.minimum, self.maximum, self.mean, self.std,
+                          histogram, hist_range)
+
+
+def _valid(cells, nodata, mask):
+    """ The values of a block that are neither NoData, NaN, nor masked. """
+    keep = numpy.ones(cells.shape, dtype=bool)
+    if cells.dtype.kind == 'f':
+        keep &= ~numpy.isnan(cells)
+    for value in nodata:
+        keep &= cells != value
+    if mask is not None:
+        keep &= ~mask
+    return cells[keep]
+
+
+def _window_stats(source, windows, nodata, masks, bins, hist_range):
+    source = _raster.open_raster(source)
+    stats = RunningStats(bins, hist_range)
+    for window, mask in zip(windows, masks):
+        stats.update(_valid(source.read(window), nodata, mask))
+    return stats
+
+
+def _stream(source, blocksize, nodata, mask, bins, hist_range, workers):
+    """ One pass over the raster. Rows of blocks are summarized on
+    their own (in worker processes if possible) and merged in order.
+    """
+
+    rows = []
+    for window in _raster.iter_windows(source.shape, blocksize):
+        if not rows or rows[-1][0].row != window.row:
+            rows.append([])
+        rows[-1].append(window)
+
+    def masks(windows):
+        if mask is None:
+            return [None] * len(windows)
+        return [numpy.asarray(mask[w.row:w.row + w.nrows, w.col:w.col + w.ncols], dtype=bool)
+                for w in windows]
+
+    total = RunningStats(bins, hist_range)
+    if workers <= 1 or not isinstance(source, _raster.RasterFile) or len(rows) < 2:
+        for windows in rows:
+            total.merge(_window_stats(source, windows, nodata, masks(windows), bins, hist_range))
+        return total
+
+    with futures.ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(_window_stats, source.path, windows, nodata, masks(windows),
+                            bins, hist_range)
+                for windows in rows]
+        for job in jobs:
+            total.merge(job.result())
+    return total
+
+
+def _stamp(path):
+    info = os.stat(path)
+    return repr(float(info.st_mtime)), str(info.st_size)
+
+
+def _excluded(values):
+    return ','.join(repr(float(v)) for v in values)
+
+
+def read_statistics(path):
+    """ The statistics recorded in a raster's ``.aux.xml`` sidecar.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raster (not to the sidecar).
+
+    Returns
+    -------
+    stats : Statistics or None
+        None if there is no sidecar or it has no statistics for the
+        first band. ``count`` is None if the sidecar wasn't written by
+        arcutils.
+    meta : dict
+        The keys of the sidecar's arcutils metadata domain (e.g., the
+        modification time and size of the raster when the statistics
+        were computed, and the NoData values that were excluded).
+
+    """
+
+    try:
+        root = ElementTree.parse(sidecar_path(path)).getroot()
+    except (IOError, ElementTree.ParseError):
+        return None, {}
+
+    band = root.find("PAMRasterBand[@band='1']")
+    if band is None:
+        return None, {}
+
+    keys, meta = {}, {}
+    for metadata in band.findall('Metadata'):
+        target = keys if metadata.get('domain') is None else \
+            meta if metadata.get('domain') == DOMAIN else None
+        if target is not None:
+            for mdi in metadata.findall('MDI'):
+                target[mdi.get('key')] = mdi.text or ''
+
+    try:
+        values = [float(keys['STATISTICS_' + name])
+                  for name in ('MINIMUM', 'MAXIMUM', 'MEAN', 'STDDEV')]
+    except (KeyError, ValueError):
+        return None, meta
+
+    histogram, hist_range = None, None
+    item = band.find('Histograms/HistItem')
+    if item is not None:
+        histogram = numpy.array(item.findtext('HistCounts').split('|'), dtype=numpy.int64)
+        hist_range = (float(item.findtext('HistMin')), float(item.findtext('HistMax')))
+
+    count = int(meta['COUNT']) if 'COUNT' in meta else None
+    return Statistics(count, *values, histogram=histogram, hist_range=hist_range), meta
+
+
+def _set_keys(band, domain, values):
+    metadata = None
+    for element in band.findall('Metadata'):
+        if element.get('domain') == domain:
+            metadata = element
+            break
+    if metadata is None:
+        metadata = ElementTree.SubElement(band, 'Metadata')
+        if domain is not None:
+            metadata.set('domain', domain)
+
+    for key, value in values:
+        for mdi in metadata.findall("MDI[@key='{}']".format(key)):
+            metadata.remove(mdi)
+        mdi = ElementTree.SubElement(metadata, 'MDI', key=key)
+        mdi.text = value
+
+
+def write_statistics(path, stats, nodata=(), auto_range=True):
+    """ Records statistics in a raster's ``.aux.xml`` sidecar, along
+    with the raster's current modification time and size. Everything
+    else already in the sidecar is kept.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raster (not to the sidecar).
+    stats : Statistics
+    nodata : sequence of float
+        The values that were excluded.
+    auto_range : bool (default = True)
+        Whether the histogram spans the minimum and maximum (as opposed
+        to a range that was asked for).
+
+    """
+
+    auxpath = sidecar_path(path)
+    try:
+        tree = ElementTree.parse(auxpath)
+    except (IOError, ElementTree.ParseError):
+        tree = ElementTree.ElementTree(ElementTree.Element('PAMDataset'))
+    root = tree.getroot()
+
+    band = root.find("PAMRasterBand[@band='1']")
+    if band is None:
+        band = ElementTree.SubElement(root, 'PAMRasterBand', band='1')
+
+    histograms = band.find('Histograms')
+    if histograms is not None:
+        band.remove(histograms)
+    if stats.histogram is not None:
+        histograms = ElementTree.Element('Histograms')
+        band.insert(0, histograms)
+        item = ElementTree.SubElement(histograms, 'HistItem')
+        for tag, text in (('HistMin', repr(stats.hist_range[0])),
+                          ('HistMax', repr(stats.hist_range[1])),
+                          ('BucketCount', str(len(stats.histogram))),
+                          ('IncludeOutOfRange', '1'),
+                          ('Approximate', '0'),
+                          ('HistCounts', '|'.join(str(n) for n in stats.histogram))):
+            ElementTree.SubElement(item, tag).text = text
+
+    _set_keys(band, None, [
+        ('STATISTICS_MINIMUM', repr(float(stats.minimum))),
+        ('STATISTICS_MAXIMUM', repr(float(stats.maximum))),
+        ('STATISTICS_MEAN', repr(float(stats.mean))),
+        ('STATISTICS_STDDEV', repr(float(stats.std))),
+        ('STATISTICS_SKIPFACTORX', '1'),
+        ('STATISTICS_SKIPFACTORY', '1'),
+        ('STATISTICS_EXCLUDEDVALUES', _excluded(nodata)),
+        ('STATISTICS_COVARIANCES', repr(float(stats.std) ** 2)),
+    ])
+    mtime, size = _stamp(path)
+    _set_keys(band, DOMAIN, [
+        ('SOURCE_MTIME', mtime),
+        ('SOURCE_SIZE', size),
+        ('COUNT', str(stats.count)),
+        ('NODATA', _excluded(nodata)),
+        ('HISTOGRAM_RANGE', 'auto' if auto_range else 'fixed'),
+    ])
+
+    if hasattr(ElementTree, 'indent'):  # Python 3.9+
+        ElementTree.indent(tree, space='  ')
+
+    # written next to the sidecar and then moved over it, so that
+    # ArcGIS never reads a half-written file
+    tmppath = '{}.{}-{}.tmp'.format(auxpath, os.getpid(), get_ident())
+    try:
+        tree.write(tmppath, encoding='utf-8')
+        replace(tmppath, auxpath)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+
+def _cached(path, nodata, bins, hist_range):
+    """ The sidecar's statistics if they are still those of the raster
+    and include the requested histogram.
+    """
+
+    stats, meta = read_statistics(path)
+    if stats is None or stats.count is None:
+        return None
+    if (meta.get('SOURCE_MTIME'), meta.get('SOURCE_SIZE')) != _stamp(path):
+        return None
+    if meta.get('NODATA') != _excluded(nodata):
+        return None
+
+    if bins is None:
+        return stats._replace(histogram=None, hist_range=None)
+    if stats.histogram is None or len(stats.histogram) != bins:
+        return None
+    if hist_range is None:
+        return stats if meta.get('HISTOGRAM_RANGE') == 'auto' else None
+    return stats if stats.hist_range == tuple(float(v) for v in hist_range) else None
+
+
+def raster_statistics(raster, bins=256, hist_range=None, nodata=None, mask=None,
+                      blocksize=None, workers=1, cache=True):
+    """ Statistics of a raster, read block by block so that rasters of
+    any size take little memory.
+
+    Parameters
+    ----------
+    raster : str, arcpy.Raster, or RasterFile
+        The raster (see `raster.open_raster`).
+    bins : int or None (default = 256)
+        The number of histogram buckets. Use None to skip the
+        histogram.
+    hist_range : tuple of float, optional
+        The (min, max) covered by the histogram. Defaults to the
+        minimum and maximum of the raster, taken from the sidecar if it
+        has them, or found in the same pass as everything else (see
+        `RunningStats` for the precision of that histogram).
+    nodata : scalar or sequence of scalars, optional
+        Values to leave out. Defaults to the raster's NoData value. NaN
+        is always left out.
+    mask : array of bool, optional
+        Array of the raster's shape that is True where cells should be
+        left out (like `numpy.ma`). May be a memory map.
+    blocksize : int or tuple of int, optional
+        The (nrows, ncols) of the blocks. Defaults to the raster's own
+        tile size.
+    workers : int (default = 1)
+        The number of processes to spread the rows of blocks over when
+        ``raster`` is a GeoTIFF (read without arcpy). The partial results are merged exactly,
+        so the result doesn't depend on this.
+    cache : bool (default = True)
+        Reuse the statistics in the raster's ``.aux.xml`` sidecar if
+        the raster hasn't changed since they were written, and write
+        them there otherwise. Only applies to rasters given as paths
+        and without a ``mask``.
+
+    Returns
+    -------
+    stats : Statistics
+
+    Examples
+    --------
+    >>> from arcutils import rasterstats
+    >>> stats = rasterstats.raster_statistics('C:/gis/dem.tif')
+    >>> stats.mean, stats.std
+    (15.634284626314, 19.512346260738)
+
+    """
+
+    path = raster if isinstance(raster, str) else None
+    source = _raster.open_raster(raster)
+    if nodata is None:
+        nodata = [] if source.nodata is None else [source.nodata]
+    nodata = [float(v) for v in numpy.atleast_1d(nodata)]
+    if blocksize is None:
+        blocksize = source.blockshape
+    if mask is not None and tuple(mask.shape) != tuple(source.shape):
+        raise ValueError("`mask` must have the shape of the raster {}".format(source.shape))
+
+    use_cache = cache and path is not None and mask is None and os.path.exists(path)
+    if use_cache:
+        stats = _cached(path, nodata, bins, hist_range)
+        if stats is not None:
+            return stats
+
+    auto_range = hist_range is None
+    if bins is not None and auto_range and use_cache:
+        # the sidecar may know the range, which makes the histogram exact
+        previous = _cached(path, nodata, None, None)
+        if previous is not None:
+            hist_range = (previous.minimum, previous.maximum) if previous.count else (0.0, 0.0)
+
+    stats = _stream(source, blocksize, nodata, mask, bins, hist_range, workers).result()
+    if use_cache:
+        write_statistics(path, stats, nodata, auto_range)
+    return stats
@@ -0,0 +1,268 @@
+"""
+Memory-mapped reader for shapefile (.shp/.shx) geometries. No arcpy
+needed.
+"""
+
+import os
+import struct
+from collections import namedtuple
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+from arcutils.profiling import record_bytes
+
+
+NULL = 0
+POINT_TYPES = (1, 11, 21)
+MULTIPOINT_TYPES = (8, 18, 28)
+POLY_TYPES = (3, 5, 13, 15, 23, 25)
+
+
+ShapeArrays = namedtuple('ShapeArrays', (
+    'shapetype', 'x', 'y', 'part_offsets', 'geom_offsets', 'ids'
+))
+ShapeArrays.__doc__ = """ Flat geometry arrays of a set of shapefile records.
+
+The coordinates of part ``j`` are ``x[part_offsets[j]:part_offsets[j + 1]]``
+(and likewise for ``y``), and the parts of geometry ``i`` are
+``part_offsets[geom_offsets[i]:geom_offsets[i + 1]]``. For polygons, each
+part is a ring.
+
+"""
+
+
+def _windows(buffer, width):
+    """ Read-only view of ``buffer`` where row ``i`` is the ``width``
+    bytes starting at byte ``i``. Lets us gather unaligned values with
+    plain fancy indexing.
+    """
+    n = max(buffer.shape[0] - width + 1, 0)
+    return as_strided(buffer, shape=(n, width), strides=(1, 1), writeable=False)
+
+
+def _ranges(starts, counts, step):
+    """ Concatenation of ``starts[i] + step * arange(counts[i])``. """
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    ends = numpy.cumsum(counts)
+    local = numpy.arange(total, dtype=numpy.int64) - numpy.repeat(ends - counts, counts)
+    return numpy.repeat(numpy.asarray(starts, dtype=numpy.int64), counts) + step * local
+
+
+class ShapefileReader(object):
+    """ Random-access reader for the geometries of a shapefile.
+
+    The .shp file is memory-mapped and the record offsets come from the
+    .shx index, so record N is read without touching records 0..N-1.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .shp file. The .shx file must sit next to it.
+
+    Attributes
+    ----------
+    shapetype : int
+        The shape type code from the file header (e.g., 5 = polygon).
+    bbox : tuple of float
+        The (xmin, ymin, xmax, ymax) of the whole file.
+
+    Examples
+    --------
+    >>> from arcutils import shapefile
+    >>> reader = shapefile.ShapefileReader('C:/gis/wetlands.shp')
+    >>> xy, parts = reader.record(10)
+    >>> arrays = reader.read()
+
+    """
+
+    def __init__(self, path):
+        base = os.path.splitext(path)[0]
+        self.path = base + '.shp'
+        self._shp = numpy.memmap(self.path, dtype=numpy.uint8, mode='r')
+
+        header = bytes(self._shp[:100])
+        self.shapetype = struct.unpack('<i', header[32:36])[0]
+        self.bbox = struct.unpack('<4d', header[36:68])
+
+        shx = base + '.shx'
+        index = numpy.memmap(shx, dtype='>i4', mode='r', offset=100)
+        # offsets are stored in 16-bit words and point at the record
+        # header; the record contents start 8 bytes later.
+        self._content = index[0::2].astype(numpy.int64) * 2 + 8
+
+    def __len__(self):
+        return self._content.shape[0]
+
+    def _ids(self, ids):
+        if ids is None:
+            return numpy.arange(len(self), dtype=numpy.int64)
+        ids = numpy.atleast_1d(numpy.asarray(ids, dtype=numpy.int64))
+        if ids.size and (ids.min() < 0 or ids.max() >= len(self)):
+            raise IndexError("record ids must be between 0 and {}".format(len(self) - 1))
+        return ids
+
+    def _gather(self, offsets, width, dtype):
+        if offsets.shape[0] == 0:
+            return numpy.zeros(0, dtype=dtype)
+        raw = _windows(self._shp, width)[offsets]
+        return raw.view(dtype).reshape(-1)
+
+    def _layout(self, ids):
+        """ Per-record shape type, part count, point count, and the byte
+        offsets of the part and point arrays.
+        """
+        content = self._content[ids]
+        rectype = self._gather(content, 4, '<i4')
+
+        nparts = numpy.zeros(content.shape[0], dtype=numpy.int64)
+        npoints = numpy.zeros(content.shape[0], dtype=numpy.int64)
+        partstart = numpy.zeros(content.shape[0], dtype=numpy.int64)
+        pointstart = numpy.zeros(content.shape[0], dtype=numpy.int64)
+
+        poly = numpy.isin(rectype, POLY_TYPES)
+        nparts[poly] = self._gather(content[poly] + 36, 4, '<i4')
+        npoints[poly] = self._gather(content[poly] + 40, 4, '<i4')
+        partstart[poly] = content[poly] + 44
+        pointstart[poly] = content[poly] + 44 + 4 * nparts[poly]
+
+        multi = numpy.isin(rectype, MULTIPOINT_TYPES)
+        npoints[multi] = self._gather(content[multi] + 36, 4, '<i4')
+        nparts[multi] = (npoints[multi] > 0).astype(numpy.int64)
+        pointstart[multi] = content[multi] + 40
+
+        point = numpy.isin(rectype, POINT_TYPES)
+        npoints[point] = 1
+        nparts[point] = 1
+        pointstart[point] = content[point] + 4
+
+        return rectype, nparts, npoints, partstart, pointstart, poly
+
+    def bboxes(self, ids=None):
+        """ Bounding boxes of the records.
+
+        Parameters
+        ----------
+        ids : array-like of int, optional
+            The records to read. Defaults to all of them.
+
+        Returns
+        -------
+        bboxes : numpy.ndarray
+            Array of shape ``(n, 4)`` with columns xmin, ymin, xmax,
+            ymax. Null shapes get NaNs.
+
+        """
+
+        ids = self._ids(ids)
+        content = self._content[ids]
+        rectype = self._gather(content, 4, '<i4')
+        boxes = numpy.full((ids.shape[0], 4), numpy.nan)
+
+        boxed = numpy.isin(rectype, POLY_TYPES + MULTIPOINT_TYPES)
+        offsets = _ranges(content[boxed] + 4, numpy.full(boxed.sum(), 4), 8)
+        boxes[boxed] = self._gather(offsets, 8, '<f8').reshape(-1, 4)
+
+        point = numpy.isin(rectype, POINT_TYPES)
+        xy = self._gather(_ranges(content[point] + 4, numpy.full(point.sum(), 2), 8), 8, '<f8')
+        xy = xy.reshape(-1, 2)
+        boxes[point] = numpy.hstack([xy, xy])
+        return boxes
+
+    def record(self, n):
+        """ Zero-copy access to the geometry of a single record.
+
+        Parameters
+        ----------
+        n : int
+            The record number (0-based).
+
+        Returns
+        -------
+        xy : numpy.ndarray
+            Read-only ``(npoints, 2)`` view into the memory-mapped file.
+        parts : numpy.ndarray
+            The index of the first point of each part.
+
+        """
+
+        ids = self._ids([n])
+        rectype, nparts, npoints, partstart, pointstart, poly = self._layout(ids)
+        xy = numpy.frombuffer(self._shp, dtype='<f8', count=2 * int(npoints[0]),
+                              offset=int(pointstart[0])).reshape(-1, 2)
+        if poly[0]:
+            parts = numpy.frombuffer(self._shp, dtype='<i4', count=int(nparts[0]),
+                                     offset=int(partstart[0]))
+        else:
+            parts = numpy.zeros(int(nparts[0]), dtype='<i4')
+        return xy, parts
+
+    def read(self, ids=None):
+        """ Reads the geometries of many records into flat arrays.
+
+        Parameters
+        ----------
+        ids : array-like of int, optional
+            The records to read, in the order they should be returned.
+            Defaults to all of them.
+
+        Returns
+        -------
+        arrays : ShapeArrays
+
+        """
+
+        ids = self._ids(ids)
+        rectype, nparts, npoints, partstart, pointstart, poly = self._layout(ids)
+
+        coords = self._gather(_ranges(pointstart, 2 * npoints, 8), 8, '<f8')
+        coords = coords.reshape(-1, 2)
+        record_bytes(coords.nbytes)
+
+        # part starts are relative to their record; make them global
+        partcounts = numpy.where(poly, nparts, 0)
+        local = self._gather(_ranges(partstart, partcounts, 4), 4, '<i4').astype(numpy.int64)
+        firstpoint = numpy.cumsum(npoints) - npoints
+        starts = numpy.zeros(int(nparts.sum()), dtype=numpy.int64)
+        has_parts = numpy.repeat(poly, nparts)
+        starts[has_parts] = local + numpy.repeat(firstpoint, partcounts)
+        # multipoints and points have a single part at their first point
+        starts[~has_parts] = numpy.repeat(firstpoint[~poly], nparts[~poly])
+
+        part_offsets = numpy.append(starts, coords.shape[0])
+        geom_offsets = numpy.append(0, numpy.cumsum(nparts))
+
+        return ShapeArrays(
+            shapetype=self.shapetype,
+            x=coords[:, 0].copy(),
+            y=coords[:, 1].copy(),
+            part_offsets=part_offsets,
+            geom_offsets=geom_offsets,
+            ids=ids,
+        )
+
+
+def read_shapefile(path, ids=None):
+    """ Reads the geometries of a shapefile into flat coordinate arrays.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .shp file.
+    ids : array-like of int, optional
+        The records to read. Defaults to all of them.
+
+    Returns
+    -------
+    arrays : ShapeArrays
+
+    See also
+    --------
+    ShapefileReader
+
+    """
+
+    return ShapefileReader(path).read(ids=ids)
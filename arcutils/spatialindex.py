@@ -0,0 +1,306 @@
+"""
+Static, packed R-tree (Sort-Tile-Recursive) over the bounding boxes of
+shapefile records, stored in a memory-mappable sidecar file.
+"""
+
+import os
+import heapq
+import struct
+
+import numpy
+
+from arcutils import shapefile
+from arcutils._compat import get_ident, replace
+
+
+MAGIC = b'ARCURTRE'
+VERSION = 1
+
+# magic, version, capacity, nitems, nnodes, nlevels, source mtime, source size
+_HEADER = struct.Struct('<8sIIqqqdq')
+_HEADER_SIZE = 64
+
+ITEM_DTYPE = numpy.dtype([
+    ('xmin', '<f8'), ('ymin', '<f8'), ('xmax', '<f8'), ('ymax', '<f8'), ('id', '<i8'),
+])
+
+NODE_DTYPE = numpy.dtype([
+    ('xmin', '<f8'), ('ymin', '<f8'), ('xmax', '<f8'), ('ymax', '<f8'),
+    ('start', '<i8'), ('stop', '<i8'),
+])
+
+
+def sidecar_path(path):
+    """ The index file that goes with a shapefile. """
+    return os.path.splitext(path)[0] + '.rtree'
+
+
+def _str_order(boxes, capacity):
+    """ Sort-Tile-Recursive ordering: consecutive runs of ``capacity``
+    boxes in the returned order make up the nodes of the next level.
+    """
+    n = boxes.shape[0]
+    if n == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    nnodes = -(-n // capacity)
+    nslices = int(numpy.ceil(numpy.sqrt(nnodes)))
+    slicesize = capacity * -(-nnodes // nslices)
+
+    cx = (boxes[:, 0] + boxes[:, 2]) * 0.5
+    cy = (boxes[:, 1] + boxes[:, 3]) * 0.5
+    order = numpy.argsort(cx, kind='stable')
+    slices = numpy.arange(n) // slicesize
+    return order[numpy.lexsort((cy[order], slices))]
+
+
+def _boxes(array):
+    return numpy.column_stack([array['xmin'], array['ymin'], array['xmax'], array['ymax']])
+
+
+def _box_distance(array, x, y):
+    dx = numpy.maximum(numpy.maximum(array['xmin'] - x, x - array['xmax']), 0)
+    dy = numpy.maximum(numpy.maximum(array['ymin'] - y, y - array['ymax']), 0)
+    return numpy.hypot(dx, dy)
+
+
+class RTree(object):
+    """ Packed R-tree over a set of bounding boxes.
+
+    The tree is built bottom-up in one pass (Sort-Tile-Recursive) and
+    never changes afterwards. Items and nodes are held in two flat
+    structured arrays, which can be memory-mapped straight from the
+    sidecar file written by `save`, so opening an index is free and
+    several processes share the same pages.
+
+    Use `build` or `from_shapefile` rather than calling this directly.
+
+    Parameters
+    ----------
+    items : numpy.ndarray
+        Structured array (`ITEM_DTYPE`) of the leaf boxes and their ids,
+        in tree order.
+    nodes : numpy.ndarray
+        Structured array (`NODE_DTYPE`), level by level from the bottom
+        up. ``start`` and ``stop`` index ``items`` for the nodes of the
+        first level and ``nodes`` for all of the others.
+    levels : numpy.ndarray
+        Offset of each level in ``nodes`` (plus the total).
+    capacity : int
+        The maximum number of children per node.
+
+    Examples
+    --------
+    >>> from arcutils import shapefile, spatialindex
+    >>> index = spatialindex.RTree.from_shapefile('C:/gis/parcels.shp')
+    >>> ids = index.intersects((6.0e6, 1.8e6, 6.1e6, 1.9e6))
+    >>> parcels = shapefile.read_shapefile('C:/gis/parcels.shp', ids=ids)
+
+    """
+
+    def __init__(self, items, nodes, levels, capacity):
+        self.items = items
+        self.nodes = nodes
+        self.levels = levels
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.items.shape[0]
+
+    @classmethod
+    def build(cls, boxes, ids=None, capacity=16):
+        """ Packs a tree from an ``(n, 4)`` array of xmin, ymin, xmax,
+        ymax. Rows with NaNs (e.g., null shapes) are left out. ``ids``
+        default to the row numbers.
+        """
+
+        if capacity < 2:
+            raise ValueError("`capacity` must be at least 2")
+
+        boxes = numpy.asarray(boxes, dtype=float).reshape(-1, 4)
+        if ids is None:
+            ids = numpy.arange(boxes.shape[0], dtype=numpy.int64)
+        valid = ~numpy.isnan(boxes).any(axis=1)
+        boxes, ids = boxes[valid], numpy.asarray(ids, dtype=numpy.int64)[valid]
+
+        order = _str_order(boxes, capacity)
+        items = numpy.empty(boxes.shape[0], dtype=ITEM_DTYPE)
+        for n, name in enumerate(('xmin', 'ymin', 'xmax', 'ymax')):
+            items[name] = boxes[order, n]
+        items['id'] = ids[order]
+
+        levels = [0]
+        nodes = []
+        children, base = boxes[order], 0
+        while children.shape[0] > 0:
+            starts = numpy.arange(0, children.shape[0], capacity)
+            level = numpy.empty(starts.shape[0], dtype=NODE_DTYPE)
+            level['xmin'] = numpy.minimum.reduceat(children[:, 0], starts)
+            level['ymin'] = numpy.minimum.reduceat(children[:, 1], starts)
+            level['xmax'] = numpy.maximum.reduceat(children[:, 2], starts)
+            level['ymax'] = numpy.maximum.reduceat(children[:, 3], starts)
+            level['start'] = base + starts
+            level['stop'] = base + numpy.minimum(starts + capacity, children.shape[0])
+
+            if level.shape[0] > 1:
+                # order this level's nodes so that their parents can
+                # again take them in consecutive runs
+                level = level[_str_order(_boxes(level), capacity)]
+
+            base = levels[-1]
+            nodes.append(level)
+            levels.append(levels[-1] + level.shape[0])
+            if level.shape[0] == 1:
+                break
+            children = _boxes(level)
+
+        nodes = numpy.concatenate(nodes) if nodes else numpy.empty(0, dtype=NODE_DTYPE)
+        return cls(items, nodes, numpy.array(levels, dtype=numpy.int64), capacity)
+
+    def save(self, path, source=None):
+        """ Writes the tree to ``path``. If ``source`` (the indexed
+        file) is given, its modification time and size are recorded so
+        that `from_shapefile` can tell when the index is stale.
+        """
+
+        mtime, size = 0.0, -1
+        if source is not None:
+            info = os.stat(source)
+            mtime, size = info.st_mtime, info.st_size
+
+        header = _HEADER.pack(MAGIC, VERSION, self.capacity, self.items.shape[0],
+                              self.nodes.shape[0], self.levels.shape[0], mtime, size)
+
+        # written next to ``path`` and then moved over it, so that
+        # readers see either the old index or the whole new one
+        tmppath = '{}.{}-{}.tmp'.format(path, os.getpid(), get_ident())
+        try:
+            with open(tmppath, 'wb') as out:
+                out.write(header.ljust(_HEADER_SIZE, b'\0'))
+                out.write(self.levels.astype('<i8').tobytes())
+                out.write(self.items.tobytes())
+                out.write(self.nodes.tobytes())
+            replace(tmppath, path)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+    @staticmethod
+    def _read_header(path):
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER_SIZE)
+        if len(header) < _HEADER_SIZE:
+            raise ValueError("{} is not an R-tree index".format(path))
+        magic, version, capacity, nitems, nnodes, nlevels, mtime, size = \
+            _HEADER.unpack(header[:_HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not an R-tree index".format(path))
+        return capacity, nitems, nnodes, nlevels, mtime, size
+
+    @classmethod
+    def open(cls, path):
+        """ Memory-maps a tree written by `save`. """
+        capacity, nitems, nnodes, nlevels, _, _ = cls._read_header(path)
+
+        offset = _HEADER_SIZE
+        levels = numpy.fromfile(path, dtype='<i8', count=nlevels, offset=offset)
+        offset += levels.nbytes
+
+        def _map(dtype, count, offset):
+            if count == 0:
+                return numpy.empty(0, dtype=dtype)
+            return numpy.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+        items = _map(ITEM_DTYPE, nitems, offset)
+        nodes = _map(NODE_DTYPE, nnodes, offset + nitems * ITEM_DTYPE.itemsize)
+        return cls(items, nodes, levels, capacity)
+
+    @classmethod
+    def from_shapefile(cls, path, capacity=16, sidecar=True):
+        """ Index of the records of a shapefile.
+
+        Parameters
+        ----------
+        path : str
+            Path to the .shp file.
+        capacity : int (default = 16)
+            The maximum number of children per node of a new index.
+        sidecar : bool (default = True)
+            Reuse the index file next to the shapefile (see
+            `sidecar_path`) if it is up to date, and otherwise write a
+            new one. With False, or if the index file can't be written,
+            the index is only built in memory.
+
+        """
+
+        reader = shapefile.ShapefileReader(path)
+        indexpath = sidecar_path(reader.path)
+        if sidecar and os.path.exists(indexpath):
+            info = os.stat(reader.path)
+            try:
+                header = cls._read_header(indexpath)
+            except ValueError:
+                header = None
+            if header is not None and header[4:] == (info.st_mtime, info.st_size):
+                return cls.open(indexpath)
+
+        tree = cls.build(reader.bboxes(), capacity=capacity)
+        if sidecar:
+            try:
+                tree.save(indexpath, source=reader.path)
+            except OSError:
+                # e.g., a read-only directory: use the tree as it is
+                return tree
+            return cls.open(indexpath)
+        return tree
+
+    def intersects(self, bbox):
+        """ The ids of the items whose boxes intersect ``bbox``
+        (xmin, ymin, xmax, ymax), sorted.
+        """
+
+        if self.nodes.shape[0] == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        xmin, ymin, xmax, ymax = bbox
+        candidates = numpy.array([self.nodes.shape[0] - 1])
+        for depth in range(self.levels.shape[0] - 1):
+            node = self.nodes[candidates]
+            hit = ((node['xmin'] <= xmax) & (node['xmax'] >= xmin) &
+                   (node['ymin'] <= ymax) & (node['ymax'] >= ymin))
+            starts, stops = node['start'][hit], node['stop'][hit]
+            candidates = shapefile._ranges(starts, stops - starts, 1)
+
+        item = self.items[candidates]
+        hit = ((item['xmin'] <= xmax) & (item['xmax'] >= xmin) &
+               (item['ymin'] <= ymax) & (item['ymax'] >= ymin))
+        return numpy.sort(item['id'][hit])
+
+    def nearest(self, x, y, k=1):
+        """ The ids of the ``k`` items whose boxes are closest to the
+        point (x, y), nearest first. Points inside a box are at a
+        distance of zero from it.
+        """
+
+        if self.nodes.shape[0] == 0 or k < 1:
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        # entries are (distance, is_item, index); nodes sort before
+        # items at the same distance so ties are resolved fully
+        leaves = self.levels[1]
+        root = self.nodes.shape[0] - 1
+        heap = [(0.0, False, root)]
+        found = []
+        while heap and len(found) < k:
+            distance, is_item, index = heapq.heappop(heap)
+            if is_item:
+                found.append(self.items['id'][index])
+                continue
+
+            start, stop = int(self.nodes['start'][index]), int(self.nodes['stop'][index])
+            children = self.items if index < leaves else self.nodes
+            distances = _box_distance(children[start:stop], x, y)
+            for child, d in zip(range(start, stop), distances.tolist()):
+                heapq.heappush(heap, (d, index < leaves, child))
+
+        return numpy.array(found, dtype=numpy.int64)
@@ -0,0 +1,508 @@
+"""
+Bulk reading and writing of tables and feature classes as numpy arrays.
+"""
+
+import os
+import itertools
+from collections import namedtuple
+
+import numpy
+
+from arcutils import dbf
+from arcutils.crapy import check_arcpy
+from arcutils._compat import perf_counter
+
+# bound to the arcpy backend on the first call of a function decorated
+# with `check_arcpy` (see `crapy.set_backend`)
+arcpy = None
+
+
+# numpy dtypes of the arcpy field types that can be held in an array
+ARCPY_DTYPES = {
+    'OID': numpy.dtype('int32'),
+    'SmallInteger': numpy.dtype('int16'),
+    'Integer': numpy.dtype('int32'),
+    'Single': numpy.dtype('float32'),
+    'Double': numpy.dtype('float64'),
+    'Date': numpy.dtype('datetime64[us]'),
+    'GUID': numpy.dtype('U38'),
+    'GlobalID': numpy.dtype('U38'),
+}
+
+# what nulls become, by dtype kind, unless told otherwise
+NULL_VALUES = {
+    'f': numpy.nan,
+    'U': u'',
+    'M': numpy.datetime64('NaT'),
+}
+
+
+def _arcpy_dtype(field):
+    if field.type == 'String':
+        return numpy.dtype('U{}'.format(max(field.length, 1)))
+    return ARCPY_DTYPES.get(field.type)
+
+
+def _oid_name(path):
+    return u'FID' if os.path.splitext(path)[1].lower() == '.shp' else u'OID'
+
+
+def _dbase_dtype(path, fields):
+    header = dbf.read_header(path)
+    lookup = dict((f.name, dbf.field_dtype(f)) for f in header.fields)
+    for name, dtype in lookup.items():
+        if dtype.kind == 'M':
+            # dates come out the same as through arcpy
+            lookup[name] = ARCPY_DTYPES['Date']
+    lookup[_oid_name(path)] = numpy.dtype('int64')
+    if fields is None:
+        fields = [_oid_name(path)] + [f.name for f in header.fields]
+
+    missing = [name for name in fields if name not in lookup]
+    if missing:
+        raise ValueError("fields {} not in {}".format(missing, path))
+    return numpy.dtype([(name, lookup[name]) for name in fields])
+
+
+@check_arcpy
+def _arcpy_dtype_and_nulls(layer, fields):
+    lookup = dict((f.name, f) for f in arcpy.ListFields(layer))
+    if fields is None:
+        fields = [name for name, f in lookup.items() if _arcpy_dtype(f) is not None]
+
+    dtypes, nullable = [], []
+    for name in fields:
+        field = lookup.get(name)
+        if field is None:
+            raise ValueError("field {} not in {}".format(name, layer))
+        dtype = _arcpy_dtype(field)
+        if dtype is None:
+            raise ValueError("field {} of type {} can't be read into an array".format(name, field.type))
+        dtypes.append((name, dtype))
+        nullable.append(bool(getattr(field, 'isNullable', True)))
+    return numpy.dtype(dtypes), nullable
+
+
+def table_dtype(layer, fields=None):
+    """ Infers the numpy structured dtype of (some of) the fields of a
+    table or feature class.
+
+    Parameters
+    ----------
+    layer : str, arcpy.mapping.Layer, or arcpy table
+        Shapefiles and dBASE tables are handled without arcpy.
+    fields : list of str, optional
+        The fields to include. By default, every field that can be held
+        in an array (geometry, blob, and raster fields are skipped).
+
+    Returns
+    -------
+    dtype : numpy.dtype
+
+    """
+
+    from arcutils.catalog import is_dataset
+
+    if is_dataset(layer):
+        return _dbase_dtype(layer, fields)
+    return _arcpy_dtype_and_nulls(layer, fields)[0]
+
+
+def _blanks(values):
+    """ The null (blank) values of a column read from a dBASE table. """
+    if values.dtype.kind == 'f':
+        return numpy.isnan(values)
+    elif values.dtype.kind == 'M':
+        return numpy.isnat(values)
+    elif values.dtype.kind == 'U':
+        return values == u''
+    return numpy.zeros(values.shape, dtype=bool)
+
+
+def _iter_dbase(path, fields, chunksize, null_values):
+    dtype = _dbase_dtype(path, fields)
+    null_values = null_values or {}
+    oid = _oid_name(path)
+    dbffields = [name for name in dtype.names if name != oid]
+    numrecords = dbf.read_header(path).numrecords
+
+    for start in range(0, numrecords, chunksize):
+        stop = min(start + chunksize, numrecords)
+        # records flagged as deleted are skipped, but keep their FIDs
+        numbers = dbf.record_numbers(path, rows=slice(start, stop))
+        columns = dbf.read_dbf(path, fields=dbffields, rows=slice(start, stop))
+        chunk = numpy.empty(numbers.shape[0], dtype=dtype)
+        for name in dtype.names:
+            if name == oid:
+                chunk[name] = numbers
+                continue
+
+            values = columns[name]
+            blanks = _blanks(values)
+            if dtype[name].kind == 'i' and values.dtype.kind == 'f':
+                # like arcpy, blank numbers in a shapefile read as zero
+                values = numpy.where(blanks, 0, values)
+            chunk[name] = values
+            if name in null_values:
+                chunk[name][blanks] = null_values[name]
+        yield chunk
+
+
+@check_arcpy
+def _iter_arcpy(layer, fields, chunksize, null_values):
+    dtype, nullable = _arcpy_dtype_and_nulls(layer, fields)
+    null_values = null_values or {}
+    fills = tuple(
+        null_values.get(name, NULL_VALUES.get(dtype[name].kind))
+        for name in dtype.names
+    )
+
+    with arcpy.da.SearchCursor(layer, list(dtype.names)) as cursor:
+        rows = iter(cursor)
+        if any(nullable):
+            rows = (
+                tuple(fill if value is None else value for value, fill in zip(row, fills))
+                for row in rows
+            )
+
+        while True:
+            chunk = numpy.fromiter(itertools.islice(rows, chunksize), dtype=dtype)
+            if chunk.shape[0] == 0:
+                break
+            yield chunk
+            if chunk.shape[0] < chunksize:
+                break
+
+
+def iter_table(layer, fields=None, chunksize=100000, null_values=None):
+    """ Reads a table or feature class in chunks of numpy structured
+    arrays, so that memory use is bounded by ``chunksize``.
+
+    Parameters
+    ----------
+    layer : str, arcpy.mapping.Layer, or arcpy table
+        The thing that has rows. Shapefiles and dBASE tables are read
+        straight from the memory-mapped .dbf (no arcpy needed);
+        everything else goes through ``arcpy.da.SearchCursor``.
+    fields : list of str, optional
+        The fields to read. By default, every field that can be held in
+        an array (see `table_dtype`).
+    chunksize : int (default = 100000)
+        The maximum number of rows per chunk.
+    null_values : dict, optional
+        Maps field names to the values that replace their nulls.
+        Floating point, text, and date fields default to NaN, an empty
+        string, and NaT; integer fields with nulls need an entry here.
+        dBASE tables have no nulls, so there these replace blanks
+        (which read as zero in integer fields, like through arcpy).
+
+    Yields
+    ------
+    chunk : numpy.ndarray
+        Structured array with one named column per field. Dates are
+        ``datetime64[us]`` whichever way the table is read.
+
+    Examples
+    --------
+    >>> from arcutils import table
+    >>> for chunk in table.iter_table('C:/gis/stations.shp', ['Station', 'Latitude']):
+    ...     print(chunk['Latitude'].mean())
+
+    """
+
+    from arcutils.catalog import is_dataset
+
+    if is_dataset(layer):
+        return _iter_dbase(layer, fields, chunksize, null_values)
+    return _iter_arcpy(layer, fields, chunksize, null_values)
+
+
+@check_arcpy
+def _count_rows(layer):
+    return int(arcpy.GetCount_management(layer).getOutput(0))
+
+
+def read_table(layer, fields=None, chunksize=100000, null_values=None):
+    """ Reads a whole table or feature class into a numpy structured
+    array.
+
+    The number of rows is looked up first so that the output can be
+    allocated once and filled chunk by chunk, instead of growing it or
+    building a list of rows.
+
+    Parameters
+    ----------
+    layer : str, arcpy.mapping.Layer, or arcpy table
+        The thing that has rows.
+    fields : list of str, optional
+        The fields to read.
+    chunksize : int (default = 100000)
+        The number of rows converted at a time.
+    null_values : dict, optional
+        Maps field names to the values that replace their nulls (see
+        `iter_table`).
+
+    Returns
+    -------
+    table : numpy.ndarray
+
+    """
+
+    from arcutils.catalog import is_dataset
+
+    if is_dataset(layer):
+        nrows = dbf.read_header(layer).numrecords
+    else:
+        nrows = _count_rows(layer)
+
+    result = numpy.empty(nrows, dtype=table_dtype(layer, fields))
+    filled = 0
+    for chunk in iter_table(layer, fields, chunksize=chunksize, null_values=null_values):
+        if filled + chunk.shape[0] > nrows:
+            # the table grew since it was counted
+            result = numpy.concatenate([result[:filled], chunk])
+        else:
+            result[filled:filled + chunk.shape[0]] = chunk
+        filled += chunk.shape[0]
+
+    return result[:filled]
+
+
+WriteStats = namedtuple('WriteStats', ('rows', 'flushes', 'seconds', 'rate'))
+
+
+class MemoryTarget(object):
+    """ In-memory stand-in for a table that `BulkWriter` can write to
+    without arcpy. Rows only show up in ``rows`` once the writer's
+    session is committed; ``batches`` holds the size of each flush.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields
+        self.rows = []
+        self.batches = []
+        self._pending = None
+
+    def begin(self):
+        self._pending = []
+
+    def insert(self, rows):
+        self._pending.extend(rows)
+        self.batches.append(len(rows))
+
+    def commit(self):
+        self.rows.extend(self._pending)
+        self._pending = None
+
+    def rollback(self):
+        self._pending = None
+
+
+class _ArcpyTarget(object):
+    """ Writes to a table or feature class through a single insert
+    cursor inside an edit session.
+    """
+
+    def __init__(self, layer, fields, workspace=None):
+        self.layer = layer
+        self.fields = fields
+        self.workspace = workspace
+        self._editor = None
+        self._cursor = None
+
+    @check_arcpy
+    def begin(self):
+        workspace = self.workspace or arcpy.Describe(self.layer).path
+        editor = arcpy.da.Editor(workspace)
+        editor.startEditing(False, False)
+        try:
+            editor.startOperation()
+            try:
+                self._cursor = arcpy.da.InsertCursor(self.layer, self.fields)
+            except Exception:
+                editor.abortOperation()
+                raise
+        except Exception:
+            # don't leave the workspace in an edit session
+            editor.stopEditing(False)
+            raise
+        self._editor = editor
+
+    def insert(self, rows):
+        insertRow = self._cursor.insertRow
+        for row in rows:
+            insertRow(row)
+
+    def _finish(self, save):
+        # deleting the cursor releases its lock on the table
+        self._cursor = None
+        if save:
+            self._editor.stopOperation()
+        else:
+            self._editor.abortOperation()
+        self._editor.stopEditing(save)
+        self._editor = None
+
+    def commit(self):
+        self._finish(True)
+
+    def rollback(self):
+        self._finish(False)
+
+
+class BulkWriter(object):
+    """ Buffers rows and writes them to a table in batches, all or
+    nothing.
+
+    Rows are collected until ``buffersize`` of them are waiting and are
+    then flushed to the target together. With arcpy, every flush goes
+    through the same insert cursor inside one edit session, which is
+    saved when the ``with`` block exits normally and discarded if it
+    raises.
+
+    Parameters
+    ----------
+    target : str, arcpy.mapping.Layer, or MemoryTarget
+        The table or feature class that receives the rows.
+    fields : list of str
+        The fields (or geometry tokens such as ``'SHAPE@XY'``) that
+        make up each row. Optional for a `MemoryTarget` that has them.
+    buffersize : int (default = 10000)
+        The number of rows per flush.
+    workspace : str, optional
+        The workspace of the edit session. Defaults to the one that
+        contains ``target``.
+
+    Examples
+    --------
+    >>> from arcutils import table
+    >>> with table.BulkWriter('C:/gis/sites.gdb/pts', ['SHAPE@XY', 'depth']) as writer:
+    ...     writer.write_coords(xy, depths)
+    ...     writer.write(((10.0, 20.0), 3.5))
+    >>> print(writer.stats().rate)
+
+    """
+
+    def __init__(self, target, fields=None, buffersize=10000, workspace=None):
+        if hasattr(target, 'insert'):
+            fields = fields or target.fields
+        elif fields is None:
+            raise ValueError("`fields` is required when writing to {}".format(target))
+        else:
+            target = _ArcpyTarget(target, fields, workspace)
+
+        self.target = target
+        self.fields = list(fields) if fields is not None else None
+        self.buffersize = buffersize
+        self._buffer = []
+        self._open = False
+        self._rows = 0
+        self._flushes = 0
+        self._started = None
+        self._stopped = None
+
+    def __enter__(self):
+        self.target.begin()
+        self._open = True
+        self._started = perf_counter()
+        self._stopped = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                try:
+                    self.flush()
+                    self.target.commit()
+                except BaseException:
+                    # e.g., the last batch was rejected: nothing is kept
+                    self.target.rollback()
+                    raise
+            else:
+                self.target.rollback()
+        finally:
+            self._buffer = []
+            self._open = False
+            self._stopped = perf_counter()
+
+    def _extend(self, rows):
+        if not self._open:
+            raise RuntimeError("BulkWriter must be used in a `with` block")
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.buffersize:
+            self._insert(self.buffersize)
+
+    def write(self, row):
+        """ Buffers a single row (a sequence with one value per field).
+        """
+        self._extend([tuple(row)])
+
+    def write_rows(self, rows):
+        """ Buffers an iterable of rows.
+        """
+        rows = iter(rows)
+        while True:
+            batch = [tuple(row) for row in itertools.islice(rows, self.buffersize)]
+            if not batch:
+                break
+            self._extend(batch)
+
+    def write_array(self, array):
+        """ Buffers the rows of a numpy structured array. Its fields are
+        matched to the writer's fields by name.
+        """
+        if self.fields is not None:
+            missing = [name for name in self.fields if name not in array.dtype.names]
+            if missing:
+                raise ValueError("fields {} not in the array".format(missing))
+            array = array[self.fields]
+
+        for start in range(0, array.shape[0], self.buffersize):
+            self._extend(array[start:start + self.buffersize].tolist())
+
+    def write_coords(self, coords, *columns):
+        """ Buffers one point per row of ``coords`` (an array of x, y
+        (and z) coordinates), which becomes the first value of each
+        row (e.g., for ``'SHAPE@XY'``). ``columns`` hold the values of
+        the remaining fields.
+        """
+        coords = numpy.asarray(coords, dtype=float)
+        if coords.ndim != 2 or coords.shape[1] not in (2, 3):
+            raise ValueError("`coords` must have shape (N, 2) or (N, 3)")
+
+        columns = [numpy.asarray(col) for col in columns]
+        if any(col.shape[0] != coords.shape[0] for col in columns):
+            raise ValueError("`columns` must be as long as `coords`")
+
+        for start in range(0, coords.shape[0], self.buffersize):
+            stop = start + self.buffersize
+            points = map(tuple, coords[start:stop].tolist())
+            values = [col[start:stop].tolist() for col in columns]
+            self._extend(list(zip(points, *values)))
+
+    def flush(self):
+        """ Writes the buffered rows to the target.
+        """
+        if self._buffer:
+            self._insert(len(self._buffer))
+
+    def _insert(self, count):
+        if not self._open:
+            raise RuntimeError("BulkWriter must be used in a `with` block")
+
+        batch = self._buffer[:count]
+        del self._buffer[:count]
+        self.target.insert(batch)
+        self._rows += len(batch)
+        self._flushes += 1
+
+    def stats(self):
+        """ The number of rows written so far, the number of flushes,
+        the elapsed time (seconds), and the rate (rows per second).
+        """
+        if self._started is None:
+            seconds = 0.0
+        else:
+            seconds = (self._stopped or perf_counter()) - self._started
+        rate = self._rows / seconds if seconds > 0 else 0.0
+        return WriteStats(self._rows, self._flushes, seconds, rate)
@@ -0,0 +1,357 @@
+"""
+Benchmarks of arcutils' hot paths against synthetic data sets of 10**2
+to 10**6 features, using `fakearcpy` wherever arcpy would be needed.
+
+Results are saved as JSON so that two versions can be compared on the
+same machine::
+
+    python -m arcutils.tests.benchmarks -o baseline.json
+    # ... change things ...
+    python -m arcutils.tests.benchmarks -o current.json --baseline baseline.json
+
+The second run exits with status 1 if any benchmark got slower than the
+baseline by more than the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import fnmatch
+import argparse
+import platform
+import tempfile
+from collections import OrderedDict
+
+import numpy
+
+import arcutils
+from arcutils import crapy
+from arcutils import mapping
+from arcutils import raster
+from arcutils import tetris
+from arcutils.tests import fakearcpy
+
+
+SIZES = (10**2, 10**3, 10**4, 10**5, 10**6)
+
+# name -> (setup, maxsize)
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, maxsize=None):
+    """ Registers a benchmark. The decorated function is called with the
+    data set size and a scratch directory, does any setup, and returns
+    the zero-argument callable to time.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, maxsize)
+        return setup
+    return decorator
+
+
+def write_points(path, size, seed=0):
+    """ Writes a point shapefile of ``size`` random points with an
+    integer ``ID`` and a floating point ``value`` field.
+    """
+
+    random = numpy.random.RandomState(seed)
+    xy = random.uniform(0, 1e5, size=(size, 2))
+    xmin, ymin = xy.min(axis=0) if size else (0, 0)
+    xmax, ymax = xy.max(axis=0) if size else (0, 0)
+
+    def header(nbytes):
+        return (struct.pack('>i20xi', 9994, nbytes // 2) +
+                struct.pack('<ii4d32x', 1000, 1, xmin, ymin, xmax, ymax))
+
+    records = numpy.zeros(size, dtype=[('num', '>i4'), ('len', '>i4'), ('type', '<i4'),
+                                       ('x', '<f8'), ('y', '<f8')])
+    records['num'] = numpy.arange(1, size + 1)
+    records['len'] = 10
+    records['type'] = 1
+    records['x'], records['y'] = xy[:, 0], xy[:, 1]
+    with open(path, 'wb') as shp:
+        shp.write(header(100 + records.nbytes))
+        shp.write(records.tobytes())
+
+    index = numpy.zeros(size, dtype=[('offset', '>i4'), ('len', '>i4')])
+    index['offset'] = (100 + 28 * numpy.arange(size)) // 2
+    index['len'] = 10
+    with open(os.path.splitext(path)[0] + '.shx', 'wb') as shx:
+        shx.write(header(100 + index.nbytes))
+        shx.write(index.tobytes())
+
+    fields = [(b'ID', b'N', 10, 0), (b'value', b'N', 19, 11)]
+    recordlength = 1 + sum(f[2] for f in fields)
+    headerlength = 32 + 32 * len(fields) + 1
+    rows = numpy.zeros(size, dtype=[('flag', 'S1'), ('ID', 'S10'), ('value', 'S19')])
+    rows['flag'] = b' '
+    rows['ID'] = numpy.char.mod('%10d', numpy.arange(size))
+    rows['value'] = numpy.char.mod('%19.11f', random.normal(size=size))
+    with open(os.path.splitext(path)[0] + '.dbf', 'wb') as dbf:
+        dbf.write(struct.pack('<4BIHH20x', 3, 116, 1, 1, size, headerlength, recordlength))
+        for name, ftype, length, decimals in fields:
+            dbf.write(struct.pack('<11sc4xBB14x', name, ftype, length, decimals))
+        dbf.write(b'\r')
+        dbf.write(rows.tobytes())
+        dbf.write(b'\x1a')
+
+    return path
+
+
+def _points(workdir, size):
+    path = os.path.join(workdir, 'points_{}.shp'.format(size))
+    if not os.path.exists(path):
+        write_points(path, size)
+    return path
+
+
+@benchmark('load_data[asarrays]')
+def bench_load_data(size, workdir):
+    path = _points(workdir, size)
+    return lambda: mapping.load_data(path, 'shape', asarrays=True)
+
+
+@benchmark('get_field_names')
+def bench_get_field_names(size, workdir):
+    path = _points(workdir, size)
+    return lambda: crapy.get_field_names(path)
+
+
+def _tetris_source(size):
+    random = numpy.random.RandomState(0)
+    xy = random.uniform(0, 1e5, size=(size, 2)).tolist()
+    data = random.normal(size=(size, 4)).tolist()
+    rows = [('loc{}'.format(n), x, y) + tuple(d) for n, ((x, y), d) in enumerate(zip(xy, data))]
+    fakearcpy.create_table('tetris_src', rows, ['loc', 'x', 'y', 'A', 'B', 'C', 'D'])
+
+
+def _tetris(vectorized):
+    def run():
+        fakearcpy.create_table('tetris_dst', [], ['SHAPE@', 'loc', 'result', 'interval'],
+                               types=['Geometry', 'String', 'Double', 'String'])
+        tetris.tetris_plot('tetris_src', 1.5, ['loc', 'x', 'y', 'A', 'B', 'C', 'D'],
+                           ['A', 'B', 'C', 'D'], dstlayer='tetris_dst', vectorized=vectorized)
+    return run
+
+
+@benchmark('tetris_plot[loop]', maxsize=10**5)
+def bench_tetris_loop(size, workdir):
+    _tetris_source(size)
+    return _tetris(False)
+
+
+@benchmark('tetris_plot[vectorized]', maxsize=10**5)
+def bench_tetris_vectorized(size, workdir):
+    _tetris_source(size)
+    return _tetris(True)
+
+
+@benchmark('tetris_plot[incremental refresh]', maxsize=10**5)
+def bench_tetris_incremental(size, workdir):
+    # a nightly refresh: 1% of the stations get new values
+    _tetris_source(size)
+    fields = ['loc', 'x', 'y', 'A', 'B', 'C', 'D']
+    fakearcpy.create_table('tetris_dst', [], ['SHAPE@', 'loc', 'result', 'interval', 'srchash'],
+                           types=['Geometry', 'String', 'Double', 'String', 'String'])
+    tetris.tetris_plot('tetris_src', 1.5, fields, fields[3:], dstlayer='tetris_dst',
+                       incremental=True)
+
+    rows = fakearcpy.get_table('tetris_src').rows
+    changed = numpy.random.RandomState(1).choice(size, max(size // 100, 1), replace=False)
+
+    def run():
+        for n in changed.tolist():
+            rows[n] = rows[n][:3] + (rows[n][3] + 1,) + rows[n][4:]
+        tetris.tetris_plot('tetris_src', 1.5, fields, fields[3:], dstlayer='tetris_dst',
+                           incremental=True)
+    return run
+
+
+def _mapdoc(size):
+    for n in range(min(size, 10)):
+        fakearcpy.create_table('new{}'.format(n), [], ['A'], types=['Double'])
+    fakearcpy.create_table('layer', [], ['A'], types=['Double'])
+
+    layers = []
+    for n in range(size):
+        layer = fakearcpy.Layer('layer')
+        layer.name = layer.longName = 'layer{}'.format(n)
+        layers.append(layer)
+
+    ezmd = mapping.EasyMapDoc('CURRENT')
+    ezmd.mapdoc.layers = layers
+    names = ['layer{}'.format(n) for n in numpy.random.RandomState(0).randint(0, size, 1000)]
+    return ezmd, names
+
+
+@benchmark('EasyMapDoc.findLayerByName')
+def bench_find_layer(size, workdir):
+    ezmd, names = _mapdoc(size)
+
+    def run():
+        ezmd.refresh()
+        for name in names:
+            ezmd.findLayerByName(name)
+    return run
+
+
+@benchmark('EasyMapDoc.add_layer')
+def bench_add_layer(size, workdir):
+    ezmd, names = _mapdoc(size)
+    ezmd.refresh()
+
+    def run():
+        for n in range(10):
+            ezmd.add_layer('new{}'.format(n))
+            ezmd.findLayerByName('new{}'.format(n))
+    return run
+
+
+def _grid(size):
+    side = int(numpy.ceil(numpy.sqrt(size)))
+    return numpy.random.RandomState(0).normal(size=(side, side)).astype(numpy.float32)
+
+
+@benchmark('raster[geotiff round trip]')
+def bench_raster_geotiff(size, workdir):
+    grid = _grid(size)
+    template = crapy.RasterTemplate(10.0, 0.0, 0.0)
+    path = os.path.join(workdir, 'grid_{}.tif'.format(size))
+
+    def run():
+        raster.write_raster(path, template, grid)
+        source = raster.RasterFile(path)
+        return source.read(raster.Window(0, 0, source.shape[0], source.shape[1]))
+    return run
+
+
+@benchmark('raster[arcpy round trip]')
+def bench_raster_arcpy(size, workdir):
+    grid = _grid(size)
+
+    def run():
+        ras = fakearcpy.NumPyArrayToRaster(grid, fakearcpy.Point(0.0, 0.0), 10.0)
+        return sum(float(block.sum()) for _, block in raster.iter_blocks(ras))
+    return run
+
+
+def _time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(sizes=SIZES, pattern='*', repeat=3, all_sizes=False, workdir=None, log=None):
+    """ Runs the benchmarks whose names match ``pattern`` at every size.
+
+    Benchmarks are skipped at sizes above their ``maxsize`` (e.g., the
+    tetris plots, which build 4 polygons per feature) unless
+    ``all_sizes`` is True. Sizes of 10**5 and up are only timed once.
+
+    Returns
+    -------
+    results : dict
+        ``{'meta': {...}, 'results': {name: {size: {'best', 'median',
+        'times'}}}}``, ready for `json.dump`.
+
+    """
+
+    results = OrderedDict()
+    with crapy.ArcpyBackend(fakearcpy), \
+            tempfile.TemporaryDirectory(dir=workdir) as scratch:
+        for name, (setup, maxsize) in BENCHMARKS.items():
+            if not fnmatch.fnmatch(name, pattern):
+                continue
+
+            results[name] = OrderedDict()
+            for size in sizes:
+                if maxsize is not None and size > maxsize and not all_sizes:
+                    continue
+
+                fakearcpy.reset()
+                func = setup(size, scratch)
+                times = _time(func, repeat if size < 10**5 else 1)
+                results[name][str(size)] = {
+                    'best': min(times),
+                    'median': float(numpy.median(times)),
+                    'times': times,
+                }
+                if log is not None:
+                    log('{:<32s} {:>9,d} {:10.4f} s'.format(name, size, min(times)))
+
+    meta = OrderedDict([
+        ('arcutils', arcutils.__version__),
+        ('python', platform.python_version()),
+        ('numpy', numpy.__version__),
+        ('platform', platform.platform()),
+        ('machine', platform.machine()),
+        ('created', time.strftime('%Y-%m-%dT%H:%M:%S')),
+    ])
+    return OrderedDict([('meta', meta), ('results', results)])
+
+
+def compare(current, baseline, tolerance=0.25):
+    """ Finds the benchmarks that got slower than ``baseline``.
+
+    Returns
+    -------
+    regressions : list of tuples
+        ``(name, size, baseline_best, current_best)`` for every
+        benchmark whose best time grew by more than ``tolerance``
+        (a fraction). Benchmarks missing from either run are ignored.
+
+    """
+
+    regressions = []
+    for name, sizes in current['results'].items():
+        for size, result in sizes.items():
+            try:
+                before = baseline['results'][name][size]['best']
+            except KeyError:
+                continue
+            if result['best'] > before * (1 + tolerance):
+                regressions.append((name, int(size), before, result['best']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-s', '--sizes', default=','.join(map(str, SIZES)),
+                        help='comma-separated data set sizes')
+    parser.add_argument('-k', '--pattern', default='*',
+                        help='only run the benchmarks matching this glob')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--all-sizes', action='store_true',
+                        help='ignore the size limits of the slow benchmarks')
+    parser.add_argument('-o', '--output', help='JSON file for the results')
+    parser.add_argument('-b', '--baseline', help='JSON results to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='allowed slowdown relative to the baseline (fraction)')
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(s)) for s in args.sizes.split(',')]
+    results = run(sizes, pattern=args.pattern, repeat=args.repeat,
+                  all_sizes=args.all_sizes, log=print)
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(results, out, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, size, before, after in regressions:
+            print('SLOWER: {} at {:,d}: {:.4f} s -> {:.4f} s ({:+.0%})'.format(
+                name, size, before, after, after / before - 1))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
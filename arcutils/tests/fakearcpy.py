@@ -0,0 +1,374 @@
+"""
+A small, numpy-backed stand-in for the parts of arcpy that arcutils
+uses, so that tests and benchmarks can exercise the arcpy code paths
+without ArcGIS.
+
+Use it as a backend:
+
+>>> from arcutils import crapy
+>>> from arcutils.tests import fakearcpy
+>>> with crapy.ArcpyBackend(fakearcpy):
+...     fakearcpy.create_table('stations', rows, ['loc', 'x', 'y'])
+...     crapy.get_field_names('stations')
+
+Tables and feature classes live in memory (see `create_table`).
+Shapefiles, dBASE tables, and GeoTIFFs on disk are read with arcutils'
+own readers.
+"""
+
+import os
+import copy
+import fnmatch
+from types import SimpleNamespace
+
+import numpy
+
+from arcutils import catalog
+from arcutils import dbf
+from arcutils import raster as _raster
+
+
+# in-memory tables, by name
+_tables = {}
+
+# messages sent with AddMessage
+messages = []
+
+env = SimpleNamespace(overwriteOutput=False, workspace=None)
+
+
+def reset():
+    """ Forgets every in-memory table and message. """
+    _tables.clear()
+    del messages[:]
+    env.overwriteOutput = False
+    env.workspace = None
+
+
+def AddMessage(msg):
+    messages.append(msg)
+
+
+class Point(object):
+    def __init__(self, X=0.0, Y=0.0):
+        self.X = X
+        self.Y = Y
+
+
+class Array(list):
+    pass
+
+
+class Polygon(object):
+    def __init__(self, array):
+        # an Array of Points, or an Array of Arrays for several parts
+        if len(array) and isinstance(array[0], Array):
+            self.parts = [numpy.array([(p.X, p.Y) for p in ring], dtype=float).reshape(-1, 2)
+                          for ring in array]
+            self.coords = numpy.concatenate(self.parts)
+        else:
+            self.coords = numpy.array([(p.X, p.Y) for p in array], dtype=float)
+            self.parts = [self.coords]
+
+    @property
+    def area(self):
+        twice = 0.0
+        for ring in self.parts:
+            x, y = ring[:, 0], ring[:, 1]
+            twice += numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(y, numpy.roll(x, -1))
+        return 0.5 * abs(twice)
+
+
+class Extent(object):
+    def __init__(self, XMin=None, YMin=None, XMax=None, YMax=None):
+        self.XMin = XMin
+        self.YMin = YMin
+        self.XMax = XMax
+        self.YMax = YMax
+
+    @property
+    def lowerLeft(self):
+        return Point(self.XMin, self.YMin)
+
+
+class Field(object):
+    def __init__(self, name, type, length=8, isNullable=True):
+        self.name = name
+        self.type = type
+        self.length = length
+        self.isNullable = isNullable
+
+
+class _Result(object):
+    def __init__(self, value):
+        self._value = value
+
+    def getOutput(self, index):
+        return str(self._value)
+
+
+class _Table(object):
+    def __init__(self, fields, rows):
+        self.fields = fields
+        self.rows = rows
+
+
+def _field_type(values):
+    kind = numpy.asarray(values).dtype.kind
+    if kind in 'iu':
+        return 'Integer'
+    elif kind == 'f':
+        return 'Double'
+    elif kind == 'M':
+        return 'Date'
+    return 'String'
+
+
+def create_table(name, rows, fields, types=None):
+    """ Creates (or replaces) an in-memory table.
+
+    Parameters
+    ----------
+    name : str
+        How the table is referred to (e.g., by ``da.SearchCursor``).
+    rows : list of tuples
+        The records.
+    fields : list of str
+        The field names.
+    types : list of str, optional
+        The arcpy field types. Inferred from the first row by default.
+
+    """
+
+    if types is None:
+        first = rows[0] if rows else (0.0,) * len(fields)
+        types = [_field_type(value) for value in first]
+    fieldlist = [Field(u'OID', 'OID', 4, False)]
+    fieldlist += [Field(n, t, 254 if t == 'String' else 8) for n, t in zip(fields, types)]
+    _tables[name] = _Table(fieldlist, list(rows))
+    return _tables[name]
+
+
+def get_table(name):
+    return _tables[name]
+
+
+def _dbase_fields(path):
+    fields = [Field(u'FID', 'OID', 4, False)]
+    if os.path.splitext(path)[1].lower() == '.shp':
+        fields.append(Field(u'Shape', 'Geometry', 0, True))
+    for f in dbf.read_header(path).fields:
+        fields.append(Field(f.name, catalog.field_type(f), f.length, True))
+    return fields
+
+
+def ListFields(dataset):
+    if dataset in _tables:
+        return list(_tables[dataset].fields)
+    elif catalog.is_dataset(dataset):
+        return _dbase_fields(dataset)
+    raise IOError("{} does not exist".format(dataset))
+
+
+def GetCount_management(dataset):
+    if dataset in _tables:
+        return _Result(len(_tables[dataset].rows))
+    return _Result(dbf.read_header(dataset).numrecords)
+
+
+def CheckExtension(name):
+    return u'Available'
+
+
+def CheckOutExtension(name):
+    return u'CheckedOut'
+
+
+def CheckInExtension(name):
+    return u'CheckedIn'
+
+
+def Describe(dataset):
+    return SimpleNamespace(path=os.path.dirname(str(dataset)) or 'in_memory')
+
+
+class Raster(object):
+    """ A grid held in memory, loaded from a GeoTIFF or made by
+    `NumPyArrayToRaster`.
+    """
+
+    def __init__(self, path=None, array=None, xmin=0.0, ymin=0.0,
+                 cellsize=1.0, nodata=None):
+        if path is not None:
+            if not os.path.exists(path):
+                raise RuntimeError("{} does not exist".format(path))
+            source = _raster.RasterFile(path)
+            array = source.read(_raster.Window(0, 0, source.shape[0], source.shape[1]))
+            cellsize, nodata = source.cellsize, source.nodata
+            xmin, ymin = source.xmin, source.ymax - source.shape[0] * cellsize
+
+        self.array = numpy.asarray(array)
+        self.height, self.width = self.array.shape
+        self.meanCellWidth = self.meanCellHeight = cellsize
+        self.noDataValue = nodata
+        self.extent = Extent(xmin, ymin, xmin + self.width * cellsize,
+                             ymin + self.height * cellsize)
+
+
+def RasterToNumPyArray(raster, lower_left_corner=None, ncols=None, nrows=None,
+                       nodata_to_value=None):
+    cellsize = raster.meanCellWidth
+    if lower_left_corner is None:
+        col0, row1 = 0, raster.height
+    else:
+        col0 = int(round((lower_left_corner.X - raster.extent.XMin) / cellsize))
+        row1 = int(round((raster.extent.YMax - lower_left_corner.Y) / cellsize))
+    ncols = raster.width - col0 if ncols is None else ncols
+    nrows = row1 if nrows is None else nrows
+    return raster.array[row1 - nrows:row1, col0:col0 + ncols].copy()
+
+
+def NumPyArrayToRaster(array, lower_left_corner=None, x_cell_size=1.0,
+                       y_cell_size=None, value_to_nodata=None):
+    corner = lower_left_corner or Point(0.0, 0.0)
+    return Raster(array=array, xmin=corner.X, ymin=corner.Y,
+                  cellsize=x_cell_size, nodata=value_to_nodata)
+
+
+class _Cursor(object):
+    def __init__(self, dataset, field_names):
+        self.table = _tables[dataset]
+        names = [f.name for f in self.table.fields[1:]]
+        self.columns = []
+        for name in field_names:
+            if name in ('OID@', 'OID'):
+                self.columns.append(None)
+            else:
+                self.columns.append(names.index(name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class _SearchCursor(_Cursor):
+    def __iter__(self):
+        columns = self.columns
+        for oid, row in enumerate(self.table.rows, 1):
+            yield tuple(oid if c is None else row[c] for c in columns)
+
+
+class _InsertCursor(_Cursor):
+    def insertRow(self, row):
+        self.table.rows.append(tuple(row))
+        return len(self.table.rows)
+
+
+class _UpdateCursor(_Cursor):
+    def __iter__(self):
+        rows = self.table.rows
+        self._index = 0
+        while self._index < len(rows):
+            self._deleted = False
+            row = rows[self._index]
+            yield tuple(self._index + 1 if c is None else row[c] for c in self.columns)
+            if not self._deleted:
+                self._index += 1
+
+    def updateRow(self, values):
+        row = list(self.table.rows[self._index])
+        for c, value in zip(self.columns, values):
+            if c is not None:
+                row[c] = value
+        self.table.rows[self._index] = tuple(row)
+
+    def deleteRow(self):
+        del self.table.rows[self._index]
+        self._deleted = True
+
+
+class _Editor(object):
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.isEditing = False
+
+    def startEditing(self, with_undo=True, multiuser_mode=True):
+        self.isEditing = True
+
+    def stopEditing(self, save_changes=True):
+        self.isEditing = False
+
+    def startOperation(self):
+        pass
+
+    def stopOperation(self):
+        pass
+
+    def abortOperation(self):
+        pass
+
+
+da = SimpleNamespace(
+    SearchCursor=_SearchCursor,
+    InsertCursor=_InsertCursor,
+    UpdateCursor=_UpdateCursor,
+    Editor=_Editor,
+)
+
+
+class Layer(object):
+    def __init__(self, path):
+        if not (os.path.exists(str(path)) or path in _tables):
+            raise ValueError("{} does not exist".format(path))
+        self.dataSource = path
+        self.name = os.path.splitext(os.path.basename(str(path)))[0]
+        self.longName = self.name
+        self.isGroupLayer = False
+        self.isRasterLayer = os.path.splitext(str(path))[1].lower() in ('.tif', '.tiff')
+
+
+class DataFrame(object):
+    def __init__(self, mapdoc, name='Layers'):
+        self.mapdoc = mapdoc
+        self.name = name
+
+
+class MapDocument(object):
+    def __init__(self, path='CURRENT'):
+        self.filePath = path
+        self.layers = []
+        self.dataframes = [DataFrame(self)]
+
+
+def ListLayers(mapdoc, wildcard=None, df=None):
+    return [
+        lyr for lyr in mapdoc.layers
+        if (wildcard is None or fnmatch.fnmatchcase(lyr.name, wildcard))
+        and (df is None or lyr._df is df)
+    ]
+
+
+def ListDataFrames(mapdoc):
+    return list(mapdoc.dataframes)
+
+
+def AddLayer(df, layer, position='AUTO_ARRANGE'):
+    # like arcpy, the map gets a copy of the layer
+    layer = copy.copy(layer)
+    layer._df = df
+    if position == 'TOP':
+        df.mapdoc.layers.insert(0, layer)
+    else:
+        df.mapdoc.layers.append(layer)
+
+
+mapping = SimpleNamespace(
+    Layer=Layer,
+    MapDocument=MapDocument,
+    DataFrame=DataFrame,
+    ListLayers=ListLayers,
+    ListDataFrames=ListDataFrames,
+    AddLayer=AddLayer,
+)
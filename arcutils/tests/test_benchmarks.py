@@ -0,0 +1,53 @@
+import json
+
+import numpy
+
+from arcutils import crapy
+from arcutils import mapping
+from arcutils import table
+from arcutils.tests import benchmarks
+from arcutils.tests import fakearcpy
+
+
+def test_write_points(tmpdir):
+    path = benchmarks.write_points(str(tmpdir / 'points.shp'), 250)
+    shapes = mapping.load_data(path, 'shape', asarrays=True)
+    assert shapes.x.shape == (250,)
+    assert crapy.get_field_names(path) == ['FID', 'Shape', 'ID', 'value']
+
+    values = table.read_table(path, ['ID', 'value'])
+    assert values['ID'].tolist() == list(range(250))
+    assert numpy.isfinite(values['value']).all()
+
+
+def test_fakearcpy_backend():
+    with crapy.ArcpyBackend(fakearcpy):
+        fakearcpy.reset()
+        fakearcpy.create_table('stations', [('a', 1.0), ('b', 2.5)], ['name', 'depth'])
+        assert crapy.get_field_names('stations') == ['OID', 'name', 'depth']
+
+        result = table.read_table('stations')
+        assert result['OID'].tolist() == [1, 2]
+        assert result['depth'].tolist() == [1.0, 2.5]
+
+        ezmd = mapping.EasyMapDoc('CURRENT')
+        layer = ezmd.add_layer('stations')
+        found = ezmd.findLayerByName('stations')
+        assert found is fakearcpy.mapping.ListLayers(ezmd.mapdoc)[0]
+        assert found.dataSource == layer.dataSource
+
+
+def test_run_and_compare(tmpdir):
+    results = benchmarks.run(sizes=[100], repeat=1, workdir=str(tmpdir))
+    assert set(results['results']) == set(benchmarks.BENCHMARKS)
+    assert all(list(r) == ['100'] for r in results['results'].values())
+    json.dumps(results)
+
+    assert benchmarks.compare(results, results) == []
+
+    slower = json.loads(json.dumps(results))
+    slower['results']['get_field_names']['100']['best'] *= 2
+    assert benchmarks.compare(slower, results) == [
+        ('get_field_names', 100, results['results']['get_field_names']['100']['best'],
+         slower['results']['get_field_names']['100']['best'])
+    ]
@@ -0,0 +1,95 @@
+import os
+import shutil
+from pkg_resources import resource_filename
+
+import pytest
+
+from arcutils import catalog
+from arcutils import crapy
+
+
+stationdir = resource_filename('arcutils.tests.data.crapy', 'get_field_names')
+wetlanddir = resource_filename('arcutils.tests.data.mapping', 'load_data')
+
+
+@pytest.fixture
+def datadir(tmp_path):
+    root = tmp_path / 'data'
+    shutil.copytree(stationdir, str(root / 'stations'))
+    shutil.copytree(wetlanddir, str(root / 'wetlands'))
+    shutil.copy(str(root / 'stations' / 'input.dbf'), str(root / 'table.dbf'))
+    return root
+
+
+def test_read_schema():
+    fields = catalog.read_schema(os.path.join(stationdir, 'input.shp'))
+    assert [f.name for f in fields] == [u'FID', u'Shape', u'Station', u'Latitude', u'Longitude']
+    assert [f.type for f in fields] == [u'OID', u'Geometry', u'String', u'Double', u'Double']
+    assert fields[2] == catalog.FieldInfo(u'Station', u'String', 254)
+
+    fields = catalog.read_schema(os.path.join(wetlanddir, 'test_wetlands.shp'))
+    assert dict((f.name, f.type) for f in fields)['OBJECTID_1'] == u'Integer'
+
+
+def test_old_catalogs_are_discarded(tmp_path):
+    dbpath = str(tmp_path / 'schemas.sqlite')
+    shp = os.path.join(stationdir, 'input.shp')
+    with catalog.SchemaCatalog(dbpath) as cat:
+        cat.store(shp, [catalog.FieldInfo(u'Station', u'C', 254)])
+        cat._conn.execute("PRAGMA user_version = 0")
+        cat._conn.commit()
+
+    with catalog.SchemaCatalog(dbpath) as cat:
+        assert cat.lookup(shp) is None
+        assert cat.update(shp) == catalog.read_schema(shp)
+
+
+def test_iter_datasets(datadir):
+    found = [os.path.relpath(p, str(datadir)) for p in catalog.iter_datasets(str(datadir))]
+    assert sorted(found) == sorted([
+        'table.dbf',
+        os.path.join('stations', 'input.shp'),
+        os.path.join('wetlands', 'test_wetlands.shp'),
+    ])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_refresh_and_lookup(datadir, tmp_path, workers):
+    shp = str(datadir / 'stations' / 'input.shp')
+    with catalog.SchemaCatalog(str(tmp_path / 'schemas.sqlite')) as cat:
+        assert cat.lookup(shp) is None
+        assert cat.refresh(str(datadir), workers=workers) == 3
+        assert len(cat) == 3
+        assert cat.lookup(shp) == catalog.read_schema(shp)
+
+        # nothing changed, nothing re-read
+        assert cat.refresh(str(datadir), workers=workers) == 0
+
+    # the catalog persists
+    with catalog.SchemaCatalog(str(tmp_path / 'schemas.sqlite')) as cat:
+        assert cat.lookup(shp) == catalog.read_schema(shp)
+
+
+def test_stale_and_removed_entries(datadir):
+    shp = str(datadir / 'stations' / 'input.shp')
+    dbffile = str(datadir / 'stations' / 'input.dbf')
+    with catalog.SchemaCatalog(':memory:') as cat:
+        cat.refresh(str(datadir), workers=1)
+
+        stat = os.stat(dbffile)
+        os.utime(dbffile, (stat.st_atime, stat.st_mtime + 10))
+        assert cat.lookup(shp) is None
+        assert cat.refresh(str(datadir), workers=1) == 1
+
+        os.remove(str(datadir / 'table.dbf'))
+        cat.refresh(str(datadir), workers=1)
+        assert len(cat) == 2
+
+
+def test_get_field_names_with_catalog(datadir):
+    shp = str(datadir / 'stations' / 'input.shp')
+    with catalog.SchemaCatalog(':memory:') as cat:
+        expected = [u'FID', u'Shape', u'Station', u'Latitude', u'Longitude']
+        assert crapy.get_field_names(shp, catalog=cat) == expected
+        assert len(cat) == 1
+        assert crapy.get_field_names(shp, catalog=cat) == expected
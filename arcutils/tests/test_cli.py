@@ -0,0 +1,115 @@
+import os
+import csv
+import json
+import shutil
+
+from pkg_resources import resource_filename
+
+from click.testing import CliRunner
+
+import pytest
+
+from arcutils import cli
+
+
+datadir = os.path.dirname(resource_filename('arcutils.tests.data', 'example_data.csv'))
+
+
+@pytest.fixture
+def tree(tmpdir):
+    root = str(tmpdir / 'tree')
+    shutil.copytree(datadir, root)
+    with open(os.path.join(root, 'mapping', 'broken.tif'), 'wb') as f:
+        f.write(b'not a tiff')
+    return root
+
+
+def _names(paths):
+    return sorted(os.path.basename(p) for p in paths)
+
+
+def test_find_datasets(tree):
+    assert _names(cli.find_datasets(tree)) == [
+        'broken.tif', 'input.shp', 'test_dem.tif', 'test_wetlands.shp'
+    ]
+
+
+def test_inspect_dataset(tree):
+    wetlands = cli.inspect_dataset(os.path.join(tree, 'mapping', 'load_data', 'test_wetlands.shp'))
+    assert wetlands['kind'] == 'shapefile'
+    assert wetlands['count'] == 18
+    assert wetlands['fields'][:2] == [['FID', 'OID', 4], ['Shape', 'Geometry', 0]]
+    assert len(wetlands['extent']) == 4
+
+    dem = cli.inspect_dataset(os.path.join(tree, 'mapping', 'load_data', 'test_dem.tif'))
+    assert (dem['kind'], dem['rows'], dem['cols'], dem['dtype']) == ('raster', 484, 562, 'float32')
+    assert dem['cellsize'] == 8
+    assert dem['extent'][3] - dem['extent'][1] == 484 * 8
+
+    broken = cli.inspect_dataset(os.path.join(tree, 'mapping', 'broken.tif'))
+    assert 'error' in broken
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_main_jsonl(tree, workers):
+    result = CliRunner().invoke(cli.main, [tree, '--workers', str(workers)])
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert _names(r['path'] for r in records) == _names(cli.find_datasets(tree))
+    assert 'inspected 4 datasets' in result.stderr
+
+
+def test_main_csv_resume(tree, tmpdir):
+    output = str(tmpdir / 'inventory.csv')
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [tree, '-f', 'csv', '-o', output, '-j', '1'])
+    assert result.exit_code == 0, result.output
+
+    # simulate an interrupted scan: two complete rows and a partial one
+    with open(output) as f:
+        lines = f.read().splitlines(True)
+    with open(output, 'w') as f:
+        f.write(''.join(lines[:3]) + lines[3][:10])
+
+    result = runner.invoke(cli.main, [tree, '-f', 'csv', '-o', output, '-j', '1', '--resume'])
+    assert result.exit_code == 0, result.output
+    assert '(2 skipped)' in result.stderr
+
+    with open(output) as f:
+        rows = list(csv.DictReader(f))
+    assert _names(r['path'] for r in rows) == _names(cli.find_datasets(tree))
+    dem = [r for r in rows if r['path'].endswith('test_dem.tif')][0]
+    assert (dem['rows'], dem['cols']) == ('484', '562')
+
+
+def test_resume_needs_output(tree):
+    result = CliRunner().invoke(cli.main, [tree, '--resume'])
+    assert result.exit_code != 0
+
+
+def test_main_jsonl_nan(tree, monkeypatch):
+    def inspect(path):
+        return {'path': path, 'nodata': float('nan'), 'extent': [0.0, float('-inf'), 1.0, 1.0]}
+
+    monkeypatch.setattr(cli, 'inspect_dataset', inspect)
+    result = CliRunner().invoke(cli.main, [tree, '-j', '1'])
+    assert result.exit_code == 0, result.output
+    record = json.loads(result.stdout.splitlines()[0])
+    assert record['nodata'] is None
+    assert record['extent'] == [0.0, None, 1.0, 1.0]
+
+
+def test_main_jsonl_resume_other_spelling(tree, tmpdir, monkeypatch):
+    output = str(tmpdir / 'inventory.jsonl')
+    runner = CliRunner()
+    result = runner.invoke(cli.main, [tree, '-o', output, '-j', '1'])
+    assert result.exit_code == 0, result.output
+
+    # the same tree, given relative to the working directory
+    monkeypatch.chdir(os.path.dirname(tree))
+    other = os.path.join('.', os.path.basename(tree), '')
+    result = runner.invoke(cli.main, [other, '-o', output, '-j', '1', '--resume'])
+    assert result.exit_code == 0, result.output
+    assert '(4 skipped)' in result.stderr
+    with open(output) as f:
+        assert len(f.read().splitlines()) == 4
@@ -1,4 +1,10 @@
 import os
+import sys
+import time
+import threading
+import subprocess
+from io import StringIO
+from unittest import mock
 from pkg_resources import resource_filename
 
 try:
@@ -6,7 +12,10 @@ try:
 except ImportError:
     arcpy = None
 
+import numpy
+
 import pytest
+import numpy.testing as nptest
 
 from arcutils import crapy
 
@@ -34,6 +43,181 @@ class Test_Extension(object):
         arcpy.CheckInExtension(self.known_available)
 
 
+def _license_manager():
+    fake = mock.MagicMock()
+    fake.CheckExtension.side_effect = lambda name: u'Available' if name == 'spatial' else u'Unavailable'
+    fake.CheckOutExtension.return_value = u'CheckedOut'
+    return fake
+
+
+class Test_ExtensionPool(object):
+    def test_nested_and_repeated(self):
+        fake = _license_manager()
+        pool = crapy.ExtensionPool()
+        with crapy.ArcpyBackend(fake), mock.patch.object(crapy, 'extension_pool', pool):
+            with crapy.Extension('spatial') as outer:
+                with crapy.Extension('spatial') as inner:
+                    assert inner == outer == u'CheckedOut'
+                assert not fake.CheckInExtension.called
+
+            with crapy.Extension('spatial'):
+                pass
+
+        assert fake.CheckOutExtension.call_count == 2
+        assert fake.CheckInExtension.call_count == 2
+        assert pool.stats() == crapy.ExtensionStats(2, 2, 1, [])
+
+    def test_checkin_on_error(self):
+        fake = _license_manager()
+        pool = crapy.ExtensionPool()
+        with crapy.ArcpyBackend(fake), mock.patch.object(crapy, 'extension_pool', pool):
+            with pytest.raises(ZeroDivisionError):
+                with crapy.Extension('spatial'):
+                    1 / 0
+
+            with pytest.raises(RuntimeError):
+                with crapy.Extension('tracking'):
+                    pass
+
+        fake.CheckInExtension.assert_called_once_with('spatial')
+        assert pool.stats().held == []
+
+    def test_idle_timeout(self):
+        fake = _license_manager()
+        fake.CheckExtension.side_effect = lambda name: u'Available'
+        clock = mock.Mock(return_value=0.)
+        pool = crapy.ExtensionPool(idle_timeout=10, clock=clock)
+        with crapy.ArcpyBackend(fake):
+            for _ in range(5):
+                pool.acquire('spatial')
+                pool.release('spatial')
+                clock.return_value += 9
+
+            assert pool.stats() == crapy.ExtensionStats(1, 0, 4, ['spatial'])
+
+            # expired on the next use of the pool, in this thread
+            clock.return_value += 1
+            assert not fake.CheckInExtension.called
+            pool.acquire('3D')
+            fake.CheckInExtension.assert_called_once_with('spatial')
+            assert pool.stats().held == ['3D']
+            pool.release('3D')
+
+        assert pool.stats() == crapy.ExtensionStats(2, 1, 4, ['3D'])
+
+    def test_expired_extension_is_checked_out_again(self):
+        fake = _license_manager()
+        clock = mock.Mock(return_value=0.)
+        pool = crapy.ExtensionPool(idle_timeout=10, clock=clock)
+        with crapy.ArcpyBackend(fake):
+            pool.acquire('spatial')
+            pool.release('spatial')
+            clock.return_value = 10
+            pool.acquire('spatial')
+
+        assert fake.CheckOutExtension.call_count == 2
+        fake.CheckInExtension.assert_called_once_with('spatial')
+        assert pool.stats() == crapy.ExtensionStats(2, 1, 0, ['spatial'])
+
+    def test_close(self):
+        fake = _license_manager()
+        pool = crapy.ExtensionPool(idle_timeout=60)
+        with crapy.ArcpyBackend(fake):
+            pool.acquire('spatial')
+            pool.release('spatial')
+            pool.close()
+
+        fake.CheckInExtension.assert_called_once_with('spatial')
+
+
+class Test_StatusSink(object):
+    def setup_method(self, method):
+        self.stream = StringIO()
+        self.sink = crapy.StatusSink(interval=60, maxcount=1000, stream=self.stream)
+
+    def teardown_method(self, method):
+        self.sink.close()
+
+    def test_update_status(self):
+        @crapy.update_status
+        def add(a, b):
+            return a + b
+
+        with mock.patch.object(crapy, 'status_sink', self.sink):
+            assert add(1, 2, msg='one', verbose=True) == 3
+            assert add(1, 2, msg='hidden') == 3
+            assert add(1, 2, msg='two', verbose=True, addTab=True) == 3
+
+        assert self.stream.getvalue() == ''
+        self.sink.flush()
+        assert self.stream.getvalue() == 'one\n\ttwo\n'
+
+    def test_coalesced_arcpy_messages(self):
+        fake = mock.MagicMock()
+        with crapy.ArcpyBackend(fake):
+            self.sink.put('a', asMessage=True)
+            self.sink.put('b', asMessage=True)
+            self.sink.put('c')
+            self.sink.put('d', asMessage=True)
+            self.sink.flush()
+
+        assert fake.AddMessage.call_args_list == [mock.call('a\nb'), mock.call('d')]
+        assert self.stream.getvalue() == 'c\n'
+
+    def test_count_triggers_flush(self):
+        self.sink.maxcount = 10
+        for n in range(10):
+            self.sink.put(str(n))
+
+        for _ in range(200):
+            if self.stream.getvalue():
+                break
+            time.sleep(0.01)
+        assert self.stream.getvalue() == ''.join('{}\n'.format(n) for n in range(10))
+
+    def test_arcpy_messages_stay_on_this_thread(self):
+        threads = []
+        fake = mock.MagicMock()
+        fake.AddMessage.side_effect = lambda text: threads.append(threading.current_thread())
+        self.sink.maxcount = 2
+        with crapy.ArcpyBackend(fake):
+            self.sink.put('a', asMessage=True)
+            self.sink.put('b')
+            for _ in range(200):
+                if self.stream.getvalue():
+                    break
+                time.sleep(0.01)
+            # the background thread printed 'b' but held on to 'a'
+            assert self.stream.getvalue() == 'b\n'
+            assert not fake.AddMessage.called
+
+            self.sink.put('c', asMessage=True)
+
+        assert fake.AddMessage.call_args_list == [mock.call('a\nc')]
+        assert threads == [threading.current_thread()]
+
+    def test_written_at_exit(self):
+        code = ('from arcutils import crapy; '
+                'sink = crapy.StatusSink(interval=60); '
+                'sink.put("goodbye")')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        assert output.decode('ascii').strip() == 'goodbye'
+
+    def test_progress(self):
+        with self.sink.progress(50000, unit='rows') as progress:
+            progress.update(12000)
+            self.sink.flush()
+            self.sink.flush()
+            progress.update(38000)
+
+        self.sink.close()
+        lines = self.stream.getvalue().splitlines()
+        assert len(lines) == 2
+        assert lines[0].startswith('processed 12,000/50,000 rows (')
+        assert lines[1].startswith('processed 50,000/50,000 rows (')
+        assert lines[1].endswith('/s)')
+
+
 @pytest.mark.skipif(arcpy is None, reason='No arcpy')
 class Test_OverwriteState(object):
     def test_true_true(self):
@@ -99,9 +283,166 @@ def test_RasterTemplate():
     assert template.extent.lowerLeft.Y == y
 
 
+def test_RasterTemplate_without_arcpy():
+    size, x, y = 8, 1, 2
+    with crapy.ArcpyBackend(None):
+        template = crapy.RasterTemplate(size, x, y)
+    assert template.meanCellWidth == size
+    assert template.meanCellHeight == size
+    assert template.extent.lowerLeft.X == x
+    assert template.extent.lowerLeft.Y == y
+
+
 @pytest.mark.skipif(arcpy is None, reason='No arcpy')
 def test_get_field_names():
     expected = [u'FID', u'Shape', u'Station', u'Latitude', u'Longitude']
     layer = resource_filename('arcutils.tests._data.crapy.get_field_names', 'input.shp')
     result = crapy.get_field_names(layer)
     assert result == expected
+
+
+def test_get_field_names_from_dbf_header():
+    expected = [u'FID', u'Shape', u'Station', u'Latitude', u'Longitude']
+    layer = resource_filename('arcutils.tests.data.crapy.get_field_names', 'input.shp')
+    result = crapy.get_field_names(layer)
+    assert result == expected
+
+
+def test_check_arcpy_without_backend():
+    @crapy.check_arcpy
+    def needs_arcpy():
+        return arcpy
+
+    with crapy.ArcpyBackend(None):
+        with pytest.raises(RuntimeError):
+            needs_arcpy()
+
+
+def test_ArcpyBackend():
+    fake = object()
+    previous = crapy.get_backend()
+
+    @crapy.check_arcpy
+    def which_arcpy():
+        return globals()['arcpy']
+
+    with crapy.ArcpyBackend(fake) as backend:
+        assert backend is fake
+        assert crapy.get_backend() is fake
+        assert which_arcpy() is fake
+        assert crapy.arcpy is fake
+
+    assert crapy.get_backend() is previous
+    assert crapy.arcpy is previous
+
+
+def test_lazy_package_import():
+    code = (
+        "import sys, arcutils; "
+        "print(sorted(m for m in ('arcutils.crapy', 'arcutils.mapping', 'pytest', 'arcpy') "
+        "if m in sys.modules)); "
+        "arcutils.mapping; "
+        "print('arcutils.mapping' in sys.modules)"
+    )
+    output = subprocess.check_output([sys.executable, '-c', code]).decode().split()
+    assert output == ['[]', 'True']
+
+
+class Test_GeometryBatch(object):
+    def setup_method(self):
+        # a 4x4 square with a 2x2 hole, a unit square far from the
+        # origin, an empty polygon, and a triangle
+        square = [(0, 4), (4, 4), (4, 0), (0, 0)]
+        hole = [(1, 1), (3, 1), (3, 3), (1, 3)]
+        unit = [(1e7, 1e7 + 1), (1e7 + 1, 1e7 + 1), (1e7 + 1, 1e7), (1e7, 1e7)]
+        triangle = [(0, 0), (0, 3), (3, 0), (0, 0)]
+        coords = square + hole + unit + triangle
+        self.batch = crapy.GeometryBatch(coords, [0, 4, 8, 12, 16], [0, 2, 3, 3, 4])
+
+    def test_len(self):
+        assert len(self.batch) == 4
+
+    def test_bounds(self):
+        nptest.assert_array_equal(self.batch.bounds(), [
+            [0, 0, 4, 4],
+            [1e7, 1e7, 1e7 + 1, 1e7 + 1],
+            [numpy.nan] * 4,
+            [0, 0, 3, 3],
+        ])
+
+    def test_area(self):
+        nptest.assert_array_equal(self.batch.area(), [12, 1, 0, 4.5])
+
+    def test_centroid(self):
+        nptest.assert_allclose(self.batch.centroid(), [
+            [2, 2], [1e7 + 0.5, 1e7 + 0.5], [numpy.nan, numpy.nan], [1, 1],
+        ])
+
+    def test_slices_are_views(self):
+        part = self.batch[1:]
+        assert len(part) == 3
+        assert numpy.shares_memory(part.coords, self.batch.coords)
+        assert numpy.shares_memory(part.geom_offsets, self.batch.geom_offsets)
+        nptest.assert_array_equal(part.area(), [1, 0, 4.5])
+        nptest.assert_array_equal(self.batch[-1].bounds(), [[0, 0, 3, 3]])
+        assert len(self.batch[3:1]) == 0
+        assert self.batch[3:1].area().shape == (0,)
+
+        with pytest.raises(IndexError):
+            self.batch[::2]
+        with pytest.raises(IndexError):
+            self.batch[4]
+
+    def test_trailing_empty_geometries(self):
+        # the square with a hole, followed by empty polygons
+        batch = crapy.GeometryBatch(self.batch.coords[:8], [0, 4, 8], [0, 2, 2, 2])
+        nptest.assert_array_equal(batch.area(), [12, 0, 0])
+        nptest.assert_array_equal(batch.centroid()[0], [2, 2])
+
+    def test_take(self):
+        taken = self.batch.take([3, 0, 2])
+        assert len(taken) == 3
+        assert not numpy.shares_memory(taken.coords, self.batch.coords)
+        nptest.assert_array_equal(taken.area(), [4.5, 12, 0])
+        nptest.assert_array_equal(taken.geom_offsets, [0, 1, 3, 3])
+        assert len(self.batch.take([])) == 0
+
+    def test_from_rings(self):
+        from arcutils import tetris
+
+        corners = tetris.box_corners(numpy.arange(1000.), numpy.arange(1000.), 2.0, 4)
+        boxes = crapy.GeometryBatch.from_rings(corners.reshape(-1, 4, 2))
+        assert len(boxes) == 4000
+        assert numpy.shares_memory(boxes.coords, corners)
+        nptest.assert_array_equal(boxes.area(), 4.0)
+        nptest.assert_array_equal(boxes.centroid(), corners.reshape(-1, 4, 2).mean(axis=1))
+        # a million boxes take about 80 MB
+        assert boxes.nbytes == 4000 * (4 * 2 * 8 + 2 * 8) + 2 * 8
+
+    def test_from_shapes(self):
+        from arcutils import shapefile
+
+        path = resource_filename('arcutils.tests.data.mapping.load_data', 'test_wetlands.shp')
+        shapes = shapefile.read_shapefile(path)
+        batch = crapy.GeometryBatch.from_shapes(shapes)
+        reader = shapefile.ShapefileReader(path)
+        nptest.assert_allclose(batch.bounds(), reader.bboxes())
+        assert (batch.area() > 0).all()
+
+    def test_to_arcpy(self):
+        from arcutils.tests import fakearcpy
+
+        with crapy.ArcpyBackend(fakearcpy):
+            polygons = self.batch[1:].to_arcpy()
+            unit = next(polygons)
+            assert isinstance(unit, fakearcpy.Polygon)
+            nptest.assert_array_equal(unit.coords, self.batch.coords[8:12])
+            assert len(list(polygons)) == 2
+
+            holed = next(self.batch.to_arcpy())
+            assert len(holed.parts) == 2
+
+    def test_to_arcpy_without_arcpy(self):
+        with crapy.ArcpyBackend(None):
+            with pytest.raises(RuntimeError):
+                self.batch.to_arcpy()
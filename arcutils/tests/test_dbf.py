@@ -0,0 +1,126 @@
+import shutil
+import struct
+from pkg_resources import resource_filename
+
+import numpy
+
+import pytest
+
+from arcutils import dbf
+
+
+stationpath = resource_filename('arcutils.tests.data.crapy.get_field_names', 'input.dbf')
+wetlandpath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_wetlands.shp')
+
+
+def test_read_header():
+    header = dbf.read_header(stationpath)
+    assert header.numrecords == 7
+    assert header.recordlength == 293
+    assert [f.name for f in header.fields] == ['Station', 'Latitude', 'Longitude']
+    assert [f.type for f in header.fields] == ['C', 'F', 'F']
+    assert [f.offset for f in header.fields] == [1, 255, 274]
+
+
+def test_read_dbf_all_fields():
+    cols = dbf.read_dbf(stationpath)
+    assert list(cols.keys()) == ['Station', 'Latitude', 'Longitude']
+    assert cols['Station'].tolist()[:3] == ['CSBBR1z', 'CSBMP1d', 'CSBMP1u']
+    assert cols['Latitude'].dtype == numpy.float64
+    numpy.testing.assert_allclose(cols['Latitude'][0], 33.4528401400)
+    numpy.testing.assert_allclose(cols['Longitude'][0], -117.6656067)
+
+
+def test_read_dbf_projection_from_shapefile():
+    cols = dbf.read_dbf(wetlandpath, fields=['OBJECTID_1', 'IT_VALC'])
+    assert list(cols.keys()) == ['OBJECTID_1', 'IT_VALC']
+    assert cols['OBJECTID_1'].dtype == numpy.int64
+    assert cols['OBJECTID_1'][:3].tolist() == [1197, 1249, 1273]
+    assert cols['IT_VALC'][:4].tolist() == ['M', 'M', 'M', 'DM']
+
+
+def test_read_dbf_bad_field():
+    with pytest.raises(ValueError):
+        dbf.read_dbf(stationpath, fields=['Station', 'JUNK'])
+
+
+def _delete_records(path, numbers):
+    header = dbf.read_header(path)
+    with open(path, 'r+b') as f:
+        for number in numbers:
+            f.seek(header.headerlength + number * header.recordlength)
+            f.write(b'*')
+
+
+def test_read_dbf_skips_deleted_records(tmp_path):
+    path = str(tmp_path / 'stations.dbf')
+    shutil.copy(stationpath, path)
+    _delete_records(path, [1, 6])
+
+    expected = dbf.read_dbf(stationpath)['Station'].tolist()
+    cols = dbf.read_dbf(path)
+    assert cols['Station'].tolist() == expected[:1] + expected[2:6]
+    assert cols['Latitude'].shape == (5,)
+    assert dbf.read_dbf(path, rows=slice(1, 4))['Station'].tolist() == expected[2:4]
+    assert dbf.record_numbers(path).tolist() == [0, 2, 3, 4, 5]
+    assert dbf.record_numbers(path, rows=slice(1, 4)).tolist() == [2, 3]
+
+
+@pytest.mark.parametrize(('codepage', 'codec'), [
+    ('ANSI 1252', 'cp1252'),
+    ('1252', 'cp1252'),
+    ('65001', 'utf-8'),
+    ('UTF8', 'utf-8'),
+    ('UTF-8\n', 'utf-8'),
+    ('88591', 'iso8859-1'),
+    ('OEM', 'cp437'),
+    ('nonsense', 'latin-1'),
+    ('', 'latin-1'),
+])
+def test_codec_name(codepage, codec):
+    assert dbf.codec_name(codepage) == codec
+
+
+def test_read_dbf_cpg(tmp_path):
+    path = str(tmp_path / 'stations.dbf')
+    shutil.copy(stationpath, path)
+    with open(str(tmp_path / 'stations.cpg'), 'w') as f:
+        f.write('ANSI 1252')
+    assert dbf._encoding(path) == 'cp1252'
+    assert dbf.read_dbf(path)['Station'][0] == 'CSBBR1z'
+
+
+def _write_dbf(path, fields, rows):
+    recordlength = 1 + sum(f[2] for f in fields)
+    headerlength = 32 + 32 * len(fields) + 1
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<4BIHH20x', 3, 116, 1, 1, len(rows), headerlength, recordlength))
+        for name, ftype, length, decimals in fields:
+            f.write(struct.pack('<11sc4xBB14x', name, ftype, length, decimals))
+        f.write(b'\r')
+        for row in rows:
+            f.write(b' ' + b''.join(value.ljust(field[2]) for value, field in zip(row, fields)))
+        f.write(b'\x1a')
+    return path
+
+
+def test_read_dbf_invalid_dates(tmp_path):
+    path = _write_dbf(str(tmp_path / 'dates.dbf'), [(b'Sampled', b'D', 8, 0)],
+                      [(b'20160412',), (b'00000000',), (b'',), (b'20160230',), (b'2016 4 1',)])
+    dates = dbf.read_dbf(path)['Sampled']
+    assert dates[0] == numpy.datetime64('2016-04-12')
+    assert numpy.isnat(dates[1:]).all()
+
+
+@pytest.mark.parametrize(('codepage', 'name'), [
+    (None, u'D\xe9pth'),
+    ('ANSI 1252', u'D\xe9pth'),
+    ('UTF-8', u'D\ufffdpth'),
+])
+def test_read_header_field_name_encoding(tmp_path, codepage, name):
+    path = _write_dbf(str(tmp_path / 'depths.dbf'), [(b'D\xe9pth', b'N', 5, 0)], [(b'1',)])
+    if codepage is not None:
+        with open(str(tmp_path / 'depths.cpg'), 'w') as f:
+            f.write(codepage)
+    assert [f.name for f in dbf.read_header(path).fields] == [name]
+    assert dbf.read_dbf(path)[name].tolist() == [1]
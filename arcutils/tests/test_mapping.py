@@ -1,5 +1,8 @@
 import sys
 import os
+import shutil
+import time
+import threading
 from pkg_resources import resource_filename
 
 import pytest
@@ -13,11 +16,14 @@ except ImportError:
     _NO_ARCPY = True
     arcpy = mock.MagicMock()
 
+from arcutils import crapy
 from arcutils import mapping
+from arcutils import shapefile
 
 
 rasterpath = resource_filename("arcutils.tests.data.mapping.load_data", 'test_dem.tif')
 vectorpath = resource_filename("arcutils.tests.data.mapping.load_data", 'test_wetlands.shp')
+shapefile_points = resource_filename("arcutils.tests.data.crapy.get_field_names", 'input.shp')
 
 
 @pytest.mark.skipif(_NO_ARCPY, reason='No arcpy')
@@ -43,6 +49,116 @@ def test_load_data(filename, filetype, objtype, greedy):
         assert isinstance(data, objtype)
 
 
+@pytest.mark.parametrize('filetype', ['shape', 'layer'])
+def test_load_data_asarrays(filetype):
+    data = mapping.load_data(vectorpath, filetype, asarrays=True)
+    assert isinstance(data, shapefile.ShapeArrays)
+    assert data.shapetype == 5
+    assert data.geom_offsets.shape[0] == 19
+    assert data.x.shape == data.y.shape == (data.part_offsets[-1],)
+
+
+def test_load_data_asarrays_bad_path():
+    with pytest.raises(ValueError):
+        mapping.load_data('junk.shp', 'shape', asarrays=True)
+
+
+class Test_DataCache(object):
+    def setup_method(self):
+        self.cache = mapping.DataCache(maxsize=2)
+
+    def load(self, path, **kwargs):
+        return mapping.load_data(path, 'shape', asarrays=True, cache=self.cache, **kwargs)
+
+    def test_hit(self):
+        first = self.load(vectorpath)
+        second = self.load(vectorpath)
+        assert second is first
+        assert self.cache.info() == mapping.CacheInfo(1, 1, 2, 1)
+
+    def test_options_are_part_of_the_key(self):
+        first = self.load(vectorpath)
+        second = self.load(vectorpath, greedyRasters=False)
+        assert second is not first
+        assert self.cache.misses == 2
+
+    def test_changed_file_is_reloaded(self, tmp_path):
+        for ext in ('.shp', '.shx'):
+            shutil.copy(vectorpath.replace('.shp', ext), str(tmp_path / ('wetlands' + ext)))
+        path = str(tmp_path / 'wetlands.shp')
+
+        first = self.load(path)
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        second = self.load(path)
+        assert second is not first
+        assert self.cache.info() == mapping.CacheInfo(0, 2, 2, 1)
+
+    @pytest.mark.parametrize('sidecar', ['.dbf', '.shx', '.prj'])
+    def test_changed_sidecar_is_reloaded(self, tmp_path, sidecar):
+        for ext in ('.shp', '.shx', '.dbf'):
+            shutil.copy(vectorpath.replace('.shp', ext), str(tmp_path / ('wetlands' + ext)))
+        path = str(tmp_path / 'wetlands.shp')
+
+        first = self.load(path)
+        assert self.load(path) is first
+        sidecarpath = str(tmp_path / ('wetlands' + sidecar))
+        if os.path.exists(sidecarpath):
+            stat = os.stat(sidecarpath)
+            os.utime(sidecarpath, (stat.st_atime, stat.st_mtime + 10))
+        else:
+            shutil.copy(vectorpath.replace('.shp', sidecar), sidecarpath)
+        assert self.load(path) is not first
+
+    @pytest.mark.parametrize('sidecar', ['dem.tfw', 'dem.tif.aux.xml', 'dem.tif.ovr', 'dem.rrd'])
+    def test_changed_raster_sidecar_is_reloaded(self, tmp_path, sidecar):
+        path = str(tmp_path / 'dem.tif')
+        open(path, 'w').close()
+        load = mock.Mock(side_effect=lambda: object())
+
+        first = self.cache.load(load, path, 'raster')
+        assert self.cache.load(load, path, 'raster') is first
+        with open(str(tmp_path / sidecar), 'w') as f:
+            f.write('sidecar')
+        assert self.cache.load(load, path, 'raster') is not first
+        assert load.call_count == 2
+
+    def test_changed_grid_is_reloaded(self, tmp_path):
+        grid = tmp_path / 'elev'
+        grid.mkdir()
+        for name in ('hdr.adf', 'w001001.adf'):
+            (grid / name).write_text(u'cells')
+        load = mock.Mock(side_effect=lambda: object())
+
+        first = self.cache.load(load, str(grid), 'raster')
+        assert self.cache.load(load, str(grid), 'raster') is first
+        (grid / 'w001001.adf').write_text(u'changed cells')
+        assert self.cache.load(load, str(grid), 'raster') is not first
+        assert load.call_count == 2
+
+    def test_maxsize(self):
+        first = self.load(vectorpath)
+        self.load(vectorpath, greedyRasters=False)
+        self.load(shapefile_points)
+        assert len(self.cache) == 2
+        assert self.load(vectorpath) is not first
+
+    def test_invalidate(self):
+        first = self.load(vectorpath)
+        self.load(shapefile_points)
+        self.cache.invalidate(vectorpath)
+        assert len(self.cache) == 1
+        assert self.load(vectorpath) is not first
+
+        self.cache.invalidate()
+        assert len(self.cache) == 0
+
+    def test_errors_are_not_cached(self):
+        with pytest.raises(ValueError):
+            self.load('junk.shp')
+        assert len(self.cache) == 0
+
+
 @pytest.mark.skipif(_NO_ARCPY, reason='No arcpy')
 class Test_EasyMapDoc(object):
     def setup(self):
@@ -87,3 +203,232 @@ class Test_EasyMapDoc(object):
     def test_bad_position(self):
         with pytest.raises(ValueError):
             self.ezmd.add_layer(self.add_layer_path, position='junk')
+
+
+class _FakeLayer(object):
+    def __init__(self, name, group=None, isGroupLayer=False):
+        self.name = name
+        self.longName = name if group is None else group + '\\' + name
+        self.isGroupLayer = isGroupLayer
+        self.isRasterLayer = False
+
+
+def _copy_layer(layer):
+    copy = _FakeLayer(layer.name, isGroupLayer=layer.isGroupLayer)
+    copy.longName = layer.longName
+    return copy
+
+
+def _listings(fake):
+    """ Number of times the whole map was listed. """
+    return sum(1 for c in fake.mapping.ListLayers.call_args_list if len(c[0]) == 1)
+
+
+@pytest.fixture
+def fake_arcpy():
+    layers = [
+        _FakeLayer('Hydrology', isGroupLayer=True),
+        _FakeLayer('wetlands', group='Hydrology'),
+        _FakeLayer('streams', group='Hydrology'),
+        _FakeLayer('wetlands'),
+        _FakeLayer('ZOI'),
+    ]
+
+    def ListLayers(mapdoc, wildcard=None, df=None):
+        return [lyr for lyr in layers if wildcard is None or lyr.name == wildcard]
+
+    def AddLayer(df, layer, position):
+        # like arcpy, the map gets a copy of the layer
+        if position == 'BOTTOM':
+            layers.append(_copy_layer(layer))
+        else:
+            layers.insert(0, _copy_layer(layer))
+
+    fake = mock.MagicMock()
+    fake.mapping.ListLayers.side_effect = ListLayers
+    fake.mapping.AddLayer.side_effect = AddLayer
+    fake.mapping.Layer = _FakeLayer
+    with crapy.ArcpyBackend(fake):
+        yield fake
+
+
+class Test_EasyMapDoc_index(object):
+    def test_findLayerByName_lists_layers_once(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        for _ in range(5):
+            assert ezmd.findLayerByName('ZOI').name == 'ZOI'
+            assert ezmd.findLayerByName('junk') is None
+        assert _listings(fake_arcpy) == 1
+
+    def test_group_layers(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        assert ezmd.findLayerByName('Hydrology') is None
+        lyr = ezmd.findLayerByName('Hydrology\\streams')
+        assert lyr.longName == 'Hydrology\\streams'
+
+    def test_duplicates(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        wetlands = ezmd.findLayersByName('wetlands')
+        assert [lyr.longName for lyr in wetlands] == ['Hydrology\\wetlands', 'wetlands']
+        assert ezmd.findLayerByName('wetlands') is wetlands[0]
+
+    @pytest.mark.parametrize(('position', 'index'), [('top', 0), ('bottom', -1)])
+    def test_add_layer_updates_index(self, fake_arcpy, position, index):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        ezmd.findLayerByName('ZOI')
+
+        newlayer = _FakeLayer('wetlands')
+        ezmd.add_layer(newlayer, position=position)
+        indexed = ezmd.findLayersByName('wetlands')[index]
+        assert indexed is not newlayer
+        assert indexed is fake_arcpy.mapping.ListLayers('test.mxd', 'wetlands')[index]
+        assert len(ezmd.findLayersByName('wetlands')) == 3
+        assert _listings(fake_arcpy) == 1
+
+    def test_index_matches_rebuilt_index(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        ezmd.findLayerByName('ZOI')
+        ezmd.add_layers([_FakeLayer('ZOI'), _FakeLayer('roads')], position='bottom')
+        ezmd.add_layer(_FakeLayer('roads'), position='top')
+        updated = dict(ezmd._layer_index)
+
+        ezmd.refresh()
+        assert updated == ezmd._layer_index
+
+    @pytest.mark.parametrize(('position', 'which'), [
+        ('top', 1), ('bottom', 0), ('auto_arrange', 0), ('auto_arrange', 1)
+    ])
+    def test_add_layer_elsewhere_resets_index(self, fake_arcpy, position, which):
+        dataframes = [mock.MagicMock(name='Main'), mock.MagicMock(name='Subset')]
+        fake_arcpy.mapping.ListDataFrames.side_effect = lambda *args: list(dataframes)
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        ezmd.findLayerByName('ZOI')
+
+        ezmd.add_layer(_FakeLayer('wetlands'), df=dataframes[which], position=position)
+        ezmd.findLayerByName('ZOI')
+        assert _listings(fake_arcpy) == 2
+
+    def test_add_group_layer_resets_index(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        ezmd.findLayerByName('ZOI')
+        ezmd.add_layer(_FakeLayer('Landuse', isGroupLayer=True))
+        ezmd.findLayerByName('ZOI')
+        assert _listings(fake_arcpy) == 2
+
+    def test_refresh(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        ezmd.findLayerByName('ZOI')
+        ezmd.refresh()
+        assert _listings(fake_arcpy) == 2
+
+
+class Test_EasyMapDoc_add_layers(object):
+    def test_order_and_dedup(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        existing = _FakeLayer('existing')
+        paths = ['a.shp', 'b.shp', existing, 'a.shp']
+
+        result = ezmd.add_layers(paths, position='bottom')
+        assert [lyr.name for lyr in result] == ['a.shp', 'b.shp', 'existing', 'a.shp']
+        assert result[0] is result[3]
+        assert result[2] is existing
+
+        added = [c[0][1] for c in fake_arcpy.mapping.AddLayer.call_args_list]
+        assert added == result
+        assert fake_arcpy.mapping.ListDataFrames.call_count == 1
+
+    def test_bad_position(self, fake_arcpy):
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        with pytest.raises(ValueError):
+            ezmd.add_layers(['a.shp'], position='junk')
+        assert fake_arcpy.mapping.AddLayer.call_count == 0
+
+    def test_bad_layer(self, fake_arcpy):
+        class _BadLayer(_FakeLayer):
+            def __init__(self, name):
+                raise RuntimeError(name)
+
+        fake_arcpy.mapping.Layer = _BadLayer
+        ezmd = mapping.EasyMapDoc('test.mxd')
+        with pytest.raises(ValueError):
+            ezmd.add_layers(['a.shp', 'b.shp'])
+        assert fake_arcpy.mapping.AddLayer.call_count == 0
+
+
+class Test_load_many(object):
+    def test_results_in_order(self):
+        specs = [
+            (vectorpath, 'shape', {'asarrays': True}),
+            {'datapath': shapefile_points, 'datatype': 'shape', 'asarrays': True},
+            (vectorpath, 'shape', {'asarrays': True}),
+        ]
+        results = list(mapping.load_many(specs, workers=2))
+        assert [len(r.geom_offsets) - 1 for r in results] == [18, 7, 18]
+        assert results[0] is results[2]
+
+    def test_errors_are_ValueErrors(self):
+        specs = [(vectorpath, 'shape', {'asarrays': True}), ('junk.shp', 'shape', {'asarrays': True})]
+        results = mapping.load_many(specs)
+        assert len(next(results).x) > 0
+        with pytest.raises(ValueError):
+            next(results)
+
+    def test_inflight_loads_are_shared(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_load(datapath, datatype, **options):
+            calls.append(datapath)
+            release.wait(5)
+            return datapath.upper()
+
+        with mock.patch.object(mapping, 'load_data', slow_load):
+            first = mapping.prefetch([('a.shp', 'layer'), ('b.tif', 'raster')])
+            results = mapping.load_many([('b.tif', 'raster'), ('a.shp', 'layer'), ('b.tif', 'grid')])
+            release.set()
+            assert list(results) == ['B.TIF', 'A.SHP', 'B.TIF']
+
+        assert [f.result() for f in first] == ['A.SHP', 'B.TIF']
+        assert sorted(calls) == ['a.shp', 'b.tif', 'b.tif']
+
+        # finished loads are forgotten (by a callback in the worker)
+        for _ in range(100):
+            if not mapping._inflight:
+                break
+            time.sleep(0.01)
+        assert mapping._inflight == {}
+
+    def test_pool_is_shut_down_without_iterating(self):
+        release = threading.Event()
+
+        def slow_load(datapath, datatype, **options):
+            release.wait(5)
+            return datapath
+
+        with mock.patch.object(mapping, 'load_data', slow_load):
+            with mock.patch.object(mapping.Prefetcher, 'shutdown') as shutdown:
+                results = mapping.load_many([('c.shp', 'layer'), ('d.shp', 'layer')])
+                assert shutdown.call_count == 0
+                release.set()
+                for _ in range(100):
+                    if shutdown.call_count:
+                        break
+                    time.sleep(0.01)
+                shutdown.assert_called_once_with(wait=False)
+        assert list(results) == ['c.shp', 'd.shp']
+
+    def test_prefetch_through_a_cache(self, tmp_path):
+        cache = mapping.DataCache()
+        path = str(tmp_path / 'a.shp')
+        open(path, 'w').close()
+        calls = []
+
+        def load(*args, **kwargs):
+            calls.append(args)
+            return object()
+
+        with mock.patch.object(mapping, '_load_arcpy_data', load):
+            first, = mapping.prefetch([(path, 'raster', {'cache': cache})])
+            data = first.result()
+            assert list(mapping.load_many([(path, 'raster', {'cache': cache})])) == [data]
+        assert len(calls) == 1
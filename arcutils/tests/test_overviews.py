@@ -0,0 +1,170 @@
+import os
+import shutil
+from pkg_resources import resource_filename
+
+import numpy
+
+import pytest
+import numpy.testing as nptest
+
+from arcutils import crapy
+from arcutils import overviews
+from arcutils import raster
+from arcutils import tiff
+
+
+dempath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_dem.tif')
+
+
+def _read_all(source):
+    return source.read(raster.Window(0, 0, source.shape[0], source.shape[1]))
+
+
+def _copy(tmp_path, ovr=False):
+    path = str(tmp_path / 'dem.tif')
+    shutil.copy(dempath, path)
+    if ovr:
+        shutil.copy(dempath + '.ovr', path + '.ovr')
+    return path
+
+
+@pytest.mark.parametrize(('cells', 'method', 'expected'), [
+    ([[1, 2, 3, 4], [5, 6, 7, 8]], 'nearest', [[1, 3]]),
+    ([[1, 2, 3, -9], [5, 6, -9, -9]], 'mean', [[4, 3]]),
+    ([[-9, -9, 1, 2], [-9, -9, 2, 1]], 'mean', [[-9, 2]]),
+    ([[1, 2, 3, 3], [2, 2, -9, -9]], 'mode', [[2, 3]]),
+    ([[1, 2, -9, -9], [2, 1, -9, -9]], 'mode', [[1, -9]]),
+])
+def test_resampling(cells, method, expected):
+    cells = numpy.array(cells, dtype='int16')
+    result = overviews._REDUCERS[method](cells, -9)
+    assert result.dtype == cells.dtype
+    nptest.assert_array_equal(result, expected)
+
+
+def test_mean_with_nans():
+    cells = numpy.array([[1, numpy.nan], [numpy.nan, numpy.nan]], dtype='float32')
+    result = overviews._REDUCERS['mean'](cells, None)
+    assert result[0, 0] == 1
+    assert numpy.isnan(overviews._REDUCERS['mean'](cells * numpy.nan, None)[0, 0])
+
+
+class Test_build_overviews(object):
+    def test_nearest_matches_arcgis(self, tmp_path):
+        path = _copy(tmp_path)
+        ovrpath = overviews.build_overviews(path, levels=1, tilesize=128)
+        assert ovrpath == path + '.ovr'
+
+        page = tiff.TiffFile(ovrpath).pages[0]
+        assert page.tags[tiff.NEW_SUBFILE_TYPE] == (1,)
+        known = raster.RasterFile(dempath + '.ovr', georeference=(16, 0, 0))
+        built = raster.RasterFile(ovrpath, georeference=(16, 0, 0))
+        nptest.assert_array_equal(_read_all(built), _read_all(known))
+
+    def test_levels(self, tmp_path):
+        path = _copy(tmp_path)
+        overviews.build_overviews(path, resampling='mean', tilesize=64, minsize=100)
+        pages = tiff.TiffFile(path + '.ovr').pages
+        assert [p.shape for p in pages] == [(242, 281), (121, 141), (61, 71)]
+
+        pyramid = overviews.Overviews(path)
+        assert [level.cellsize for level in pyramid.levels] == [8, 16, 32, 64]
+        base = _read_all(pyramid.levels[0]).astype(float)
+        base[base == pyramid.levels[0].nodata] = numpy.nan
+
+        # the first level is the mean of the valid cells
+        groups = base.reshape(242, 2, 281, 2).swapaxes(1, 2).reshape(242, 281, 4)
+        valid = ~numpy.isnan(groups).all(axis=2)
+        level1 = _read_all(pyramid.levels[1])
+        with numpy.errstate(invalid='ignore'), pytest.warns(RuntimeWarning):
+            expected = numpy.nanmean(groups, axis=2)
+        nptest.assert_allclose(level1[valid], expected[valid], rtol=1e-6)
+        assert (level1[~valid] == pyramid.levels[0].nodata).all()
+
+        # the odd last column is made from real cells only
+        level3 = _read_all(pyramid.levels[3])
+        assert not (level3 == pyramid.levels[0].nodata).all(axis=0)[-1]
+
+    def test_mode_of_integers(self, tmp_path):
+        grid = numpy.repeat(numpy.repeat(numpy.arange(12, dtype='uint8').reshape(3, 4), 4, 0), 4, 1)
+        path = str(tmp_path / 'classes.tif')
+        raster.write_raster(path, crapy.RasterTemplate(1, 0, 0), grid[:-1, :-1], tilesize=16)
+        overviews.build_overviews(path, resampling='mode', levels=2, tilesize=16)
+
+        pyramid = overviews.Overviews(path)
+        nptest.assert_array_equal(_read_all(pyramid.levels[2]), numpy.arange(12).reshape(3, 4))
+
+    def test_bad_resampling(self, tmp_path):
+        with pytest.raises(ValueError):
+            overviews.build_overviews(_copy(tmp_path), resampling='cubic')
+
+
+class Test_Overviews(object):
+    def setup_method(self):
+        self.template = crapy.RasterTemplate(8, 0, 0)
+
+    def test_existing_ovr(self, tmp_path):
+        path = _copy(tmp_path, ovr=True)
+        pyramid = overviews.Overviews(path)
+        assert len(pyramid) == 2
+        level = pyramid.levels[1]
+        assert (level.cellsize, level.xmin, level.ymax) == \
+            (16, pyramid.levels[0].xmin, pyramid.levels[0].ymax)
+
+    def test_stale_ovr_is_ignored(self, tmp_path):
+        path = _copy(tmp_path, ovr=True)
+        info = os.stat(path)
+        os.utime(path + '.ovr', (info.st_atime, info.st_mtime - 10))
+        assert len(overviews.Overviews(path)) == 1
+
+    @pytest.mark.parametrize(('cellsize', 'expected'), [
+        (4, 8), (8, 8), (15.9, 8), (16, 16), (31, 16), (32, 32), (1000, 64),
+    ])
+    def test_select(self, tmp_path, cellsize, expected):
+        path = _copy(tmp_path)
+        overviews.build_overviews(path, tilesize=64, minsize=100)
+        pyramid = overviews.Overviews(path)
+        assert pyramid.select(cellsize).cellsize == expected
+        assert pyramid.select(template=crapy.RasterTemplate(cellsize, 0, 0)).cellsize == expected
+
+    def test_select_needs_resolution(self, tmp_path):
+        with pytest.raises(ValueError):
+            overviews.Overviews(_copy(tmp_path)).select()
+
+    def test_read(self, tmp_path):
+        path = _copy(tmp_path)
+        overviews.build_overviews(path, tilesize=64, minsize=100)
+        pyramid = overviews.Overviews(path)
+        base = pyramid.levels[0]
+
+        # a coarse grid over the upper-left part of the raster, with
+        # cells centered on those of the full-resolution raster
+        nrows, ncols = 10, 12
+        template = crapy.RasterTemplate(32, base.xmin - 12, base.ymax - 12 - nrows * 32)
+        cells = pyramid.read(template, (nrows, ncols))
+        assert cells.shape == (nrows, ncols)
+        full = _read_all(base)
+        nptest.assert_array_equal(cells, full[0:40:4, 0:48:4][:nrows, :ncols])
+
+    def test_thumbnail_reads_kilobytes(self, tmp_path, monkeypatch):
+        path = _copy(tmp_path)
+        overviews.build_overviews(path, tilesize=64, minsize=100)
+        pyramid = overviews.Overviews(path)
+
+        read = []
+        read_block = tiff.TiffPage.read_block
+
+        def counting(page, index):
+            read.append(page.bytecounts[index])
+            return read_block(page, index)
+
+        monkeypatch.setattr(tiff.TiffPage, 'read_block', counting)
+        cells, template = pyramid.thumbnail(64)
+        assert cells.shape == (55, 64)
+        assert template.meanCellWidth > 64
+        assert 0 < sum(read) < 64 * 64 * 4
+
+    def test_small_thumbnail(self, tmp_path):
+        path = _copy(tmp_path)
+        cells, template = overviews.Overviews(path).thumbnail(1000)
+        assert cells.shape == (484, 562)
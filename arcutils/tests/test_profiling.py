@@ -0,0 +1,90 @@
+import json
+
+from pkg_resources import resource_filename
+
+from arcutils import crapy
+from arcutils import mapping
+from arcutils import profiling
+from arcutils.tests import fakearcpy
+
+
+wetlandpath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_wetlands.shp')
+
+
+@profiling.instrument
+def _outer(n):
+    return [_inner(i) for i in range(n)]
+
+
+@profiling.instrument
+def _inner(i):
+    profiling.record_bytes(10)
+    return i
+
+
+@crapy.check_arcpy
+def _needs_arcpy():
+    return fakearcpy.CheckExtension('spatial')
+
+
+def test_disabled_records_nothing():
+    profiler = profiling.Profiler()
+    assert _outer(3) == [0, 1, 2]
+    assert profiler.stacks == {}
+    assert profiling._session is None
+
+
+def test_session_counts_and_bytes():
+    with profiling.session() as prof:
+        _outer(3)
+        _outer(2)
+
+    assert profiling._session is None
+    outer = 'arcutils.tests.test_profiling._outer'
+    inner = 'arcutils.tests.test_profiling._inner'
+    assert list(prof.stacks.keys()) == [(outer, inner), (outer,)]
+
+    totals = prof.functions()
+    assert totals[outer]['calls'] == 2
+    assert totals[inner]['calls'] == 5
+    assert totals[inner]['bytes'] == 50
+    assert totals[outer]['bytes'] == 50
+    assert totals[outer]['wall'] >= totals[inner]['wall']
+
+
+def test_check_arcpy_and_context_managers():
+    with crapy.ArcpyBackend(fakearcpy), profiling.session() as prof:
+        with crapy.Extension('spatial'):
+            _needs_arcpy()
+
+    assert set(prof.stacks.keys()) == set([
+        ('arcutils.crapy.Extension',),
+        ('arcutils.crapy.Extension', 'arcutils.crapy.ExtensionPool.acquire'),
+        ('arcutils.crapy.Extension', 'arcutils.tests.test_profiling._needs_arcpy'),
+    ])
+
+
+def test_load_data_bytes():
+    with profiling.session() as prof:
+        mapping.load_data(wetlandpath, 'shape', asarrays=True)
+
+    totals = prof.functions()
+    assert totals['arcutils.mapping.load_data']['calls'] == 1
+    assert totals['arcutils.mapping.load_data']['bytes'] > 0
+
+
+def test_exports(tmpdir):
+    with profiling.session() as prof:
+        _outer(4)
+
+    jsonpath = str(tmpdir / 'profile.json')
+    prof.to_json(jsonpath)
+    with open(jsonpath) as f:
+        data = json.load(f)
+    assert data['functions']['arcutils.tests.test_profiling._inner']['calls'] == 4
+    assert len(data['stacks']) == 2
+
+    lines = prof.collapsed().splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith('arcutils.tests.test_profiling._outer;arcutils.tests.test_profiling._inner ')
+    assert all(int(line.rsplit(' ', 1)[1]) >= 0 for line in lines)
@@ -0,0 +1,264 @@
+import gc
+import sys
+import tracemalloc
+import multiprocessing
+from pkg_resources import resource_filename
+
+import numpy
+
+import pytest
+
+from arcutils import crapy
+from arcutils import raster
+from arcutils import tiff
+from arcutils.tests import helpers
+
+
+dempath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_dem.tif')
+
+
+def _read_all(path):
+    page = tiff.TiffFile(path).pages[0]
+    brows, bcols = page.blockshape
+    out = numpy.empty((page.blocks_down * brows, page.blocks_across * bcols), page.dtype)
+    for index in range(len(page.offsets)):
+        row, col = divmod(index, page.blocks_across)
+        out[row * brows:(row + 1) * brows, col * bcols:(col + 1) * bcols] = page.read_block(index)
+    return page, out[:page.shape[0], :page.shape[1]]
+
+
+@helpers.seed
+def _grid(nrows, ncols, dtype='float32'):
+    return (numpy.random.normal(size=(nrows, ncols)) * 100).astype(dtype)
+
+
+def test_iter_windows():
+    windows = list(raster.iter_windows((5, 7), 3))
+    assert windows == [
+        raster.Window(0, 0, 3, 3), raster.Window(0, 3, 3, 3), raster.Window(0, 6, 3, 1),
+        raster.Window(3, 0, 2, 3), raster.Window(3, 3, 2, 3), raster.Window(3, 6, 2, 1),
+    ]
+
+
+class Test_write_raster(object):
+    def setup_method(self):
+        self.template = crapy.RasterTemplate(8, 286300., 830000.)
+        self.grid = _grid(100, 70)
+
+    @pytest.mark.parametrize('compress', [True, False])
+    @pytest.mark.parametrize('bigtiff', [True, False])
+    def test_array(self, tmp_path, compress, bigtiff):
+        path = str(tmp_path / 'out.tif')
+        raster.write_raster(path, self.template, self.grid, tilesize=32,
+                            compress=compress, bigtiff=bigtiff)
+        page, result = _read_all(path)
+        assert page.blockshape == (32, 32)
+        numpy.testing.assert_array_equal(result, self.grid)
+
+    def test_georeferencing(self, tmp_path):
+        path = str(tmp_path / 'out.tif')
+        raster.write_raster(path, self.template, self.grid, tilesize=32, nodata=-9999)
+        page = tiff.TiffFile(path).pages[0]
+        assert page.tags[tiff.MODEL_PIXEL_SCALE] == (8.0, 8.0, 0.0)
+        # the tiepoint is the upper-left corner
+        assert page.tags[tiff.MODEL_TIEPOINT] == (0, 0, 0, 286300., 830000. + 100 * 8, 0)
+        assert page.nodata == -9999
+
+    def test_npy(self, tmp_path):
+        npy = str(tmp_path / 'grid.npy')
+        numpy.save(npy, self.grid.astype('int16'))
+        path = str(tmp_path / 'out.tif')
+        raster.write_raster(path, self.template, npy, tilesize=16)
+        page, result = _read_all(path)
+        assert page.dtype == numpy.dtype('<i2')
+        numpy.testing.assert_array_equal(result, self.grid.astype('int16'))
+
+    def test_blocks(self, tmp_path):
+        path = str(tmp_path / 'out.tif')
+        blocks = (
+            (window, self.grid[window.row:window.row + window.nrows,
+                               window.col:window.col + window.ncols])
+            for window in reversed(list(raster.iter_windows(self.grid.shape, 64)))
+        )
+        raster.write_raster(path, self.template, blocks, shape=self.grid.shape,
+                            dtype='float32', tilesize=32)
+        page, result = _read_all(path)
+        numpy.testing.assert_array_equal(result, self.grid)
+
+    def test_missing_blocks_are_nodata(self, tmp_path):
+        path = str(tmp_path / 'out.tif')
+        blocks = [(raster.Window(0, 0, 32, 32), self.grid[:32, :32])]
+        raster.write_raster(path, self.template, blocks, shape=self.grid.shape,
+                            dtype='float32', tilesize=32, nodata=-1)
+        page, result = _read_all(path)
+        numpy.testing.assert_array_equal(result[:32, :32], self.grid[:32, :32])
+        assert (result[32:] == -1).all()
+
+    def test_misaligned_blocks(self, tmp_path):
+        blocks = [(raster.Window(10, 0, 32, 32), self.grid[10:42, :32])]
+        with pytest.raises(ValueError):
+            raster.write_raster(str(tmp_path / 'out.tif'), self.template, blocks,
+                                shape=self.grid.shape, dtype='float32', tilesize=32)
+
+    def test_blocks_need_shape(self, tmp_path):
+        with pytest.raises(ValueError):
+            raster.write_raster(str(tmp_path / 'out.tif'), self.template, [])
+
+
+class Test_RasterFile(object):
+    def setup_method(self):
+        self.raster = raster.RasterFile(dempath)
+
+    def test_attributes(self):
+        assert self.raster.shape == (484, 562)
+        assert self.raster.blockshape == (128, 128)
+        assert self.raster.dtype == numpy.float32
+        assert self.raster.cellsize == 8
+        numpy.testing.assert_allclose(self.raster.xmin, 286296.927837)
+        numpy.testing.assert_allclose(self.raster.ymax, 834731.151268)
+
+    def test_template(self):
+        template = self.raster.template
+        assert template.meanCellWidth == 8
+        numpy.testing.assert_allclose(template.extent.lowerLeft.X, 286296.927837)
+        numpy.testing.assert_allclose(template.extent.lowerLeft.Y, 830859.151268)
+
+    def test_read_matches_known_statistics(self):
+        # values from test_dem.tif.aux.xml
+        cells = self.raster.read(raster.Window(0, 0, 484, 562))
+        valid = cells[cells != numpy.float32(self.raster.nodata)]
+        numpy.testing.assert_allclose(valid.min(), -1.5853353738785, rtol=1e-6)
+        numpy.testing.assert_allclose(valid.max(), 81.021408081055, rtol=1e-6)
+        numpy.testing.assert_allclose(valid.mean(), 15.634284626314, rtol=1e-5)
+
+    def test_read_outside(self):
+        cells = self.raster.read(raster.Window(-2, 560, 4, 4), fill=-1)
+        full = self.raster.read(raster.Window(0, 0, 484, 562))
+        assert (cells[:2] == -1).all()
+        assert (cells[:, 2:] == -1).all()
+        numpy.testing.assert_array_equal(cells[2:, :2], full[:2, 560:])
+
+
+@pytest.mark.parametrize('decoder', [tiff._pillow_lzw_decode, tiff._imagecodecs_lzw_decode])
+def test_lzw_decoders(monkeypatch, decoder):
+    module = pytest.importorskip('imagecodecs' if decoder is tiff._imagecodecs_lzw_decode else 'PIL.Image')
+    page = tiff.TiffFile(dempath).pages[0]
+    assert page.compression == tiff.LZW
+    expected = [page.read_block(i) for i in range(len(page.offsets))]
+
+    monkeypatch.setattr(tiff, '_lzw', decoder)
+    monkeypatch.setattr(tiff, '_lzw_module', module)
+    for index, block in enumerate(expected):
+        numpy.testing.assert_array_equal(page.read_block(index), block)
+
+    # truncated data is read as far as it goes
+    raw = bytes(page._tiff._data[page.offsets[0]:page.offsets[0] + page.bytecounts[0] // 2])
+    partial = tiff.decompress_block(raw, tiff.LZW, (128, 512))
+    assert partial == tiff.lzw_decode(raw)[:len(partial)]
+
+
+def test_floating_point_predictor():
+    page = tiff.TiffFile(dempath).pages[0]
+    page.predictor = 3
+    with pytest.raises(ValueError) as error:
+        page.read_block(0)
+    assert 'floating point predictor' in str(error.value)
+
+
+@pytest.mark.parametrize(('blocksize', 'halo'), [
+    (None, 0), (100, 0), (100, 2), ((50, 300), 1),
+])
+def test_iter_blocks(blocksize, halo):
+    source = raster.RasterFile(dempath)
+    full = source.read(raster.Window(0, 0, 484, 562))
+    padded = numpy.pad(full, halo, mode='constant', constant_values=source.nodata)
+
+    seen = numpy.zeros(full.shape, dtype=int)
+    for window, cells in raster.iter_blocks(dempath, blocksize, halo=halo):
+        assert window.halo == halo
+        assert cells.shape == (window.nrows + 2 * halo, window.ncols + 2 * halo)
+        numpy.testing.assert_array_equal(
+            cells,
+            padded[window.row:window.row + window.nrows + 2 * halo,
+                   window.col:window.col + window.ncols + 2 * halo]
+        )
+        expected_x = source.xmin + (window.col - halo) * 8
+        expected_y = source.ymax - (window.row + window.nrows + halo) * 8
+        numpy.testing.assert_allclose(window.template.extent.lowerLeft.X, expected_x)
+        numpy.testing.assert_allclose(window.template.extent.lowerLeft.Y, expected_y)
+        seen[window.row:window.row + window.nrows, window.col:window.col + window.ncols] += 1
+
+    assert (seen == 1).all()
+
+
+def _slope(cells):
+    dy, dx = numpy.gradient(cells.astype('float64'), 8)
+    return numpy.degrees(numpy.arctan(numpy.hypot(dx, dy)))
+
+
+def _core_mean(cells):
+    return (cells[:-2, 1:-1] + cells[2:, 1:-1] + cells[1:-1, :-2] + cells[1:-1, 2:]) / 4.
+
+
+def _bad_shape(cells):
+    return cells[:3, :3]
+
+
+class Test_map_blocks(object):
+    def setup_method(self):
+        self.grid = _grid(300, 250)
+        self.template = crapy.RasterTemplate(8, 1000., 2000.)
+
+    def _write(self, tmp_path):
+        path = str(tmp_path / 'grid.tif')
+        return raster.write_raster(path, self.template, self.grid, tilesize=64)
+
+    @pytest.mark.parametrize('func', [_slope, _core_mean])
+    def test_parallel_matches_serial(self, tmp_path, func):
+        path = self._write(tmp_path)
+        serial, template = raster.map_blocks(func, path, tile=70, halo=1, workers=1,
+                                             fill=0, dtype='float64')
+        parallel, _ = raster.map_blocks(func, path, tile=70, halo=1, workers=2,
+                                        fill=0, dtype='float64')
+        assert serial.shape == self.grid.shape
+        numpy.testing.assert_array_equal(parallel, serial)
+
+        whole = func(numpy.pad(self.grid, 1, mode='constant'))
+        if whole.shape != self.grid.shape:
+            whole = whole[1:-1, 1:-1]
+        numpy.testing.assert_array_equal(serial, whole)
+
+        assert template.extent.lowerLeft.X == 1000.
+        assert template.extent.lowerLeft.Y == 2000.
+
+    def test_shared_output_is_not_copied(self, tmp_path):
+        path = str(tmp_path / 'big.tif')
+        raster.write_raster(path, self.template, _grid(1000, 800), tilesize=64)
+        expected, _ = raster.map_blocks(_slope, path, tile=128, halo=1, workers=1, fill=0)
+
+        tracemalloc.start()
+        try:
+            result, _ = raster.map_blocks(_slope, path, tile=128, halo=1, workers=2, fill=0)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert not result.flags.owndata
+        assert peak < result.nbytes
+
+        # still valid once the shared memory has no other users
+        gc.collect()
+        numpy.testing.assert_array_equal(result[::-1][::-1], expected)
+
+    def test_bad_result_shape(self, tmp_path):
+        path = self._write(tmp_path)
+        with pytest.raises(ValueError):
+            raster.map_blocks(_bad_shape, path, tile=64, workers=2)
+
+    def test_without_shared_memory(self, tmp_path, monkeypatch):
+        monkeypatch.delattr(multiprocessing, 'shared_memory', raising=False)
+        monkeypatch.setitem(sys.modules, 'multiprocessing.shared_memory', None)
+
+        path = self._write(tmp_path)
+        # runs in this process, so an unpicklable function is fine
+        result, _ = raster.map_blocks(lambda cells: cells * 2, path, tile=64, workers=2)
+        numpy.testing.assert_array_equal(result, self.grid * 2)
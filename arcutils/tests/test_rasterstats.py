@@ -0,0 +1,233 @@
+import os
+import shutil
+from pkg_resources import resource_filename
+
+import numpy
+
+import pytest
+import numpy.testing as nptest
+
+from arcutils import crapy
+from arcutils import raster
+from arcutils import rasterstats
+from arcutils.tests import helpers
+
+
+dempath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_dem.tif')
+
+
+@helpers.seed
+def _values(size):
+    return numpy.random.normal(loc=1e6, scale=3, size=size)
+
+
+class Test_RunningStats(object):
+    def test_update(self):
+        values = _values(1000)
+        stats = rasterstats.RunningStats()
+        for chunk in numpy.array_split(values, 7):
+            stats.update(chunk)
+        assert stats.count == 1000
+        nptest.assert_allclose(stats.mean, values.mean(), rtol=1e-14)
+        nptest.assert_allclose(stats.std, values.std(ddof=1), rtol=1e-10)
+        assert (stats.minimum, stats.maximum) == (values.min(), values.max())
+
+    def test_merge_is_order_independent(self):
+        values = _values(1000)
+        parts = []
+        for chunk in numpy.array_split(values, 5):
+            part = rasterstats.RunningStats(bins=10, hist_range=(999990, 1000010))
+            part.update(chunk)
+            parts.append(part)
+
+        forward = rasterstats.RunningStats(bins=10, hist_range=(999990, 1000010))
+        for part in parts:
+            forward.merge(part)
+        backward = parts[-1]
+        for part in reversed(parts[:-1]):
+            backward.merge(part)
+
+        nptest.assert_allclose(forward.mean, backward.mean, rtol=1e-14)
+        nptest.assert_allclose(forward.variance, values.var(ddof=1), rtol=1e-10)
+        nptest.assert_array_equal(forward.histogram, backward.histogram)
+        assert forward.histogram.sum() == 1000
+
+    def test_histogram_includes_out_of_range(self):
+        stats = rasterstats.RunningStats(bins=4, hist_range=(0, 4))
+        stats.update([-10, 0, 1.5, 3.99, 4, 100])
+        nptest.assert_array_equal(stats.histogram, [2, 1, 0, 3])
+
+    def test_different_histograms(self):
+        with pytest.raises(ValueError):
+            rasterstats.RunningStats(4, (0, 1)).merge(rasterstats.RunningStats(4, (0, 2)))
+
+    @pytest.mark.parametrize('dtype', ['int16', 'float64'])
+    def test_histogram_without_range(self, dtype):
+        values = (_values(5000) - 1e6).astype(dtype)
+        expected = numpy.histogram(values, bins=20, range=(values.min(), values.max()))[0]
+
+        results = []
+        for parts in (1, 3, 17):
+            chunks = [rasterstats.RunningStats(bins=20) for _ in range(parts)]
+            for part, chunk in zip(chunks, numpy.array_split(values, parts)):
+                part.update(chunk)
+            total = chunks[0]
+            for part in chunks[:0:-1]:
+                total.merge(part)
+            results.append(total.result())
+
+        for result in results:
+            assert result.hist_range == (values.min(), values.max())
+            nptest.assert_array_equal(result.histogram, results[0].histogram)
+        assert results[0].histogram.sum() == values.size
+        if dtype == 'int16':
+            nptest.assert_array_equal(results[0].histogram, expected)
+        else:
+            # only values right at the edge of a bucket may move over
+            assert numpy.abs(results[0].histogram - expected).sum() <= values.size / 100
+
+    def test_empty(self):
+        result = rasterstats.RunningStats().result()
+        assert result.count == 0
+        assert numpy.isnan(result.mean)
+
+
+class Test_raster_statistics(object):
+    def setup_method(self):
+        self.known, _ = rasterstats.read_statistics(dempath)
+
+    def _copy(self, tmp_path):
+        path = str(tmp_path / 'dem.tif')
+        shutil.copy(dempath, path)
+        return path
+
+    def test_matches_known_statistics(self):
+        stats = rasterstats.raster_statistics(dempath, cache=False)
+        assert stats.count == self.known.histogram.sum()
+        nptest.assert_allclose(stats.minimum, self.known.minimum, rtol=1e-12)
+        nptest.assert_allclose(stats.maximum, self.known.maximum, rtol=1e-12)
+        nptest.assert_allclose(stats.mean, self.known.mean, rtol=1e-12)
+        nptest.assert_allclose(stats.std, self.known.std, rtol=1e-12)
+        assert stats.hist_range == (stats.minimum, stats.maximum)
+        assert stats.histogram.sum() == stats.count
+
+    def test_esri_histogram(self):
+        # ArcGIS spreads 256 buckets over (max - min) * 256 / 255, so the
+        # last one only holds the maximum
+        lo, hi = self.known.hist_range
+        stats = rasterstats.raster_statistics(dempath, hist_range=(lo, lo + (hi - lo) * 256 / 255),
+                                              cache=False)
+        nptest.assert_array_equal(stats.histogram, self.known.histogram)
+
+    def test_one_pass(self, monkeypatch):
+        windows = []
+        read = raster.RasterFile.read
+        monkeypatch.setattr(raster.RasterFile, 'read',
+                            lambda self, window: windows.append(window) or read(self, window))
+
+        stats = rasterstats.raster_statistics(dempath, blocksize=100, cache=False)
+        assert len(windows) == len(set(windows)) == len(list(raster.iter_windows((484, 562), 100)))
+
+        cells = raster.RasterFile(dempath).read(raster.Window(0, 0, 484, 562))
+        cells = cells[cells != raster.RasterFile(dempath).nodata]
+        expected = numpy.histogram(cells, bins=256, range=stats.hist_range)[0]
+        assert numpy.abs(stats.histogram - expected).sum() <= stats.count / 100
+
+    @pytest.mark.parametrize('blocksize', [(100, 562), 37])
+    def test_blocksize(self, blocksize):
+        expected = rasterstats.raster_statistics(dempath, cache=False)
+        stats = rasterstats.raster_statistics(dempath, blocksize=blocksize, cache=False)
+        nptest.assert_allclose(stats.mean, expected.mean, rtol=1e-13)
+        nptest.assert_allclose(stats.std, expected.std, rtol=1e-13)
+        nptest.assert_array_equal(stats.histogram, expected.histogram)
+
+    def test_parallel_matches_serial(self):
+        expected = rasterstats.raster_statistics(dempath, cache=False)
+        stats = rasterstats.raster_statistics(dempath, workers=2, cache=False)
+        nptest.assert_allclose(stats.mean, expected.mean, rtol=1e-13)
+        nptest.assert_allclose(stats.std, expected.std, rtol=1e-13)
+        nptest.assert_array_equal(stats.histogram, expected.histogram)
+
+    def test_nodata_and_mask(self, tmp_path):
+        grid = numpy.arange(20, dtype='float32').reshape(4, 5)
+        grid[0, 0] = -9999
+        grid[1, 1] = numpy.nan
+        path = str(tmp_path / 'grid.tif')
+        raster.write_raster(path, crapy.RasterTemplate(1, 0, 0), grid, nodata=-9999)
+
+        stats = rasterstats.raster_statistics(path, bins=None, cache=False)
+        assert stats.count == 18
+        assert stats.minimum == 1
+
+        stats = rasterstats.raster_statistics(path, bins=None, nodata=[-9999, 19], cache=False)
+        assert (stats.count, stats.maximum) == (17, 18)
+
+        mask = numpy.zeros(grid.shape, dtype=bool)
+        mask[3] = True
+        stats = rasterstats.raster_statistics(path, bins=None, mask=mask, cache=False)
+        assert (stats.count, stats.maximum) == (13, 14)
+
+        with pytest.raises(ValueError):
+            rasterstats.raster_statistics(path, mask=mask[:2], cache=False)
+
+    def test_sidecar(self, tmp_path):
+        path = self._copy(tmp_path)
+        shutil.copy(dempath + '.aux.xml', path + '.aux.xml')
+        stats = rasterstats.raster_statistics(path, bins=32)
+
+        cached, meta = rasterstats.read_statistics(path)
+        assert cached.count == stats.count
+        assert (cached.mean, cached.std) == (stats.mean, stats.std)
+        nptest.assert_array_equal(cached.histogram, stats.histogram)
+        assert meta['HISTOGRAM_RANGE'] == 'auto'
+
+        # ArcGIS' own metadata is kept
+        with open(path + '.aux.xml') as f:
+            assert 'PyramidResamplingType' in f.read()
+
+    def test_cache_is_reused_until_the_raster_changes(self, tmp_path, monkeypatch):
+        path = self._copy(tmp_path)
+        expected = rasterstats.raster_statistics(path)
+
+        def fail(*args, **kwargs):
+            raise AssertionError('cells were read')
+
+        with monkeypatch.context() as m:
+            m.setattr(rasterstats, '_stream', fail)
+            cached = rasterstats.raster_statistics(path)
+            assert cached[:5] == expected[:5]
+            assert cached.hist_range == expected.hist_range
+            nptest.assert_array_equal(cached.histogram, expected.histogram)
+            assert rasterstats.raster_statistics(path, bins=None).histogram is None
+            with pytest.raises(AssertionError):
+                rasterstats.raster_statistics(path, bins=10)
+
+        info = os.stat(path)
+        os.utime(path, (info.st_atime, info.st_mtime + 10))
+        with monkeypatch.context() as m:
+            m.setattr(rasterstats, '_stream', fail)
+            with pytest.raises(AssertionError):
+                rasterstats.raster_statistics(path)
+
+    def test_sidecar_is_replaced_whole(self, tmp_path, monkeypatch):
+        path = self._copy(tmp_path)
+        shutil.copy(dempath + '.aux.xml', path + '.aux.xml')
+        with open(path + '.aux.xml', 'rb') as f:
+            before = f.read()
+
+        def fail(*args, **kwargs):
+            raise IOError('disk full')
+
+        monkeypatch.setattr(rasterstats.ElementTree.ElementTree, 'write', fail)
+        with pytest.raises(IOError):
+            rasterstats.raster_statistics(path, bins=32)
+        with open(path + '.aux.xml', 'rb') as f:
+            assert f.read() == before
+        assert sorted(os.listdir(str(tmp_path))) == ['dem.tif', 'dem.tif.aux.xml']
+
+    def test_sidecar_without_indent(self, tmp_path, monkeypatch):
+        path = self._copy(tmp_path)
+        monkeypatch.delattr(rasterstats.ElementTree, 'indent', raising=False)
+        stats = rasterstats.raster_statistics(path, bins=32)
+        cached, _ = rasterstats.read_statistics(path)
+        assert (cached.count, cached.mean) == (stats.count, stats.mean)
@@ -0,0 +1,80 @@
+from pkg_resources import resource_filename
+
+import numpy
+
+import pytest
+
+from arcutils import shapefile
+
+
+polygonpath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_wetlands.shp')
+pointpath = resource_filename('arcutils.tests.data.crapy.get_field_names', 'input.shp')
+
+
+class Test_ShapefileReader(object):
+    def setup_method(self):
+        self.reader = shapefile.ShapefileReader(polygonpath)
+
+    def test_header(self):
+        assert len(self.reader) == 18
+        assert self.reader.shapetype == 5
+        numpy.testing.assert_allclose(
+            self.reader.bbox,
+            (286679.4062535806, 831239.0624489584, 290465.40622681257, 833939.062562731)
+        )
+
+    def test_read_matches_records(self):
+        arrays = self.reader.read()
+        assert arrays.geom_offsets.shape == (19,)
+        for n in range(len(self.reader)):
+            xy, parts = self.reader.record(n)
+            first = arrays.part_offsets[arrays.geom_offsets[n]]
+            last = arrays.part_offsets[arrays.geom_offsets[n + 1]]
+            numpy.testing.assert_array_equal(arrays.x[first:last], xy[:, 0])
+            numpy.testing.assert_array_equal(arrays.y[first:last], xy[:, 1])
+            numpy.testing.assert_array_equal(
+                arrays.part_offsets[arrays.geom_offsets[n]:arrays.geom_offsets[n + 1]],
+                parts + first
+            )
+
+    def test_rings_are_closed(self):
+        arrays = self.reader.read()
+        starts = arrays.part_offsets[:-1]
+        ends = arrays.part_offsets[1:] - 1
+        numpy.testing.assert_array_equal(arrays.x[starts], arrays.x[ends])
+        numpy.testing.assert_array_equal(arrays.y[starts], arrays.y[ends])
+
+    def test_read_subset(self):
+        everything = self.reader.read()
+        subset = self.reader.read([5, 2])
+        numpy.testing.assert_array_equal(subset.ids, [5, 2])
+        first = everything.part_offsets[everything.geom_offsets[5]]
+        last = everything.part_offsets[everything.geom_offsets[6]]
+        numpy.testing.assert_array_equal(
+            subset.x[:subset.part_offsets[subset.geom_offsets[1]]],
+            everything.x[first:last]
+        )
+
+    def test_bboxes(self):
+        arrays = self.reader.read()
+        boxes = self.reader.bboxes()
+        for n, box in enumerate(boxes):
+            first = arrays.part_offsets[arrays.geom_offsets[n]]
+            last = arrays.part_offsets[arrays.geom_offsets[n + 1]]
+            numpy.testing.assert_allclose(box, [
+                arrays.x[first:last].min(), arrays.y[first:last].min(),
+                arrays.x[first:last].max(), arrays.y[first:last].max(),
+            ])
+
+    def test_bad_id(self):
+        with pytest.raises(IndexError):
+            self.reader.read([18])
+
+
+def test_read_shapefile_points():
+    arrays = shapefile.read_shapefile(pointpath)
+    assert arrays.shapetype == 1
+    numpy.testing.assert_array_equal(arrays.geom_offsets, numpy.arange(8))
+    numpy.testing.assert_array_equal(arrays.part_offsets, numpy.arange(8))
+    numpy.testing.assert_allclose(arrays.x[0], -117.6656067)
+    numpy.testing.assert_allclose(arrays.y[0], 33.45284014)
@@ -0,0 +1,132 @@
+import os
+import shutil
+
+from pkg_resources import resource_filename
+
+import numpy
+
+import pytest
+
+from arcutils import shapefile
+from arcutils import spatialindex
+from arcutils.tests import helpers
+
+
+wetlandpath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_wetlands.shp')
+
+
+@helpers.seed
+def _random_boxes(N):
+    xy = numpy.random.uniform(0, 1000, size=(N, 2))
+    wh = numpy.random.uniform(0, 20, size=(N, 2))
+    boxes = numpy.hstack([xy, xy + wh])
+    boxes[::97] = numpy.nan
+    return boxes
+
+
+def _brute_intersects(boxes, bbox):
+    xmin, ymin, xmax, ymax = bbox
+    with numpy.errstate(invalid='ignore'):
+        hit = ((boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin) &
+               (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin))
+    return numpy.flatnonzero(hit)
+
+
+def _brute_distances(boxes, x, y):
+    dx = numpy.maximum(numpy.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+    dy = numpy.maximum(numpy.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+    return numpy.hypot(dx, dy)
+
+
+@pytest.mark.parametrize('N', [0, 1, 15, 16, 17, 5000])
+@pytest.mark.parametrize('capacity', [2, 16])
+def test_intersects_matches_scan(N, capacity):
+    boxes = _random_boxes(N)
+    tree = spatialindex.RTree.build(boxes, capacity=capacity)
+    assert len(tree) == N - len(range(0, N, 97))
+    for bbox in [(0, 0, 1000, 1000), (100, 200, 180, 260), (500, 500, 500, 500), (-5, -5, -1, -1)]:
+        numpy.testing.assert_array_equal(tree.intersects(bbox), _brute_intersects(boxes, bbox))
+
+
+def test_nearest_matches_scan():
+    boxes = _random_boxes(3000)
+    tree = spatialindex.RTree.build(boxes)
+    distances = _brute_distances(boxes, 321.0, 654.0)
+    ids = tree.nearest(321.0, 654.0, k=25)
+    assert ids.shape == (25,)
+    numpy.testing.assert_array_equal(distances[ids], numpy.sort(distances[~numpy.isnan(distances)])[:25])
+
+
+def test_save_and_open(tmpdir):
+    boxes = _random_boxes(1000)
+    tree = spatialindex.RTree.build(boxes, capacity=8)
+    path = str(tmpdir / 'boxes.rtree')
+    tree.save(path)
+
+    mapped = spatialindex.RTree.open(path)
+    assert isinstance(mapped.items, numpy.memmap)
+    assert mapped.capacity == 8
+    numpy.testing.assert_array_equal(mapped.nodes, tree.nodes)
+    bbox = (10, 10, 400, 300)
+    numpy.testing.assert_array_equal(mapped.intersects(bbox), tree.intersects(bbox))
+
+    with open(path, 'r+b') as f:
+        f.write(b'garbage!')
+    with pytest.raises(ValueError):
+        spatialindex.RTree.open(path)
+
+
+def test_from_shapefile_sidecar(tmpdir):
+    for ext in ('.shp', '.shx', '.dbf'):
+        shutil.copy(wetlandpath.replace('.shp', ext), str(tmpdir))
+    path = str(tmpdir / 'test_wetlands.shp')
+    sidecar = spatialindex.sidecar_path(path)
+
+    tree = spatialindex.RTree.from_shapefile(path, capacity=4)
+    assert os.path.exists(sidecar)
+    assert len(tree) == 18
+
+    reader = shapefile.ShapefileReader(path)
+    boxes = reader.bboxes()
+    xmin, ymin, xmax, ymax = reader.bbox
+    window = (xmin, ymin, (xmin + xmax) / 2, (ymin + ymax) / 2)
+    ids = tree.intersects(window)
+    numpy.testing.assert_array_equal(ids, _brute_intersects(boxes, window))
+    assert reader.read(ids).ids.tolist() == ids.tolist()
+
+    # reused while the shapefile is unchanged, rebuilt when it changes
+    mtime = os.path.getmtime(sidecar)
+    spatialindex.RTree.from_shapefile(path)
+    assert os.path.getmtime(sidecar) == mtime
+
+    os.utime(path, (0, 0))
+    tree = spatialindex.RTree.from_shapefile(path, capacity=16)
+    assert tree.capacity == 16
+
+
+def test_save_replaces_whole_file(tmpdir, monkeypatch):
+    path = str(tmpdir / 'boxes.rtree')
+    spatialindex.RTree.build(_random_boxes(100)).save(path)
+    before = open(path, 'rb').read()
+
+    tree = spatialindex.RTree.build(_random_boxes(1000))
+    monkeypatch.setattr(tree, 'nodes', None)
+    with pytest.raises(AttributeError):
+        tree.save(path)
+    assert open(path, 'rb').read() == before
+    assert os.listdir(str(tmpdir)) == ['boxes.rtree']
+
+
+def test_from_shapefile_read_only_directory(tmpdir, monkeypatch):
+    def denied(*args, **kwargs):
+        raise PermissionError(13, 'Permission denied')
+
+    for ext in ('.shp', '.shx', '.dbf'):
+        shutil.copy(wetlandpath.replace('.shp', ext), str(tmpdir))
+    path = str(tmpdir / 'test_wetlands.shp')
+
+    monkeypatch.setattr(spatialindex, 'open', denied, raising=False)
+    tree = spatialindex.RTree.from_shapefile(path)
+    assert len(tree) == 18
+    assert not isinstance(tree.items, numpy.memmap)
+    assert not os.path.exists(spatialindex.sidecar_path(path))
@@ -0,0 +1,323 @@
+import shutil
+import struct
+from unittest import mock
+from collections import namedtuple
+
+from pkg_resources import resource_filename
+
+import numpy
+
+import pytest
+
+from arcutils import crapy
+from arcutils import dbf
+from arcutils import table
+from arcutils.tests import fakearcpy
+
+
+stationpath = resource_filename('arcutils.tests.data.crapy.get_field_names', 'input.dbf')
+wetlandpath = resource_filename('arcutils.tests.data.mapping.load_data', 'test_wetlands.shp')
+
+
+_Field = namedtuple('_Field', ('name', 'type', 'length', 'isNullable'))
+
+
+class _FakeCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def _fake_arcpy(fields, rows):
+    fake = mock.MagicMock()
+    fake.ListFields = lambda layer: fields
+    fake.GetCount_management.return_value.getOutput.return_value = str(len(rows))
+
+    def search(layer, names):
+        index = [[f.name for f in fields].index(n) for n in names]
+        return _FakeCursor([tuple(row[i] for i in index) for row in rows])
+
+    fake.da.SearchCursor = search
+    return fake
+
+
+@pytest.fixture
+def fake_table():
+    fields = [
+        _Field('OBJECTID', 'OID', 4, False),
+        _Field('Shape', 'Geometry', 0, True),
+        _Field('Name', 'String', 8, True),
+        _Field('Depth', 'Double', 8, True),
+        _Field('Count', 'Integer', 4, False),
+    ]
+    rows = [
+        (n + 1, object(), None if n == 3 else 'site{}'.format(n),
+         None if n == 4 else n * 0.5, n * 10)
+        for n in range(11)
+    ]
+    return _fake_arcpy(fields, rows)
+
+
+@pytest.mark.parametrize('chunksize', [1, 3, 7, 100])
+def test_iter_table_dbase_chunks(chunksize):
+    chunks = list(table.iter_table(stationpath, chunksize=chunksize))
+    assert all(c.shape[0] <= chunksize for c in chunks)
+
+    result = numpy.concatenate(chunks)
+    cols = dbf.read_dbf(stationpath)
+    assert result.dtype.names == ('OID', 'Station', 'Latitude', 'Longitude')
+    assert result['OID'].tolist() == list(range(7))
+    assert result['Station'].tolist() == cols['Station'].tolist()
+    numpy.testing.assert_array_equal(result['Latitude'], cols['Latitude'])
+
+
+def test_read_table_dbase_skips_deleted_records(tmp_path):
+    path = str(tmp_path / 'stations.dbf')
+    shutil.copy(stationpath, path)
+    header = dbf.read_header(path)
+    with open(path, 'r+b') as f:
+        f.seek(header.headerlength + 2 * header.recordlength)
+        f.write(b'*')
+
+    result = table.read_table(path, chunksize=3)
+    assert result['OID'].tolist() == [0, 1, 3, 4, 5, 6]
+    assert 'CSBMP1u' not in result['Station'].tolist()
+
+
+def _write_dbf(path, fields, rows):
+    recordlength = 1 + sum(f[2] for f in fields)
+    headerlength = 32 + 32 * len(fields) + 1
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<4BIHH20x', 3, 116, 1, 1, len(rows), headerlength, recordlength))
+        for name, ftype, length, decimals in fields:
+            f.write(struct.pack('<11sc4xBB14x', name, ftype, length, decimals))
+        f.write(b'\r')
+        for row in rows:
+            f.write(b' ' + b''.join(value.ljust(field[2]) for value, field in zip(row, fields)))
+        f.write(b'\x1a')
+    return path
+
+
+@pytest.fixture
+def blanks_dbf(tmp_path):
+    fields = [(b'ID', b'N', 5, 0), (b'Depth', b'N', 10, 3), (b'Name', b'C', 8, 0),
+              (b'Sampled', b'D', 8, 0)]
+    rows = [
+        (b'1', b'0.500', b'site1', b'20160412'),
+        (b'', b'', b'', b''),
+        (b'3', b'1.500', b'site3', b'20160414'),
+    ]
+    return _write_dbf(str(tmp_path / 'samples.dbf'), fields, rows)
+
+
+def test_read_table_dbase_blanks(blanks_dbf):
+    result = table.read_table(blanks_dbf)
+    assert result['ID'].tolist() == [1, 0, 3]
+    assert numpy.isnan(result['Depth'][1])
+    assert result['Name'].tolist() == ['site1', '', 'site3']
+    assert numpy.isnat(result['Sampled'][1])
+
+    nulls = {'ID': -1, 'Depth': -99.0, 'Name': 'none', 'Sampled': numpy.datetime64('1900-01-01')}
+    result = table.read_table(blanks_dbf, null_values=nulls, chunksize=2)
+    assert result['ID'].tolist() == [1, -1, 3]
+    assert result['Depth'].tolist() == [0.5, -99.0, 1.5]
+    assert result['Name'].tolist() == ['site1', 'none', 'site3']
+    assert result['Sampled'][1] == numpy.datetime64('1900-01-01')
+
+
+def test_dates_match_arcpy(blanks_dbf):
+    dtype = table.table_dtype(blanks_dbf)
+    assert dtype['Sampled'] == table.ARCPY_DTYPES['Date']
+    result = table.read_table(blanks_dbf, ['Sampled'])
+    assert result['Sampled'][0] == numpy.datetime64('2016-04-12T00:00:00.000000')
+
+
+def test_read_table_shapefile_fields():
+    result = table.read_table(wetlandpath, ['FID', 'OBJECTID_1', 'IT_VALC'], chunksize=5)
+    assert result.shape == (18,)
+    assert result.dtype['FID'] == numpy.int64
+    assert result.dtype['OBJECTID_1'] == numpy.int64
+    assert result['FID'].tolist() == list(range(18))
+    assert result['OBJECTID_1'][:3].tolist() == [1197, 1249, 1273]
+    assert result['IT_VALC'][:4].tolist() == ['M', 'M', 'M', 'DM']
+
+
+def test_table_dtype_bad_field():
+    with pytest.raises(ValueError):
+        table.table_dtype(stationpath, ['Station', 'JUNK'])
+
+
+def test_arcpy_needed_for_other_tables():
+    with crapy.ArcpyBackend(None):
+        with pytest.raises(RuntimeError):
+            table.read_table('C:/gis/data.gdb/stations')
+
+
+def test_iter_table_arcpy(fake_table):
+    with crapy.ArcpyBackend(fake_table):
+        chunks = list(table.iter_table('stations', chunksize=4))
+
+    assert [c.shape[0] for c in chunks] == [4, 4, 3]
+    result = numpy.concatenate(chunks)
+    assert result.dtype == numpy.dtype([
+        ('OBJECTID', 'int32'), ('Name', 'U8'), ('Depth', 'float64'), ('Count', 'int32'),
+    ])
+    assert result['OBJECTID'].tolist() == list(range(1, 12))
+    assert result['Name'][3] == ''
+    assert numpy.isnan(result['Depth'][4])
+    assert result['Count'].tolist() == [n * 10 for n in range(11)]
+
+
+def test_read_table_arcpy_null_values(fake_table):
+    with crapy.ArcpyBackend(fake_table):
+        result = table.read_table('stations', ['Name', 'Depth'], chunksize=5,
+                                  null_values={'Name': 'none', 'Depth': -999})
+
+    assert result.shape == (11,)
+    assert result['Name'][3] == 'none'
+    assert result['Depth'][4] == -999
+
+
+def test_read_table_arcpy_geometry(fake_table):
+    with crapy.ArcpyBackend(fake_table):
+        with pytest.raises(ValueError):
+            table.read_table('stations', ['Shape'])
+
+
+def test_bulk_writer_batches():
+    target = table.MemoryTarget(['SHAPE@XY', 'Name', 'Depth'])
+    array = numpy.array(
+        [('a', 1.0, 9, None), ('b', 2.0, 8, None), ('c', 3.0, 7, None)],
+        dtype=[('Name', 'U4'), ('Depth', float), ('Junk', int), ('SHAPE@XY', object)]
+    )
+
+    with table.BulkWriter(target, buffersize=4) as writer:
+        writer.write(((0.0, 0.0), 'x', 0.5))
+        writer.write_coords([[1, 2], [3, 4], [5, 6]], ['p', 'q', 'r'], [1.5, 2.5, 3.5])
+        assert target.rows == []
+        writer.write_array(array)
+        writer.write_rows([((9.0, 9.0), 'z', n) for n in range(3)])
+
+    assert target.batches == [4, 4, 2]
+    assert len(target.rows) == 10
+    assert target.rows[:2] == [((0.0, 0.0), 'x', 0.5), ((1.0, 2.0), 'p', 1.5)]
+    assert target.rows[4] == (None, 'a', 1.0)
+
+    stats = writer.stats()
+    assert stats.rows == 10
+    assert stats.flushes == 3
+    assert stats.rate > 0
+
+
+def test_bulk_writer_rolls_back():
+    target = table.MemoryTarget(['Name'])
+    with pytest.raises(ZeroDivisionError):
+        with table.BulkWriter(target, buffersize=2) as writer:
+            writer.write_rows([('a',), ('b',), ('c',)])
+            1 / 0
+
+    assert target.batches == [2]
+    assert target.rows == []
+
+
+def test_bulk_writer_errors():
+    with pytest.raises(ValueError):
+        table.BulkWriter('C:/gis/data.gdb/sites')
+
+    target = table.MemoryTarget(['A', 'B'])
+    writer = table.BulkWriter(target)
+    with pytest.raises(RuntimeError):
+        writer.write_rows([(1, 2)] * 10)
+    with pytest.raises(RuntimeError):
+        writer.write((1, 2))
+
+    with writer:
+        with pytest.raises(ValueError):
+            writer.write_array(numpy.zeros(3, dtype=[('A', int)]))
+        with pytest.raises(ValueError):
+            writer.write_coords([[1, 2, 3, 4]], [1])
+
+    # nothing written outside of the session sneaks into it
+    assert target.rows == []
+
+    with pytest.raises(RuntimeError):
+        writer.write((3, 4))
+
+
+def test_bulk_writer_final_flush_fails():
+    class _Rejects(table.MemoryTarget):
+        def insert(self, rows):
+            if len(rows) < 2:
+                raise IOError('rejected')
+            table.MemoryTarget.insert(self, rows)
+
+    target = _Rejects(['Name'])
+    target.rollback = mock.Mock(wraps=target.rollback)
+    with pytest.raises(IOError):
+        with table.BulkWriter(target, buffersize=2) as writer:
+            writer.write_rows([('a',), ('b',), ('c',)])
+
+    target.rollback.assert_called_once_with()
+    assert target.batches == [2]
+    assert target.rows == []
+    assert writer._buffer == []
+
+
+def test_bulk_writer_arcpy_edit_session():
+    fake = mock.MagicMock()
+    inserted = []
+    fake.da.InsertCursor.return_value.insertRow = inserted.append
+    with crapy.ArcpyBackend(fake):
+        with pytest.raises(KeyError):
+            with table.BulkWriter('sites', ['Name'], buffersize=2, workspace='ws') as writer:
+                writer.write_rows([('a',), ('b',), ('c',)])
+                {}['missing']
+
+    editor = fake.da.Editor.return_value
+    fake.da.Editor.assert_called_once_with('ws')
+    fake.da.InsertCursor.assert_called_once_with('sites', ['Name'])
+    assert inserted == [('a',), ('b',)]
+    editor.abortOperation.assert_called_once_with()
+    editor.stopEditing.assert_called_once_with(False)
+    assert not editor.stopOperation.called
+
+
+@pytest.mark.parametrize(('failing', 'aborted'), [('startOperation', False), ('InsertCursor', True)])
+def test_bulk_writer_arcpy_begin_fails(monkeypatch, failing, aborted):
+    editors = []
+
+    class _Editor(fakearcpy._Editor):
+        def __init__(self, workspace):
+            fakearcpy._Editor.__init__(self, workspace)
+            self.abortOperation = mock.Mock()
+            self.stopEditing = mock.Mock(wraps=self.stopEditing)
+            editors.append(self)
+
+    def fail(*args):
+        raise RuntimeError('cannot acquire a schema lock')
+
+    monkeypatch.setattr(fakearcpy.da, 'Editor', _Editor)
+    if failing == 'InsertCursor':
+        monkeypatch.setattr(fakearcpy.da, 'InsertCursor', fail)
+    else:
+        monkeypatch.setattr(_Editor, 'startOperation', fail)
+
+    with crapy.ArcpyBackend(fakearcpy):
+        fakearcpy.reset()
+        fakearcpy.create_table('sites', [('a',)], ['Name'])
+        with pytest.raises(RuntimeError):
+            with table.BulkWriter('sites', ['Name'], workspace='ws') as writer:
+                writer.write(('b',))
+
+    editor, = editors
+    assert editor.abortOperation.called == aborted
+    editor.stopEditing.assert_called_once_with(False)
+    assert not editor.isEditing
@@ -0,0 +1,199 @@
+from unittest import mock
+
+import numpy
+
+import pytest
+
+from arcutils import crapy
+from arcutils import tetris
+from arcutils.tests import helpers
+
+
+class _FakeCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def insertRow(self, row):
+        self.rows.append(row)
+
+
+def _fake_arcpy(srcrows, output):
+    fake = mock.MagicMock()
+    fake.Point = lambda x, y: (x, y)
+    fake.Array = list
+    fake.Polygon = tuple
+    fake.da.SearchCursor = lambda layer, fields: _FakeCursor(srcrows)
+    fake.da.InsertCursor = lambda layer, fields: _FakeCursor(output)
+    return fake
+
+
+@helpers.seed
+def _source_rows(N):
+    xy = numpy.random.uniform(-1e6, 1e6, size=(N, 2))
+    data = numpy.random.normal(size=(N, 4))
+    return [
+        ('loc{}'.format(n), x, y) + tuple(d)
+        for n, ((x, y), d) in enumerate(zip(xy.tolist(), data.tolist()))
+    ]
+
+
+def test_box_corners():
+    corners = tetris.box_corners([10.], [20.], 2., 3)
+    expected = numpy.array([[
+        [[9, 19], [11, 19], [11, 17], [9, 17]],
+        [[9, 17], [11, 17], [11, 15], [9, 15]],
+        [[9, 15], [11, 15], [11, 13], [9, 13]],
+    ]], dtype=float)
+    assert corners.shape == (1, 3, 4, 2)
+    numpy.testing.assert_array_equal(corners, expected)
+
+
+@pytest.mark.parametrize('batchsize', [1, 7, 10000])
+def test_tetris_plot_vectorized_matches_loop(batchsize):
+    srcrows = _source_rows(25)
+    srcfields = ['loc', 'x', 'y', 'A', 'B', 'C', 'D']
+    datafields = ['A', 'B', 'C', 'D']
+
+    looped, vectorized = [], []
+    with crapy.ArcpyBackend(_fake_arcpy(srcrows, looped)):
+        tetris.tetris_plot('src', 1.5, srcfields, datafields, dstlayer='dst')
+
+    with crapy.ArcpyBackend(_fake_arcpy(srcrows, vectorized)):
+        tetris.tetris_plot('src', 1.5, srcfields, datafields, dstlayer='dst',
+                           vectorized=True, batchsize=batchsize)
+
+    assert len(looped) == 25 * 4
+    assert vectorized == looped
+
+
+def test_tetris_preview():
+    from matplotlib import pyplot
+    from matplotlib.collections import PolyCollection
+
+    srcrows = _source_rows(50)
+    array = numpy.array(srcrows, dtype=[('loc', 'U8'), ('x', float), ('y', float),
+                                        ('A', float), ('B', float), ('C', float), ('D', float)])
+    srcfields = ['loc', 'x', 'y', 'A', 'B', 'C', 'D']
+
+    fig, ax = pyplot.subplots()
+    result = tetris.tetris_preview(array, 1.5, srcfields, ['A', 'B', 'C', 'D'], ax=ax)
+    assert result is fig
+
+    collections = [c for c in ax.collections if isinstance(c, PolyCollection)]
+    assert len(collections) == 1
+    boxes = collections[0]
+    expected = tetris.box_corners(array['x'], array['y'], 1.5, 4).reshape(-1, 4, 2)
+    numpy.testing.assert_array_equal(boxes.get_paths()[5].vertices[:4], expected[5])
+    numpy.testing.assert_array_equal(boxes.get_array(), numpy.ravel([row[3:] for row in srcrows]))
+    assert len(fig.axes) == 2
+    pyplot.close(fig)
+
+
+def test_tetris_preview_from_shapefile():
+    from pkg_resources import resource_filename
+    from matplotlib import pyplot
+
+    path = resource_filename('arcutils.tests.data.crapy.get_field_names', 'input.shp')
+    fig, ax = pyplot.subplots()
+    tetris.tetris_preview(path, 0.01, ['Station', 'Longitude', 'Latitude', 'Latitude'],
+                          ['Latitude'], ax=ax, colorbar=False)
+    assert len(ax.collections[0].get_paths()) == 7
+    assert len(fig.axes) == 1
+    pyplot.close(fig)
+
+
+class Test_tetris_plot_incremental(object):
+    def setup_method(self):
+        self.srcfields = ['loc', 'x', 'y', 'A', 'B', 'C', 'D']
+        self.datafields = ['A', 'B', 'C', 'D']
+        self.dstfields = ['SHAPE@', 'loc', 'result', 'interval', 'srchash']
+        self.types = ['Geometry', 'String', 'Double', 'String', 'String']
+
+    def _plot(self, fake, srcrows, dst):
+        fake.create_table('src', srcrows, self.srcfields)
+        if dst not in fake._tables:
+            fake.create_table(dst, [], self.dstfields, types=self.types)
+        return tetris.tetris_plot('src', 1.5, self.srcfields, self.datafields,
+                                  dstlayer=dst, incremental=True)
+
+    @staticmethod
+    def _features(fake, dst):
+        return sorted(
+            (tuple(map(tuple, shape.coords.tolist())), loc, value, field, digest)
+            for shape, loc, value, field, digest in fake.get_table(dst).rows
+        )
+
+    def test_matches_full_rebuild(self):
+        from arcutils.tests import fakearcpy
+
+        srcrows = _source_rows(50)
+        with crapy.ArcpyBackend(fakearcpy):
+            fakearcpy.reset()
+            changes = self._plot(fakearcpy, srcrows, 'dst')
+            assert changes == tetris.TetrisChanges(200, 0, 0, 0)
+
+            # the same boxes as the other modes
+            looped = []
+            with crapy.ArcpyBackend(_fake_arcpy(srcrows, looped)):
+                tetris.tetris_plot('src', 1.5, self.srcfields, self.datafields, dstlayer='x')
+            assert sorted((tuple(shape), loc, value, field) for shape, loc, value, field in looped) == \
+                [feature[:4] for feature in self._features(fakearcpy, 'dst')]
+
+            assert self._plot(fakearcpy, srcrows, 'dst') == tetris.TetrisChanges(0, 0, 0, 200)
+
+            # a new value, a moved station, a removed and an added one
+            changed = list(srcrows)
+            changed[3] = changed[3][:4] + (99.0,) + changed[3][5:]
+            changed[7] = (changed[7][0], changed[7][1] + 10) + changed[7][2:]
+            del changed[11]
+            changed.append(('new', 5.0, 5.0, 1.0, 2.0, 3.0, 4.0))
+
+            changes = self._plot(fakearcpy, changed, 'dst')
+            assert changes == tetris.TetrisChanges(4, 8, 4, 188)
+
+            self._plot(fakearcpy, changed, 'rebuilt')
+            assert self._features(fakearcpy, 'dst') == self._features(fakearcpy, 'rebuilt')
+
+    def test_repairs_missing_and_duplicate_boxes(self):
+        from arcutils.tests import fakearcpy
+
+        srcrows = _source_rows(5)
+        with crapy.ArcpyBackend(fakearcpy):
+            fakearcpy.reset()
+            self._plot(fakearcpy, srcrows, 'dst')
+            rows = fakearcpy.get_table('dst').rows
+            rows.append(rows[0])
+            del rows[5]
+
+            assert self._plot(fakearcpy, srcrows, 'dst') == tetris.TetrisChanges(1, 0, 1, 19)
+            self._plot(fakearcpy, srcrows, 'rebuilt')
+            assert self._features(fakearcpy, 'dst') == self._features(fakearcpy, 'rebuilt')
+
+    def test_new_boxsize_rewrites_everything(self):
+        from arcutils.tests import fakearcpy
+
+        srcrows = _source_rows(5)
+        with crapy.ArcpyBackend(fakearcpy):
+            fakearcpy.reset()
+            self._plot(fakearcpy, srcrows, 'dst')
+            changes = tetris.tetris_plot('src', 3, self.srcfields, self.datafields,
+                                         dstlayer='dst', incremental=True)
+            assert changes == tetris.TetrisChanges(0, 20, 0, 0)
+
+    def test_duplicate_locations(self):
+        from arcutils.tests import fakearcpy
+
+        srcrows = _source_rows(5)
+        with crapy.ArcpyBackend(fakearcpy):
+            fakearcpy.reset()
+            with pytest.raises(ValueError):
+                self._plot(fakearcpy, srcrows + srcrows[:1], 'dst')
@@ -1,48 +1,329 @@
-import arcpy
+import hashlib
+from collections import OrderedDict, namedtuple
 
+import numpy
 
+from arcutils.crapy import check_arcpy, GeometryBatch
+from arcutils import table
+
+# bound to the arcpy backend on the first call of a function decorated
+# with `check_arcpy` (see `crapy.set_backend`)
+arcpy = None
+
+
+TetrisChanges = namedtuple('TetrisChanges',
+                           ('inserted', 'updated', 'deleted', 'unchanged'))
+TetrisChanges.__doc__ = """ The number of boxes written, rewritten,
+removed, and left alone by an incremental `tetris_plot`.
+"""
+
+
+def box_corners(x, y, boxsize, nboxes):
+    """ Computes the corners of every box in a tetris plot at once.
+
+    Boxes are stacked downward from each source point, one box per
+    data field. The coordinates are accumulated in the same order as
+    the row-by-row loop in `tetris_plot`, so the results are identical
+    to the last bit.
+
+    Parameters
+    ----------
+    x, y : array-like
+        The coordinates of the source points.
+    boxsize : float
+        The width and height of each box.
+    nboxes : int
+        The number of boxes (data fields) stacked under each point.
+
+    Returns
+    -------
+    corners : numpy.ndarray
+        Array of shape ``(len(x), nboxes, 4, 2)``. The four corners of
+        each box are ordered upper-left, upper-right, lower-right,
+        lower-left.
+
+    """
+
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+
+    startX = x - (boxsize * 0.5)
+    steps = numpy.empty((y.shape[0], nboxes + 1), dtype=float)
+    steps[:, 0] = y - (boxsize * 0.5)
+    steps[:, 1:] = boxsize
+    # sequential subtraction, just like the loop: ((y - b) - b) - b ...
+    tops = numpy.subtract.accumulate(steps, axis=1)
+
+    left = numpy.broadcast_to(startX[:, None], (x.shape[0], nboxes))
+    right = left + boxsize
+    upper = tops[:, :-1]
+    lower = upper - boxsize
+
+    corners = numpy.empty((x.shape[0], nboxes, 4, 2), dtype=float)
+    corners[..., 0, 0] = left
+    corners[..., 0, 1] = upper
+    corners[..., 1, 0] = right
+    corners[..., 1, 1] = upper
+    corners[..., 2, 0] = right
+    corners[..., 2, 1] = lower
+    corners[..., 3, 0] = left
+    corners[..., 3, 1] = lower
+    return corners
+
+
+@check_arcpy
 def tetris_plot(srclayer, boxsize, srcfields, datafields, locfield='loc',
                 resfield='result', intervalfield='interval',
-                dstlayer=None):
+                dstlayer=None, vectorized=False, batchsize=10000,
+                incremental=False, hashfield='srchash'):
+    """ Draws a stack of boxes ("tetris plot") under each source point,
+    one box per data field.
+
+    Parameters
+    ----------
+    srclayer : str or arcpy.mapping.Layer
+        The source points.
+    boxsize : float
+        The width and height of each box.
+    srcfields : list of str
+        The fields to read from ``srclayer``. The first three must be
+        the location ID and the x- and y-coordinates, followed by the
+        data fields in order.
+    datafields : list of str
+        The names of the data fields, written to ``intervalfield``.
+    locfield, resfield, intervalfield : str, optional
+        The fields in ``dstlayer`` that receive the location ID, the
+        data value, and the data field name of each box.
+    dstlayer : str
+        The polygon feature class to which the boxes are written.
+    vectorized : bool (default = False)
+        When True, the source rows are read once into arrays, the
+        corners of every box are computed in a single operation, and
+        the features are written in batches of ``batchsize`` source
+        rows. The output is identical to the row-by-row loop.
+    batchsize : int (default = 10000)
+        Number of source rows per batch when ``vectorized`` is True.
+    incremental : bool (default = False)
+        Bring the boxes already in ``dstlayer`` up to date instead of
+        appending new ones. Each box carries a hash of its source row
+        (location ID, coordinates, and data values, plus ``boxsize``
+        and ``datafields``) in ``hashfield``. Only the boxes of source
+        rows that were changed, added, or removed are rewritten,
+        inserted, or deleted, and the result has the same features as
+        a full rebuild into an empty layer. Location IDs must be
+        unique.
+    hashfield : str (default = 'srchash')
+        Text field (at least 40 characters) of ``dstlayer`` holding the
+        hashes when ``incremental`` is True.
+
+    Returns
+    -------
+    changes : TetrisChanges or None
+        What an incremental run did.
+
+    Examples
+    --------
+    >>> from arcutils import tetris
+    >>> fields = ['station', 'x', 'y', 'TSS', 'Cu', 'Zn']
+    >>> tetris.tetris_plot('stations', 50, fields, fields[3:],
+    ...                    dstlayer='boxes', incremental=True)
+    TetrisChanges(inserted=0, updated=9, deleted=0, unchanged=179991)
+
+    """
+
+    if incremental:
+        return _tetris_plot_incremental(srclayer, boxsize, srcfields,
+                                        datafields, locfield, resfield,
+                                        intervalfield, dstlayer, hashfield)
+
+    if vectorized:
+        return _tetris_plot_vectorized(srclayer, boxsize, srcfields,
+                                       datafields, locfield, resfield,
+                                       intervalfield, dstlayer, batchsize)
 
-    # Create an insert cursor
     cursor_columns = ('SHAPE@', locfield, resfield, intervalfield)
     with arcpy.da.InsertCursor(dstlayer, cursor_columns) as cursor:
-
-        #loop through the Tetris segments
         for row in arcpy.da.SearchCursor(srclayer, srcfields):
-
             startX = row[1] - (boxsize * 0.5)
             startY = row[2] - (boxsize * 0.5)
 
-            #for every box in tetris:
-            for i, field in enumate(datafields):
-
-                nextbox_X = startX
-                nextbox_Y = startY - (boxsize)
-                string_args = {
-                    'field': field,
-                    'i': i,
-                    'nextbox_X': nextbox_X,
-                    'nextbox_Y': nextbox_Y,
-                }
-
-                #build the geometry of Tetris
-                # point 1
+            # one box per data field, each below the last
+            for i, field in enumerate(datafields):
                 points = [
                     arcpy.Point(startX, startY),
-                    arcpy.Point(startX+boxsize, startY),
-                    arcpy.Point(startX+boxsize, startY-boxsize)
-                    arcpy.Point(startX,startY-boxsize)
+                    arcpy.Point(startX + boxsize, startY),
+                    arcpy.Point(startX + boxsize, startY - boxsize),
+                    arcpy.Point(startX, startY - boxsize)
                 ]
+                geom = arcpy.Polygon(arcpy.Array(points))
+                cursor.insertRow((geom, row[0], row[i + 3], field))
+                startY = startY - boxsize
+
+
+def _tetris_plot_vectorized(srclayer, boxsize, srcfields, datafields,
+                            locfield, resfield, intervalfield, dstlayer,
+                            batchsize):
+    # read the source table once
+    with arcpy.da.SearchCursor(srclayer, srcfields) as search:
+        rows = numpy.array(list(search), dtype=object)
+
+    if rows.shape[0] == 0:
+        return
+
+    nfields = len(datafields)
+    corners = box_corners(rows[:, 1], rows[:, 2], boxsize, nfields)
+    boxes = GeometryBatch.from_rings(corners.reshape(-1, 4, 2))
+
+    cursor_columns = ('SHAPE@', locfield, resfield, intervalfield)
+    with arcpy.da.InsertCursor(dstlayer, cursor_columns) as cursor:
+        for start in range(0, rows.shape[0], batchsize):
+            stop = start + batchsize
+            locs = rows[start:stop, 0].tolist()
+            values = rows[start:stop, 3:3 + nfields].tolist()
+            # the polygons are only built as the rows are written
+            polygons = boxes[start * nfields:stop * nfields].to_arcpy()
+            for loc, vals in zip(locs, values):
+                for value, field in zip(vals, datafields):
+                    cursor.insertRow((next(polygons), loc, value, field))
+
+
+def _row_hash(row, boxsize, datafields):
+    key = repr((boxsize, tuple(datafields), tuple(row)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _tetris_plot_incremental(srclayer, boxsize, srcfields, datafields,
+                             locfield, resfield, intervalfield, dstlayer,
+                             hashfield):
+    nfields = len(datafields)
+    with arcpy.da.SearchCursor(srclayer, srcfields) as search:
+        rows = [tuple(row[:3 + nfields]) for row in search]
+
+    # source row (and so the first of its boxes) by location
+    position = {}
+    for n, row in enumerate(rows):
+        if row[0] in position:
+            raise ValueError("location {!r} appears more than once"
+                             .format(row[0]))
+        position[row[0]] = n
+    hashes = [_row_hash(row, boxsize, datafields) for row in rows]
+
+    boxes = None
+    if rows:
+        xy = numpy.array([row[1:3] for row in rows], dtype=float)
+        corners = box_corners(xy[:, 0], xy[:, 1], boxsize, nfields)
+        boxes = GeometryBatch.from_rings(corners.reshape(-1, 4, 2))
+
+    def polygon(n, j):
+        return next(boxes[n * nfields + j].to_arcpy())
+
+    # (location, field) of the boxes that are up to date
+    done = set()
+    column = dict((field, j) for j, field in enumerate(datafields))
+    updated = deleted = unchanged = 0
+    columns = ('SHAPE@', locfield, resfield, intervalfield, hashfield)
+    with arcpy.da.UpdateCursor(dstlayer, columns) as cursor:
+        for _, loc, _, field, oldhash in cursor:
+            n = position.get(loc)
+            j = column.get(field)
+            if n is None or j is None or (loc, field) in done:
+                cursor.deleteRow()
+                deleted += 1
+            elif oldhash == hashes[n]:
+                done.add((loc, field))
+                unchanged += 1
+            else:
+                cursor.updateRow((polygon(n, j), loc, rows[n][3 + j], field,
+                                  hashes[n]))
+                done.add((loc, field))
+                updated += 1
+
+    missing = [
+        (n, j)
+        for n, row in enumerate(rows)
+        for j, field in enumerate(datafields)
+        if (row[0], field) not in done
+    ]
+    if missing:
+        polygons = boxes.take([n * nfields + j for n, j in missing]).to_arcpy()
+        with arcpy.da.InsertCursor(dstlayer, columns) as cursor:
+            for (n, j), shape in zip(missing, polygons):
+                cursor.insertRow((shape, rows[n][0], rows[n][3 + j],
+                                  datafields[j], hashes[n]))
+
+    return TetrisChanges(len(missing), updated, deleted, unchanged)
+
+
+def _source_columns(srclayer, srcfields, nfields):
+    if getattr(srclayer, 'dtype', None) is not None and srclayer.dtype.names:
+        rows = srclayer
+    else:
+        # the same field may be both a coordinate and a value
+        fields = list(OrderedDict.fromkeys(srcfields))
+        rows = table.read_table(srclayer, fields)
+
+    x = numpy.asarray(rows[srcfields[1]], dtype=float)
+    y = numpy.asarray(rows[srcfields[2]], dtype=float)
+    values = numpy.column_stack([
+        numpy.asarray(rows[name], dtype=float)
+        for name in srcfields[3:3 + nfields]
+    ])
+    return x, y, values.reshape(x.shape[0], nfields)
+
+
+def tetris_preview(srclayer, boxsize, srcfields, datafields, ax=None,
+                   cmap=None, norm=None, colorbar=True, **collection_kws):
+    """ Draws the boxes that `tetris_plot` would create with matplotlib,
+    colored by their values.
+
+    Every box goes into a single ``PolyCollection``, so even hundreds
+    of thousands of boxes render in a few seconds (the Agg backend is
+    fine).
+
+    Parameters
+    ----------
+    srclayer : str, arcpy.mapping.Layer, or numpy structured array
+        The source points. Anything other than an array is read with
+        `arcutils.table.read_table` (shapefiles without arcpy).
+    boxsize : float
+        The width and height of each box.
+    srcfields : list of str
+        As in `tetris_plot`: the location ID, the x- and y-coordinates,
+        and then the data fields in order.
+    datafields : list of str
+        The names of the data fields.
+    ax : matplotlib.Axes, optional
+        The Axes on which to draw. If not provided, one will be created.
+    cmap, norm : optional
+        Colormap and normalization of the values.
+    colorbar : bool (default = True)
+        Add a colorbar to the figure.
+
+    Additional keyword arguments are passed to ``PolyCollection``.
+
+    Returns
+    -------
+    fig : matplotlib.Figure
+
+    """
+
+    from matplotlib.collections import PolyCollection
+    from arcutils import validate
+
+    fig, ax = validate.axes_object(ax)
+
+    nfields = len(datafields)
+    x, y, values = _source_columns(srclayer, srcfields, nfields)
+    corners = box_corners(x, y, boxsize, nfields).reshape(-1, 4, 2)
 
-                poinnt_array = arcpy.Array(points)
-                geom = arcpy.Polygon(poinnt_array)
+    collection_kws.setdefault('edgecolors', 'none')
+    boxes = PolyCollection(corners, array=values.ravel(), cmap=cmap, norm=norm,
+                           **collection_kws)
+    ax.add_collection(boxes)
+    ax.autoscale_view()
+    ax.set_aspect('equal')
 
-                 #actually create the feature + attribute data
-                cursor.insertRow((geom, row[0], row[i+3], field))
+    if colorbar:
+        fig.colorbar(boxes, ax=ax)
 
-                #features.append(pol)
-                #increment Tetris Depth
-                startX = nextbox_X
-                startY = nextbox_Y
+    return fig
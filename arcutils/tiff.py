@@ -0,0 +1,485 @@
+"""
+Minimal, pure-python support for tiled (Geo)TIFF files. No arcpy or
+GDAL needed (LZW is decoded faster if imagecodecs or Pillow is
+installed).
+"""
+
+import io
+import struct
+import zlib
+
+import numpy
+
+from arcutils.profiling import record_bytes
+
+
+# TIFF tags used by arcutils
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+SAMPLES_PER_PIXEL = 277
+PLANAR_CONFIG = 284
+STRIP_OFFSETS = 273
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+NEW_SUBFILE_TYPE = 254
+PREDICTOR = 317
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+SAMPLE_FORMAT = 339
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+GEO_KEY_DIRECTORY = 34735
+GDAL_NODATA = 42113
+
+# TIFF field types: code -> (struct format, size in bytes)
+BYTE, ASCII, SHORT, LONG, FLOAT, DOUBLE, LONG8 = 1, 2, 3, 4, 11, 12, 16
+FIELD_TYPES = {
+    BYTE: ('B', 1),
+    ASCII: ('s', 1),
+    SHORT: ('H', 2),
+    LONG: ('I', 4),
+    6: ('b', 1),
+    7: ('B', 1),
+    8: ('h', 2),
+    9: ('i', 4),
+    FLOAT: ('f', 4),
+    DOUBLE: ('d', 8),
+    LONG8: ('Q', 8),
+    17: ('q', 8),
+}
+
+# compression codes
+NONE = 1
+LZW = 5
+DEFLATE = 8
+ADOBE_DEFLATE = 32946
+
+# SampleFormat codes by numpy dtype kind
+SAMPLE_FORMATS = {'u': 1, 'i': 2, 'f': 3}
+SAMPLE_FORMATS_BY_CODE = {1: 'u', 2: 'i', 3: 'f'}
+
+# classic TIFF files can't address more than 4 GiB
+CLASSIC_LIMIT = 2 ** 32 - 1
+
+
+def compress_block(data, compression):
+    """ Compresses the bytes of a tile or strip. """
+    if compression == NONE:
+        return data
+    elif compression in (DEFLATE, ADOBE_DEFLATE):
+        return zlib.compress(data, 6)
+    raise ValueError("Can't write TIFF compression {}".format(compression))
+
+
+class TiffWriter(object):
+    """ Low-level writer of (Big)TIFF files.
+
+    Blocks (tiles or strips) are appended to the file as they come, so
+    only one block needs to be in memory at a time. Image file
+    directories (IFDs) are written after their blocks and chained in
+    the order they are written.
+
+    Parameters
+    ----------
+    path : str
+        The file to create.
+    bigtiff : bool (default = False)
+        Write a BigTIFF (64-bit offsets) instead of a classic TIFF.
+        Needed for files larger than 4 GiB.
+
+    """
+
+    def __init__(self, path, bigtiff=False):
+        self.path = path
+        self.bigtiff = bigtiff
+        self._file = open(path, 'wb')
+        if bigtiff:
+            self._file.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, 0))
+            self._next_pointer = 8
+        else:
+            self._file.write(b'II' + struct.pack('<HI', 42, 0))
+            self._next_pointer = 4
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def flush(self):
+        """ Pushes everything written so far to disk, so that the images
+        already finished can be read while more are being written.
+        """
+        self._file.flush()
+
+    def _tell(self):
+        self._file.seek(0, 2)
+        return self._file.tell()
+
+    def _check_offset(self, offset):
+        if not self.bigtiff and offset > CLASSIC_LIMIT:
+            raise ValueError("File is larger than 4 GiB; use bigtiff=True")
+
+    def write_block(self, data):
+        """ Appends a (compressed) block to the file.
+
+        Returns
+        -------
+        offset, bytecount : int
+            Where the block starts and how long it is.
+
+        """
+
+        offset = self._tell()
+        # keep blocks word-aligned, like libtiff
+        if offset % 2:
+            self._file.write(b'\x00')
+            offset += 1
+        self._file.write(data)
+        self._check_offset(offset + len(data))
+        return offset, len(data)
+
+    def write_ifd(self, entries):
+        """ Writes an image file directory and links it to the previous
+        one (or to the header).
+
+        Parameters
+        ----------
+        entries : list of (tag, type, values)
+            The tags of the directory. ``values`` is a sequence (or a
+            str for ASCII tags).
+
+        Returns
+        -------
+        offset : int
+            Where the IFD starts.
+
+        """
+
+        if self.bigtiff:
+            count_fmt, entry_fmt, pointer_fmt, inline = '<Q', '<HHQ', '<Q', 8
+        else:
+            count_fmt, entry_fmt, pointer_fmt, inline = '<H', '<HHI', '<I', 4
+
+        # values that don't fit in the entry are written before the IFD
+        packed = []
+        for tag, ftype, values in sorted(entries, key=lambda e: e[0]):
+            fmt, size = FIELD_TYPES[ftype]
+            if ftype == ASCII:
+                data = values.encode('ascii') + b'\x00'
+                count = len(data)
+            else:
+                count = len(values)
+                data = struct.pack('<{}{}'.format(count, fmt), *values)
+
+            if len(data) <= inline:
+                value = data.ljust(inline, b'\x00')
+            else:
+                offset, _ = self.write_block(data)
+                value = struct.pack(pointer_fmt, offset)
+            packed.append(struct.pack(entry_fmt, tag, ftype, count) + value)
+
+        ifd = struct.pack(count_fmt, len(packed)) + b''.join(packed)
+        offset, _ = self.write_block(ifd + struct.pack(pointer_fmt, 0))
+
+        # link it up
+        self._file.seek(self._next_pointer)
+        self._file.write(struct.pack(pointer_fmt, offset))
+        self._next_pointer = offset + len(ifd)
+        return offset
+
+
+def lzw_decode(data):
+    """ Decodes TIFF-flavored LZW (MSB-first codes, early change). """
+    data = bytearray(data) + b'\x00\x00\x00'
+    nbits = (len(data) - 3) * 8
+    result = bytearray()
+    table = [bytes(bytearray([i])) for i in range(256)] + [b'', b'']
+    width, mask = 9, 511
+    bitpos = 0
+    prev = None
+    while bitpos + width <= nbits:
+        p = bitpos >> 3
+        chunk = (data[p] << 16) | (data[p + 1] << 8) | data[p + 2]
+        code = (chunk >> (24 - (bitpos & 7) - width)) & mask
+        bitpos += width
+
+        if code == 257:  # end of information
+            break
+        elif code == 256:  # clear the table
+            del table[258:]
+            width, mask = 9, 511
+            prev = None
+            continue
+
+        if prev is None:
+            entry = table[code]
+        elif code < len(table):
+            entry = table[code]
+            table.append(prev + entry[:1])
+        else:
+            entry = prev + prev[:1]
+            table.append(entry)
+
+        result += entry
+        prev = entry
+        if len(table) + 1 >= (1 << width) and width < 12:
+            width += 1
+            mask = (1 << width) - 1
+
+    return bytes(result)
+
+
+def _imagecodecs_lzw_decode(data, shape):
+    return _lzw_module.lzw_decode(data)
+
+
+def _pillow_lzw_decode(data, shape):
+    """ Has Pillow (through libtiff) decode the block as the only strip
+    of an 8-bit TIFF of ``shape`` (nrows, bytes per row).
+    """
+
+    if shape is None:
+        return lzw_decode(data)
+    nrows, rowbytes = shape
+    entries = [
+        (IMAGE_WIDTH, LONG, rowbytes),
+        (IMAGE_LENGTH, LONG, nrows),
+        (BITS_PER_SAMPLE, SHORT, 8),
+        (COMPRESSION, SHORT, LZW),
+        (PHOTOMETRIC, SHORT, 1),
+        (STRIP_OFFSETS, LONG, 8 + 2 + 12 * 9 + 4),
+        (SAMPLES_PER_PIXEL, SHORT, 1),
+        (ROWS_PER_STRIP, LONG, nrows),
+        (STRIP_BYTE_COUNTS, LONG, len(data)),
+    ]
+    tiff = b''.join(
+        [struct.pack('<2sHIH', b'II', 42, 8, len(entries))] +
+        [struct.pack('<HHII', tag, dtype, 1, value) for tag, dtype, value in entries] +
+        [struct.pack('<I', 0), data]
+    )
+    try:
+        return _lzw_module.open(io.BytesIO(tiff)).tobytes()
+    except Exception:
+        # e.g., a truncated block, which lzw_decode reads as far as it can
+        return lzw_decode(data)
+
+
+def _python_lzw_decode(data, shape):
+    return lzw_decode(data)
+
+
+# the LZW decoder in use and the module it comes from, found on first use
+_lzw = None
+_lzw_module = None
+
+
+def _lzw_decoder():
+    global _lzw, _lzw_module
+    if _lzw is None:
+        try:
+            import imagecodecs
+            _lzw_module, _lzw = imagecodecs, _imagecodecs_lzw_decode
+        except ImportError:
+            try:
+                from PIL import Image, features
+                if not features.check('libtiff'):
+                    raise ImportError('Pillow was built without libtiff')
+                _lzw_module, _lzw = Image, _pillow_lzw_decode
+            except ImportError:
+                _lzw = _python_lzw_decode
+    return _lzw
+
+
+def decompress_block(data, compression, shape=None):
+    """ Decompresses the bytes of a tile or strip.
+
+    ``shape`` is the (nrows, bytes per row) of the decompressed block,
+    if known. LZW is decoded with imagecodecs or Pillow if either is
+    installed (Pillow needs ``shape``), and with `lzw_decode`
+    otherwise.
+    """
+    if compression == NONE:
+        return data
+    elif compression == LZW:
+        return _lzw_decoder()(data, shape)
+    elif compression in (DEFLATE, ADOBE_DEFLATE):
+        return zlib.decompress(data)
+    raise ValueError("Can't read TIFF compression {}".format(compression))
+
+
+class TiffPage(object):
+    """ One image (IFD) of a TIFF file.
+
+    Attributes
+    ----------
+    tags : dict
+        Maps tag codes to tuples of values (or a str for ASCII tags).
+    shape : tuple of int
+        The (nrows, ncols) of the image.
+    blockshape : tuple of int
+        The (nrows, ncols) of its tiles or strips.
+    dtype : numpy.dtype
+
+    """
+
+    def __init__(self, tiff, tags):
+        self._tiff = tiff
+        self.tags = tags
+        self.shape = (tags[IMAGE_LENGTH][0], tags[IMAGE_WIDTH][0])
+
+        if SAMPLE_FORMATS_BY_CODE.get(tags.get(SAMPLE_FORMAT, (1,))[0]) is None:
+            raise ValueError('Unsupported sample format')
+        if tags.get(SAMPLES_PER_PIXEL, (1,))[0] != 1:
+            raise ValueError('Only single-band images are supported')
+
+        kind = SAMPLE_FORMATS_BY_CODE[tags.get(SAMPLE_FORMAT, (1,))[0]]
+        bits = tags.get(BITS_PER_SAMPLE, (1,))[0]
+        self.dtype = numpy.dtype('{}{}{}'.format(tiff.byteorder, kind, bits // 8))
+
+        if TILE_WIDTH in tags:
+            self.blockshape = (tags[TILE_LENGTH][0], tags[TILE_WIDTH][0])
+            self.offsets = tags[TILE_OFFSETS]
+            self.bytecounts = tags[TILE_BYTE_COUNTS]
+        else:
+            rows = tags.get(ROWS_PER_STRIP, (self.shape[0],))[0]
+            self.blockshape = (min(rows, self.shape[0]), self.shape[1])
+            self.offsets = tags[STRIP_OFFSETS]
+            self.bytecounts = tags[STRIP_BYTE_COUNTS]
+
+        self.compression = tags.get(COMPRESSION, (NONE,))[0]
+        self.predictor = tags.get(PREDICTOR, (1,))[0]
+
+    @property
+    def blocks_across(self):
+        return -(-self.shape[1] // self.blockshape[1])
+
+    @property
+    def blocks_down(self):
+        return -(-self.shape[0] // self.blockshape[0])
+
+    @property
+    def nodata(self):
+        value = self.tags.get(GDAL_NODATA)
+        if value is None or not value.strip():
+            return None
+        return float(value)
+
+    def read_block(self, index):
+        """ Reads and decodes one tile or strip.
+
+        Parameters
+        ----------
+        index : int
+            The tile/strip number in row-major order.
+
+        Returns
+        -------
+        block : numpy.ndarray
+            Array with the full ``blockshape`` (edge blocks are padded).
+            Blocks that are missing from the file are filled with the
+            NoData value (or zero).
+
+        """
+
+        offset, count = self.offsets[index], self.bytecounts[index]
+        if count == 0:
+            fill = self.nodata if self.nodata is not None else 0
+            return numpy.full(self.blockshape, fill, dtype=self.dtype)
+
+        raw = bytes(self._tiff._data[offset:offset + count])
+        record_bytes(count)
+        if self.predictor == 3:
+            raise ValueError("The floating point predictor (3) isn't supported; "
+                             "rewrite the raster with predictor 1 or 2")
+        elif self.predictor not in (1, 2):
+            raise ValueError('Unsupported TIFF predictor {}'.format(self.predictor))
+
+        nrows = self.blockshape[0]
+        if TILE_WIDTH not in self.tags:  # the last strip is usually short
+            nrows = min(nrows, self.shape[0] - index * nrows)
+        rowbytes = self.blockshape[1] * self.dtype.itemsize
+        raw = decompress_block(raw, self.compression, (nrows, rowbytes))
+        block = numpy.frombuffer(raw, dtype=self.dtype)
+
+        if self.predictor == 2:
+            block = block.reshape(-1, self.blockshape[1])
+            block = numpy.cumsum(block, axis=1, dtype=self.dtype)
+
+        size = self.blockshape[0] * self.blockshape[1]
+        if block.size < size:  # the last strip is usually short
+            block = numpy.concatenate([block.ravel(), numpy.zeros(size - block.size, self.dtype)])
+        return block[:size].reshape(self.blockshape)
+
+
+class TiffFile(object):
+    """ Minimal reader of (Big)TIFF files. The file is memory-mapped and
+    only the blocks that are asked for are read.
+
+    Parameters
+    ----------
+    path : str
+
+    Attributes
+    ----------
+    pages : list of TiffPage
+        The images of the file, in order.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = numpy.memmap(path, dtype=numpy.uint8, mode='r')
+        head = bytes(self._data[:16])
+        self.byteorder = {b'II': '<', b'MM': '>'}[head[:2]]
+        version = struct.unpack(self.byteorder + 'H', head[2:4])[0]
+        self.bigtiff = version == 43
+        if self.bigtiff:
+            offset = struct.unpack(self.byteorder + 'Q', head[8:16])[0]
+        else:
+            offset = struct.unpack(self.byteorder + 'I', head[4:8])[0]
+
+        self.pages = []
+        while offset:
+            tags, offset = self._read_ifd(offset)
+            self.pages.append(TiffPage(self, tags))
+
+    def _read_ifd(self, offset):
+        bo = self.byteorder
+        if self.bigtiff:
+            count_fmt, entry_fmt, pointer_fmt, inline, entry_size = 'Q', 'HHQ', 'Q', 8, 20
+        else:
+            count_fmt, entry_fmt, pointer_fmt, inline, entry_size = 'H', 'HHI', 'I', 4, 12
+
+        count_size = struct.calcsize(count_fmt)
+        count = struct.unpack(bo + count_fmt, bytes(self._data[offset:offset + count_size]))[0]
+        start = offset + count_size
+        raw = bytes(self._data[start:start + count * entry_size + inline])
+
+        tags = {}
+        for i in range(count):
+            entry = raw[i * entry_size:(i + 1) * entry_size]
+            tag, ftype, n = struct.unpack(bo + entry_fmt, entry[:entry_size - inline])
+            if ftype not in FIELD_TYPES:
+                continue
+            fmt, size = FIELD_TYPES[ftype]
+            value = entry[entry_size - inline:]
+            if n * size > inline:
+                where = struct.unpack(bo + pointer_fmt, value)[0]
+                value = bytes(self._data[where:where + n * size])
+            if ftype == ASCII:
+                tags[tag] = value[:n].split(b'\x00')[0].decode('ascii', 'replace')
+            else:
+                tags[tag] = struct.unpack('{}{}{}'.format(bo, n, fmt), value[:n * size])
+
+        nextoffset = struct.unpack(bo + pointer_fmt, raw[count * entry_size:])[0]
+        return tags, nextoffset
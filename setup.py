@@ -15,6 +15,7 @@ PACKAGE_DATA = {
 
 requirements = [
     'Click>=6.0',
+    'futures; python_version < "3"',
     # TODO: put package requirements here
 ]
 